@@ -0,0 +1,99 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core import checks
+from django.core.cache import cache
+from django.db.models import Q
+
+
+ACCESS_PROFILE_CACHE_KEY = 'user-access-profile-{}'
+ACCESS_PROFILE_CACHE_TIMEOUT = 60 * 60
+# Permission codename prefixes of the country/region scoped admins (api and per RegionRestrictedAdmin)
+COUNTRY_ADMIN_PREFIX = 'country_admin_'
+REGION_ADMIN_PREFIX = 'region_admin_'
+PER_COUNTRY_ADMIN_PREFIX = 'per_country_admin_'
+PER_REGION_ADMIN_PREFIX = 'per_region_admin_'
+# Process local backends: a profile cleared by one process would still be served by the others
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# visibility: highest VisibilityChoices tier the user can see (IFRC > MEMBERSHIP > PUBLIC)
+AccessProfile = namedtuple('AccessProfile', (
+    'visibility', 'is_ifrc', 'is_per_core_admin',
+    'country_ids', 'region_ids', 'per_country_ids', 'per_region_ids',
+))
+
+
+def get_access_profile_cache_key(user_id):
+    return ACCESS_PROFILE_CACHE_KEY.format(user_id)
+
+
+def get_permission_ids(codenames, prefix):
+    return frozenset(
+        int(codename[len(prefix):]) for codename in codenames
+        if codename.startswith(prefix) and codename[len(prefix):].isdigit()
+    )
+
+
+def build_access_profile(user):
+    """ Same rules as user.has_perm/get_all_permissions, with all the permissions loaded in one query """
+    from .models import VisibilityChoices
+
+    if not user.is_authenticated:
+        return AccessProfile(VisibilityChoices.PUBLIC, False, False, *[frozenset()] * 4)
+    codenames = set()
+    if user.is_active:
+        codenames = set(
+            Permission.objects.filter(Q(user=user) | Q(group__user=user), content_type__app_label='api')
+            .values_list('codename', flat=True).distinct()
+        )
+    is_superuser = user.is_active and user.is_superuser
+    is_ifrc = is_superuser or 'ifrc_admin' in codenames
+    return AccessProfile(
+        visibility=VisibilityChoices.IFRC if is_ifrc else VisibilityChoices.MEMBERSHIP,
+        is_ifrc=is_ifrc,
+        is_per_core_admin=is_superuser or 'per_core_admin' in codenames,
+        country_ids=get_permission_ids(codenames, COUNTRY_ADMIN_PREFIX),
+        region_ids=get_permission_ids(codenames, REGION_ADMIN_PREFIX),
+        per_country_ids=get_permission_ids(codenames, PER_COUNTRY_ADMIN_PREFIX),
+        per_region_ids=get_permission_ids(codenames, PER_REGION_ADMIN_PREFIX),
+    )
+
+
+def get_access_profile(user):
+    """
+    Access profile of the user, computed once per user and cached
+    (cleared on user, group or permission changes, see the receivers in api.models)
+    """
+    if not user.is_authenticated:
+        return build_access_profile(user)
+    # Also kept on the user instance for the rest of the request
+    profile = getattr(user, '_access_profile', None)
+    if profile is None:
+        cache_key = get_access_profile_cache_key(user.pk)
+        profile = cache.get(cache_key)
+        if profile is None:
+            profile = build_access_profile(user)
+            cache.set(cache_key, profile, ACCESS_PROFILE_CACHE_TIMEOUT)
+        user._access_profile = profile
+    return profile
+
+
+def clear_access_profile_cache(user_ids):
+    cache.delete_many([get_access_profile_cache_key(user_id) for user_id in user_ids])
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """ The access profiles (and auth tokens) are revoked by clearing them, which has to reach every worker """
+    if settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS:
+        return [checks.Warning(
+            'The default cache is local to each process, revoked permissions stay cached in the other workers '
+            'for up to ACCESS_PROFILE_CACHE_TIMEOUT.',
+            hint='Set MEMCACHED_LOCATION (or another shared cache backend in CACHES).',
+            id='api.W001',
+        )]
+    return []
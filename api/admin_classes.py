@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.db.models import Q
+from .access import get_access_profile
 
 # Extend the model admin with methods for determining whether a user has
 # country- and region-specific permissions.
@@ -8,22 +9,11 @@ from django.db.models import Q
 
 class RegionRestrictedAdmin(admin.ModelAdmin):
     def get_request_user_regions(self, request):
-        permissions = request.user.get_all_permissions()
-        regions = []
-        countries = []
-        for permission_name in permissions:
-            if 'api.country_admin_' in permission_name:
-                country_id = permission_name[18:]
-                if country_id.isdigit():
-                    countries.append(country_id)
-            elif 'api.region_admin_' in permission_name:
-                region_id = permission_name[17:]
-                if region_id.isdigit():
-                    regions.append(region_id)
-        return countries, regions
+        profile = get_access_profile(request.user)
+        return profile.country_ids, profile.region_ids
 
     def get_filtered_queryset(self, request, queryset):
-        if request.user.is_superuser or request.user.has_perm('api.ifrc_admin'):
+        if get_access_profile(request.user).is_ifrc:
             return queryset
         countries, regions = self.get_request_user_regions(request)
 
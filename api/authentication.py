@@ -0,0 +1,86 @@
+import hashlib
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+# Same validity as advertised by GetAuthToken (`expires`), the token's created time is reset on each login
+TOKEN_EXPIRY = timedelta(days=7)
+TOKEN_CACHE_KEY = 'auth-token-{}'
+TOKEN_CACHE_TIMEOUT = 60 * 5
+# User fields kept in cache, the other ones are deferred (loaded on access, never overwritten on save)
+TOKEN_USER_CACHE_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser',
+)
+
+
+def get_token_cache_key(key):
+    # Token keys are credentials, keep them out of the cache keys
+    return TOKEN_CACHE_KEY.format(hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+
+def get_token(key):
+    """ Token (with its user) for the given key, served from cache when possible """
+    cache_key = get_token_cache_key(key)
+    data = cache.get(cache_key)
+    if data is None:
+        token = Token.objects.select_related('user').filter(key=key).first()
+        if token is None:
+            return None
+        data = {
+            'created': token.created,
+            'user': {field: getattr(token.user, field) for field in TOKEN_USER_CACHE_FIELDS},
+        }
+        cache.set(cache_key, data, TOKEN_CACHE_TIMEOUT)
+
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in data['user']]
+    user = User.from_db(DEFAULT_DB_ALIAS, field_names, [data['user'][field] for field in field_names])
+    token = Token.from_db(DEFAULT_DB_ALIAS, ['key', 'user_id', 'created'], [key, user.id, data['created']])
+    token.user = user
+    return token
+
+
+def is_token_expired(token):
+    return token.created + TOKEN_EXPIRY < timezone.now()
+
+
+def get_token_user(key):
+    """ User of a valid (existing and not expired) token, else None """
+    token = get_token(key) if key else None
+    if token is None or is_token_expired(token):
+        return None
+    return token.user
+
+
+def clear_token_cache(keys):
+    cache.delete_many([get_token_cache_key(key) for key in keys])
+
+
+def clear_user_token_cache(user_ids):
+    clear_token_cache(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication with the token -> user lookup cached (see get_token) and the token expiry enforced.
+    """
+
+    def authenticate_credentials(self, key):
+        token = get_token(key)
+        if token is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        if is_token_expired(token):
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+        return (token.user, token)
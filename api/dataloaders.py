@@ -0,0 +1,67 @@
+from collections import defaultdict
+
+from django.db.models import F
+from promise import Promise
+from promise.dataloader import DataLoader
+
+
+class ModelLoader(DataLoader):
+    """ Loads model instances by pk, one query per batch """
+
+    def __init__(self, model):
+        self.model = model
+        super().__init__()
+
+    def batch_load_fn(self, keys):
+        objs = self.model.objects.in_bulk(set(keys))
+        return Promise.resolve([objs.get(key) for key in keys])
+
+
+class RelatedListLoader(DataLoader):
+    """ Loads the related instances (reverse FK or M2M) of parent pks, one query per batch """
+
+    def __init__(self, model, lookup):
+        self.model = model
+        self.lookup = lookup
+        super().__init__()
+
+    def batch_load_fn(self, keys):
+        related = defaultdict(list)
+        qs = self.model.objects.filter(**{'{}__in'.format(self.lookup): set(keys)})\
+            .annotate(_loader_key=F(self.lookup))
+        for obj in qs:
+            related[obj._loader_key].append(obj)
+        return Promise.resolve([related.get(key, []) for key in keys])
+
+
+def get_loader(context, loader_class, *args):
+    # Loaders live for one request only, so their cache never serves stale data
+    loaders = getattr(context, '_dataloaders', None)
+    if loaders is None:
+        loaders = context._dataloaders = {}
+    key = (loader_class,) + args
+    if key not in loaders:
+        loaders[key] = loader_class(*args)
+    return loaders[key]
+
+
+def load_related(info, instance, field_name):
+    field = instance._meta.get_field(field_name)
+    if field.concrete and (field.many_to_one or field.one_to_one):
+        key = getattr(instance, field.attname)
+        if key is None:
+            return None
+        return get_loader(info.context, ModelLoader, field.related_model).load(key)
+    if field.concrete:
+        # Forward M2M, queried from the related model through its reverse lookup
+        lookup = field.related_query_name()
+    else:
+        # Reverse FK
+        lookup = field.field.name
+    return get_loader(info.context, RelatedListLoader, field.related_model, lookup).load(instance.pk)
+
+
+def batched_resolver(field_name):
+    def resolver(root, info, **kwargs):
+        return load_related(info, root, field_name)
+    return resolver
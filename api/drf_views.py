@@ -1,7 +1,7 @@
 from rest_framework.status import HTTP_201_CREATED, HTTP_200_OK
 from rest_framework.generics import GenericAPIView, CreateAPIView, UpdateAPIView
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
+from .authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets
 from rest_framework.decorators import action
@@ -173,7 +173,7 @@ class RegionKeyFigureFilter(filters.FilterSet):
         fields = ('region',)
 
 class RegionKeyFigureViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = RegionKeyFigureSerializer
     filter_class = RegionKeyFigureFilter
     visibility_model_class = RegionKeyFigure
@@ -185,7 +185,7 @@ class CountryKeyFigureFilter(filters.FilterSet):
         fields = ('country',)
 
 class CountryKeyFigureViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = CountryKeyFigureSerializer
     filter_class = CountryKeyFigureFilter
     visibility_model_class = CountryKeyFigure
@@ -197,7 +197,7 @@ class RegionSnippetFilter(filters.FilterSet):
         fields = ('region',)
 
 class RegionSnippetViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = RegionSnippetSerializer
     filter_class = RegionSnippetFilter
     visibility_model_class = RegionSnippet
@@ -209,7 +209,7 @@ class CountrySnippetFilter(filters.FilterSet):
         fields = ('country',)
 
 class CountrySnippetViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = CountrySnippetSerializer
     filter_class = CountrySnippetFilter
     visibility_model_class = CountrySnippet
@@ -300,7 +300,7 @@ class EventSnippetFilter(filters.FilterSet):
         fields = ('event',)
 
 class EventSnippetViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = SnippetSerializer
     filter_class = EventSnippetFilter
     visibility_model_class = Snippet
@@ -321,7 +321,7 @@ class SituationReportFilter(filters.FilterSet):
         }
 
 class SituationReportViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = SituationReportSerializer
     ordering_fields = ('created_at', 'name',)
     filter_class = SituationReportFilter
@@ -391,7 +391,7 @@ class AppealDocumentViewset(viewsets.ReadOnlyModelViewSet):
 
 class ProfileViewset(viewsets.ModelViewSet):
     serializer_class = ProfileSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     def get_queryset(self):
         return Profile.objects.filter(user=self.request.user)
@@ -399,7 +399,7 @@ class ProfileViewset(viewsets.ModelViewSet):
 
 class UserViewset(viewsets.ModelViewSet):
     serializer_class = UserSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
@@ -433,7 +433,7 @@ class FieldReportFilter(filters.FilterSet):
 
 
 class FieldReportViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     visibility_model_class = FieldReport
 
     def get_queryset(self, *args, **kwargs):
@@ -460,7 +460,7 @@ class ActionViewset(viewsets.ReadOnlyModelViewSet):
     serializer_class = ActionSerializer
 
 class GenericFieldReportView(GenericAPIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = FieldReport.objects.all()
 
@@ -620,7 +620,7 @@ class GenericFieldReportView(GenericAPIView):
             )
 
 class CreateFieldReport(CreateAPIView, GenericFieldReportView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = FieldReport.objects.all()
     serializer_class = CreateFieldReportSerializer
@@ -690,7 +690,7 @@ class CreateFieldReport(CreateAPIView, GenericFieldReportView):
         return Response({'id': fieldreport.id}, status=HTTP_201_CREATED)
 
 class UpdateFieldReport(UpdateAPIView, GenericFieldReportView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = FieldReport.objects.all()
     serializer_class = CreateFieldReportSerializer
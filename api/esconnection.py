@@ -1,9 +1,114 @@
 import os
-from elasticsearch import Elasticsearch
+import threading
+import time
+from collections import Counter
+
+from elasticsearch import Elasticsearch, Transport
+from elasticsearch.exceptions import ConnectionError, ConnectionTimeout, TransportError
+
+from .logger import logger
+
+
+# Default timeout (seconds) of the calls, and the ones of the search views and of the bulk indexing
+ES_TIMEOUT = float(os.environ.get('ES_TIMEOUT', 10))
+ES_SEARCH_TIMEOUT = float(os.environ.get('ES_SEARCH_TIMEOUT', 3))
+ES_BULK_TIMEOUT = float(os.environ.get('ES_BULK_TIMEOUT', 60))
+ES_POOL_MAXSIZE = int(os.environ.get('ES_POOL_MAXSIZE', 10))
+ES_MAX_RETRIES = int(os.environ.get('ES_MAX_RETRIES', 2))
+ES_RETRY_BACKOFF = float(os.environ.get('ES_RETRY_BACKOFF', 0.2))
+ES_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Consecutive failed calls opening the circuit, and seconds before a call is tried again
+ES_CIRCUIT_THRESHOLD = int(os.environ.get('ES_CIRCUIT_THRESHOLD', 5))
+ES_CIRCUIT_RESET = float(os.environ.get('ES_CIRCUIT_RESET', 30))
+
+
+class CircuitOpenError(ConnectionError):
+    """ Raised without calling Elasticsearch while the circuit is open """
+
+
+class ResilientTransport(Transport):
+    """
+    Transport retrying 429/5xx responses and connection errors with exponential backoff (not timeouts, a call
+    would otherwise block for (max_call_retries + 1) times its request_timeout),
+    failing fast (CircuitOpenError) after ES_CIRCUIT_THRESHOLD failed calls in a row, until ES_CIRCUIT_RESET has passed.
+    `counters` counts the successful, retried, failed and short-circuited calls of this process.
+    """
+
+    def __init__(self, hosts, max_call_retries=ES_MAX_RETRIES, retry_backoff=ES_RETRY_BACKOFF,
+                 circuit_threshold=ES_CIRCUIT_THRESHOLD, circuit_reset=ES_CIRCUIT_RESET, **kwargs):
+        # The retries are done here (with backoff), not by Transport
+        kwargs['max_retries'] = 0
+        super().__init__(hosts, **kwargs)
+        self.max_call_retries = max_call_retries
+        self.retry_backoff = retry_backoff
+        self.circuit_threshold = circuit_threshold
+        self.circuit_reset = circuit_reset
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.counters = Counter(success=0, retry=0, failure=0, circuit_open=0)
+
+    def is_circuit_open(self):
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at >= self.circuit_reset:
+                # Half open: let the next call through, a failure opens the circuit again
+                self.opened_at = None
+                self.consecutive_failures = self.circuit_threshold - 1
+                return False
+            self.counters['circuit_open'] += 1
+            return True
+
+    def record(self, success):
+        with self.lock:
+            if success:
+                self.counters['success'] += 1
+                self.consecutive_failures = 0
+                return
+            self.counters['failure'] += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.circuit_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                logger.error('Elasticsearch circuit opened after %s failed calls' % self.consecutive_failures)
+
+    def perform_request(self, method, url, headers=None, params=None, body=None):
+        if self.is_circuit_open():
+            raise CircuitOpenError('N/A', 'Elasticsearch circuit is open', None)
+        for attempt in range(self.max_call_retries + 1):
+            try:
+                # Transport pops request_timeout and ignore from params, each attempt gets its own copy
+                result = super().perform_request(
+                    method, url, headers=headers, params=dict(params) if params else None, body=body,
+                )
+            except TransportError as e:
+                if not isinstance(e, ConnectionError) and e.status_code not in ES_RETRY_STATUSES:
+                    # The cluster answered (404, 409...), this is not an availability issue
+                    self.record(success=True)
+                    raise
+                if attempt == self.max_call_retries or isinstance(e, ConnectionTimeout):
+                    self.record(success=False)
+                    raise
+                with self.lock:
+                    self.counters['retry'] += 1
+                time.sleep(self.retry_backoff * 2 ** attempt)
+            else:
+                self.record(success=True)
+                return result
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.counters, circuit='open' if self.opened_at is not None else 'closed')
+
 
 host = os.environ.get('ES_HOST')
 if host is not None:
-    ES_CLIENT = Elasticsearch([host])
+    ES_CLIENT = Elasticsearch(
+        [host],
+        transport_class=ResilientTransport,
+        timeout=ES_TIMEOUT,
+        maxsize=ES_POOL_MAXSIZE,
+    )
 else:
     print('Warning: No elasticsearch host found, will not index elasticsearch')
     ES_CLIENT = None
@@ -0,0 +1,229 @@
+import bisect
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as datetime_time
+from itertools import islice
+
+from django.utils import timezone
+
+from .indexes import ES_PAGE_NAME
+
+
+# Search without an Elasticsearch cluster (no ES_HOST): an in-process inverted index of the indexing() documents,
+# analyzed like the page index (GenericMapping / GenericSetting) and kept up to date by the receivers in api.receivers.
+# Changes made by other processes (cron commands, other workers) are picked up by rebuilding it from time to time,
+# by a single thread while the others keep searching the previous index: they can be missing for up to
+# FALLBACK_INDEX_TIMEOUT, which the fallback responses state (`fallback`: built_at and max_staleness in seconds).
+FALLBACK_INDEX_TIMEOUT = 60 * 15
+# Same as the autocomplete_filter of GenericSetting
+NGRAM_MIN, NGRAM_MAX = 3, 10
+KEYWORD_BOOST = 3
+# Sort value of a missing date, sorted first in `date desc` (as Elasticsearch does)
+MISSING_DATE = 2 ** 63 - 1
+
+
+def get_ngrams(text):
+    """ Edge n-grams of the lowercased words, the `autocomplete` analyzer of the page index """
+    ngrams = set()
+    for word in re.findall(r'\w+', (text or '').lower()):
+        for size in range(NGRAM_MIN, min(len(word), NGRAM_MAX) + 1):
+            ngrams.add(word[:size])
+    return ngrams
+
+
+def get_date_sort_value(value):
+    if value is None:
+        return MISSING_DATE
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime_time())
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def get_source(doc):
+    return {
+        key: value.isoformat() if isinstance(value, (date, datetime)) else value
+        for key, value in doc.items()
+    }
+
+
+class PageIndex():
+    """ Inverted index of the page documents (body n-grams and keywords), searched like the page index """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+        self.built_at = None
+        self.built_on = None
+        self.docs = {}
+        self.postings = defaultdict(set)
+        self.keywords = defaultdict(set)
+        self.suggest_inputs = []
+
+    def get_querysets(self):
+        """ Indexed records, with the relations read by their indexing() """
+        from .models import Region, Country, Event, Appeal, FieldReport
+        return (
+            Region.objects.all(),
+            Country.objects.all(),
+            Event.objects.prefetch_related('countries'),
+            Appeal.objects.select_related('country'),
+            FieldReport.objects.prefetch_related('countries'),
+        )
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > FALLBACK_INDEX_TIMEOUT
+
+    def build(self):
+        from .search import get_suggest_inputs, is_suggested
+
+        docs = {}
+        for queryset in self.get_querysets():
+            for record in queryset:
+                docs[record.es_id()] = record.indexing()
+        postings, keywords, suggest_inputs = defaultdict(set), defaultdict(set), []
+        for es_id, doc in docs.items():
+            for ngram in get_ngrams(doc['body']):
+                postings[ngram].add(es_id)
+            if doc['keyword']:
+                keywords[doc['keyword'].lower()].add(es_id)
+            if is_suggested(es_id):
+                suggest_inputs.extend((text.lower(), text, es_id) for text in get_suggest_inputs(doc))
+        suggest_inputs.sort()
+        with self.lock:
+            self.docs, self.postings, self.keywords, self.suggest_inputs = docs, postings, keywords, suggest_inputs
+            self.built_at = time.monotonic()
+            self.built_on = timezone.now()
+
+    def ensure_built(self):
+        if not self.is_stale():
+            return
+        # Only the first build is waited for, a stale index is served while another thread rebuilds it
+        if not self.build_lock.acquire(blocking=self.built_at is None):
+            return
+        try:
+            if self.is_stale():
+                self.build()
+        finally:
+            self.build_lock.release()
+
+    def get_staleness(self):
+        """ The changes of this process are indexed at once, the changes of the other processes once rebuilt """
+        return {
+            'built_at': self.built_on.isoformat() if self.built_on else None,
+            'max_staleness': FALLBACK_INDEX_TIMEOUT,
+        }
+
+    def remove(self, es_id):
+        with self.lock:
+            doc = self.docs.pop(es_id, None)
+            if doc is None:
+                return
+            for ngram in get_ngrams(doc['body']):
+                self.postings[ngram].discard(es_id)
+            if doc['keyword']:
+                self.keywords[doc['keyword'].lower()].discard(es_id)
+            self.suggest_inputs = [item for item in self.suggest_inputs if item[2] != es_id]
+
+    def update(self, record):
+        """ (Re)index one record, only once the index is built (it is built from the DB anyway) """
+        from .search import get_suggest_inputs, is_suggested
+
+        if self.built_at is None:
+            return
+        es_id = record.es_id()
+        doc = record.indexing()
+        with self.lock:
+            self.remove(es_id)
+            self.docs[es_id] = doc
+            for ngram in get_ngrams(doc['body']):
+                self.postings[ngram].add(es_id)
+            if doc['keyword']:
+                self.keywords[doc['keyword'].lower()].add(es_id)
+            if is_suggested(es_id):
+                for text in get_suggest_inputs(doc):
+                    bisect.insort(self.suggest_inputs, (text.lower(), text, es_id))
+
+    def get_scores(self, phrase):
+        """ multi_match (best_fields) of keyword^3 and body: the best of both field scores """
+        scores = defaultdict(float)
+        for ngram in get_ngrams(phrase):
+            es_ids = self.postings.get(ngram)
+            if not es_ids:
+                continue
+            idf = math.log(1 + len(self.docs) / len(es_ids))
+            for es_id in es_ids:
+                scores[es_id] += idf
+        for es_id in self.keywords.get(phrase.lower(), ()):
+            scores[es_id] = max(scores[es_id], KEYWORD_BOOST * math.log(1 + len(self.docs)))
+        return scores
+
+    def search(self, phrase, page_type=None, size=10, search_after=None):
+        """ Same hits (format and `date desc, _score, type, id` sort) as the page index search """
+        self.ensure_built()
+        with self.lock:
+            hits = []
+            for es_id, score in self.get_scores(phrase).items():
+                doc = self.docs[es_id]
+                if page_type is not None and doc['type'] != page_type:
+                    continue
+                hits.append({
+                    '_index': ES_PAGE_NAME,
+                    '_type': 'page',
+                    '_id': es_id,
+                    '_score': score,
+                    '_source': get_source(doc),
+                    'sort': [get_date_sort_value(doc['date']), score, doc['type'], str(doc['id'])],
+                })
+
+        def sort_key(sort):
+            return (-sort[0], -sort[1], sort[2], sort[3])
+
+        hits.sort(key=lambda hit: sort_key(hit['sort']))
+        total = len(hits)
+        if search_after:
+            after = sort_key(search_after)
+            hits = [hit for hit in hits if sort_key(hit['sort']) > after]
+        hits = hits[:size]
+        return {
+            'total': total,
+            'max_score': max([hit['_score'] for hit in hits], default=None),
+            'hits': hits,
+            'search_after': hits[-1]['sort'] if hits else None,
+            'fallback': self.get_staleness(),
+        }
+
+    def suggest(self, phrase, page_types=None, size=10):
+        """ Suggestions whose input starts with the phrase, like the completion suggester """
+        self.ensure_built()
+        prefix = phrase.lower()
+        suggestions, seen = [], set()
+        with self.lock:
+            start = bisect.bisect_left(self.suggest_inputs, (prefix,))
+            for lower_text, text, es_id in islice(self.suggest_inputs, start, None):
+                if not lower_text.startswith(prefix) or len(suggestions) >= size:
+                    break
+                doc = self.docs.get(es_id)
+                if es_id in seen or doc is None or (page_types and doc['type'] not in page_types):
+                    continue
+                seen.add(es_id)
+                suggestions.append({
+                    'id': doc['id'], 'event_id': doc['event_id'], 'type': doc['type'],
+                    'name': doc['name'], 'keyword': doc['keyword'], 'text': text,
+                })
+        return suggestions
+
+    def health(self):
+        return {
+            'status': 'fallback',
+            'number_of_documents': len(self.docs),
+            'built': self.built_at is not None,
+            'fallback': self.get_staleness(),
+        }
+
+
+PAGE_INDEX = PageIndex()
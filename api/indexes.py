@@ -53,3 +53,41 @@ GenericSetting = {
 }
 
 ES_PAGE_NAME = 'page_all'
+
+# Typeahead: completion suggester over the names (and codes) of countries, events and appeals
+SuggestMapping = {
+    'properties': {
+        'id': {'type': 'keyword'},
+        'event_id': {'type': 'keyword'},
+        'type': {'type': 'keyword'},
+        'name': {'type': 'keyword', 'index': False},
+        'keyword': {'type': 'keyword', 'index': False},
+        'suggest': {
+            'type': 'completion',
+            'analyzer': 'suggest',
+            'contexts': [
+                {'name': 'type', 'type': 'category', 'path': 'type'},
+            ]
+        },
+    }
+}
+
+SuggestSetting = {
+    'settings': {
+        'number_of_shards': 1,
+        'analysis': {
+            'analyzer': {
+                # Unlike the `simple` analyzer (letters only), keeps the digits of codes (MDRKE042) and names (COVID-19)
+                'suggest': {
+                    'type': 'custom',
+                    'tokenizer': 'standard',
+                    'filter': [
+                        'lowercase'
+                    ]
+                }
+            }
+        }
+    }
+}
+
+ES_SUGGEST_NAME = 'page_suggest'
@@ -0,0 +1,130 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.models import Country, District, Region, DisasterType, Event, FieldReport, Appeal, VisibilityCharChoices
+from deployments.models import (
+    ERU, ERUOwner, PersonnelDeployment, Personnel, Project,
+    ProgrammeTypes, Sectors, Statuses, OperationTypes,
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the region project aggregations and the deployment lists (queries, response bytes, milliseconds) '
+        'on generated projects and deployments, created in a transaction which is rolled back afterwards'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=50000, help='Number of projects (default 50000)')
+        parser.add_argument('--countries', type=int, default=60, help='Number of countries (default 60)')
+        parser.add_argument('--districts', type=int, default=120, help='Number of districts (default 120)')
+        parser.add_argument('--rows', type=int, default=3, help='Number of ERUs and personnel (default 3)')
+        parser.add_argument('--repeat', type=int, default=5, help='Requests per measure, the median is shown (default 5)')
+
+    def create_projects(self, countries, districts, count):
+        user = User.objects.create(username='benchmark-project-user')
+        projects = Project.objects.bulk_create([
+            Project(
+                user=user,
+                name='Benchmark project %s' % i,
+                reporting_ns=countries[i % len(countries)],
+                project_country=countries[(i * 7) % len(countries)],
+                programme_type=list(ProgrammeTypes)[i % len(ProgrammeTypes)].value,
+                primary_sector=list(Sectors)[i % len(Sectors)].value,
+                operation_type=list(OperationTypes)[i % len(OperationTypes)].value,
+                status=list(Statuses)[i % len(Statuses)].value,
+                start_date='2020-01-01',
+                end_date='2020-12-31',
+                budget_amount=1000 * (i % 10),
+                target_total=100 * (i % 7),
+                reached_total=10 * (i % 5),
+                visibility=VisibilityCharChoices.PUBLIC,
+            )
+            for i in range(count)
+        ], batch_size=5000)
+        Through = Project.project_districts.through
+        Through.objects.bulk_create([
+            Through(project_id=project.pk, district_id=districts[i % len(districts)].pk)
+            for i, project in enumerate(projects)
+        ], batch_size=5000)
+
+    def create_deployments(self, region, country, rows):
+        dtype = DisasterType.objects.create(name='Benchmark dtype', summary='summary')
+        owner = ERUOwner.objects.create(national_society_country=country)
+        for i in range(rows):
+            event = Event.objects.create(name='Benchmark event %s' % i, dtype=dtype)
+            event.countries.add(country)
+            Appeal.objects.create(aid='benchmark-appeal-%s' % i, name='Appeal', event=event, dtype=dtype, region=region)
+            field_report = FieldReport.objects.create(summary='Benchmark field report %s' % i, event=event, dtype=dtype)
+            field_report.countries.add(country)
+            ERU.objects.create(eru_owner=owner, deployed_to=country, event=event)
+            deployment = PersonnelDeployment.objects.create(
+                country_deployed_to=country, region_deployed_to=region, event_deployed_to=event,
+            )
+            Personnel.objects.create(name='Person %s' % i, type=Personnel.RDRT, country_from=country, deployment=deployment)
+
+    def measure(self, client, url, repeat, before_each=None):
+        """ Median time in milliseconds, queries and response bytes of the last request """
+        timings = []
+        for _ in range(repeat):
+            if before_each is not None:
+                before_each()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url, HTTP_HOST=settings.ALLOWED_HOSTS[0], HTTP_ACCEPT='application/json')
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise Exception('%s returned %s' % (url, response.status_code))
+        return statistics.median(timings), len(queries.captured_queries), len(response.content)
+
+    def report(self, label, url, result):
+        self.stdout.write('%-10s %-62s %8.1f ms %4s queries %9s bytes' % (label, url, *result))
+
+    def handle(self, *args, **options):
+        client = APIClient()
+        try:
+            # As in production, without the debug toolbar
+            with transaction.atomic(), override_settings(DEBUG=False):
+                region = Region.objects.create(name=0)
+                countries = [
+                    Country.objects.create(name='Benchmark country %s' % i, region=region)
+                    for i in range(options['countries'])
+                ]
+                districts = [
+                    District.objects.create(name='Benchmark district %s' % i, country=countries[i % len(countries)])
+                    for i in range(options['districts'])
+                ]
+                self.create_projects(countries, districts, options['projects'])
+                self.create_deployments(region, countries[0], options['rows'])
+
+                for url in (
+                    '/api/v2/region-project/%s/movement-activities/' % region.pk,
+                    '/api/v2/region-project/%s/national-society-activities/' % region.pk,
+                    '/api/v2/region-project/national-society-activities/?region=%s' % region.pk,
+                ):
+                    # A new project cache version: the aggregations are computed again
+                    self.report('uncached', url, self.measure(client, url, options['repeat'], Project.clear_cache))
+                    self.report('cached', url, self.measure(client, url, options['repeat']))
+
+                client.force_authenticate(User.objects.create(username='benchmark-deployment-user'))
+                for url in (
+                    '/api/v2/eru/',
+                    '/api/v2/eru/?mini=true',
+                    '/api/v2/personnel/',
+                    '/api/v2/personnel/?mini=true',
+                ):
+                    self.report('', url, self.measure(client, url, options['repeat']))
+                raise Rollback()
+        except Rollback:
+            pass
@@ -7,7 +7,8 @@ from django.conf import settings
 from django.template.loader import render_to_string
 from elasticsearch.helpers import bulk
 from api.indexes import ES_PAGE_NAME
-from api.esconnection import ES_CLIENT
+from api.esconnection import ES_CLIENT, ES_BULK_TIMEOUT
+from api.search import convert_for_suggest_bulk, is_suggested
 from api.models import Country, Appeal, Event, FieldReport, ActionsTaken, CronJob, CronJobStatus
 from api.logger import logger
 from notifications.models import RecordType, SubscriptionType, Subscription, SurgeAlert
@@ -649,7 +650,11 @@ class Command(BaseCommand):
                     logger.info('Silent about a one-by-one subscribed %s – user already notified via generic subscription' % (record_type))
 
     def index_records(self, records, to_create=True):
-        self.bulk([self.convert_for_bulk(record, create=to_create) for record in list(records)])
+        records = list(records)
+        self.bulk([self.convert_for_bulk(record, create=to_create) for record in records] + [
+            # Typeahead suggestions are (re)indexed as a whole
+            convert_for_suggest_bulk(record) for record in records if is_suggested(record.es_id())
+        ])
 
     def convert_for_bulk(self, record, create):
         data = record.indexing()
@@ -667,7 +672,7 @@ class Command(BaseCommand):
 
     def bulk(self, actions):
         try:
-            created, errors = bulk(client=ES_CLIENT, actions=actions)
+            created, errors = bulk(client=ES_CLIENT, actions=actions, request_timeout=ES_BULK_TIMEOUT)
             if len(errors):
                 logger.error('Produced the following errors:')
                 logger.error('[%s]' % ', '.join(map(str, errors)))
@@ -4,9 +4,10 @@ from elasticsearch.client import IndicesClient
 from elasticsearch.helpers import bulk
 from elasticsearch import Elasticsearch
 
-from api.esconnection import ES_CLIENT
-from api.indexes import GenericMapping, GenericSetting, ES_PAGE_NAME
+from api.esconnection import ES_CLIENT, ES_BULK_TIMEOUT
+from api.indexes import GenericMapping, GenericSetting, ES_PAGE_NAME, SuggestMapping, SuggestSetting, ES_SUGGEST_NAME
 from api.models import Region, Country, Event, Appeal, FieldReport
+from api.search import convert_for_suggest_bulk
 from api.logger import logger
 
 class Command(BaseCommand):
@@ -15,6 +16,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         logger.info('Recreating indices')
         self.recreate_index(ES_PAGE_NAME, GenericMapping, GenericSetting)
+        self.recreate_index(ES_SUGGEST_NAME, SuggestMapping, SuggestSetting)
 
         logger.info('Indexing regions')
         self.push_table_to_index(model=Region)
@@ -31,6 +33,10 @@ class Command(BaseCommand):
         logger.info('Indexing field reports')
         self.push_table_to_index(model=FieldReport)
 
+        logger.info('Indexing suggestions')
+        for model in (Country, Event, Appeal):
+            self.push_table_to_index(model=model, convert=convert_for_suggest_bulk)
+
     def recreate_index(self, index_name, index_mapping, index_setting):
         indices_client = IndicesClient(client=ES_CLIENT)
         if indices_client.exists(index_name):
@@ -42,12 +48,13 @@ class Command(BaseCommand):
                                    body=index_mapping)
 
 
-    def push_table_to_index(self, model):
+    def push_table_to_index(self, model, convert=None):
         query = model.objects.all()
+        convert = convert or self.convert_for_bulk
         data = [
-            self.convert_for_bulk(s) for s in list(query)
+            convert(s) for s in list(query)
         ]
-        created, errors = bulk(client=ES_CLIENT, actions=data)
+        created, errors = bulk(client=ES_CLIENT, actions=data, request_timeout=ES_BULK_TIMEOUT)
         logger.info('Created %s records' % created)
         if len(errors):
             logger.error('Produced the following errors:')
@@ -5,7 +5,7 @@ import json
 from bs4 import BeautifulSoup
 from django.core.management.base import BaseCommand
 from django.core.exceptions import ObjectDoesNotExist
-from api.models import Appeal, AppealDocument, CronJob, CronJobStatus
+from api.models import Appeal, AppealDocument, CronJob, CronJobStatus, CronJobLogBuffer
 from api.logger import logger
 
 
@@ -40,6 +40,7 @@ class Command(BaseCommand):
         timeformat = '%d%b%Y'
         return datetime.strptime(date_string.strip(), timeformat).replace(tzinfo=timezone.utc)
 
+    @CronJobLogBuffer()
     def handle(self, *args, **options):
         logger.info('Starting appeal document ingest')
 
@@ -4,7 +4,9 @@ import requests
 import json
 from datetime import datetime, timezone, timedelta
 from django.core.management.base import BaseCommand
-from api.models import AppealType, AppealStatus, Appeal, Region, Country, DisasterType, Event, CronJob, CronJobStatus
+from api.models import (
+    AppealType, AppealStatus, Appeal, Region, Country, DisasterType, Event, CronJob, CronJobStatus, CronJobLogBuffer,
+)
 from api.fixtures.dtype_map import DISASTER_TYPE_MAPPING
 from api.logger import logger
 
@@ -233,6 +235,7 @@ class Command(BaseCommand):
         return fields
 
 
+    @CronJobLogBuffer()
     def handle(self, *args, **options):
         logger.info('Starting appeals ingest')
         new, modified, bilaterals = self.get_new_or_modified_appeals()
@@ -3,7 +3,7 @@ import datetime as dt
 from encoder import XML2Dict
 from dateutil.parser import parse
 from django.core.management.base import BaseCommand
-from api.models import Country, Event, GDACSEvent, CronJob, CronJobStatus
+from api.models import Country, Event, GDACSEvent, CronJob, CronJobStatus, CronJobLogBuffer
 from api.event_sources import SOURCES
 from api.logger import logger
 
@@ -11,6 +11,7 @@ from api.logger import logger
 class Command(BaseCommand):
     help = 'Add new entries from Access database file'
 
+    @CronJobLogBuffer()
     def handle(self, *args, **options):
         logger.info('Starting GDACs ingest')
         # get latest
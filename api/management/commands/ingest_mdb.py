@@ -1,3 +1,4 @@
+import io
 import os
 import csv
 import subprocess
@@ -28,22 +29,22 @@ from api.logger import logger
 REPORT_DATE_FORMAT = '%m/%d/%y %H:%M:%S'
 
 def extract_table(dbfile, table):
-    """ Extract a table from the Access database """
+    """ Extract a table from the Access database, yielding one dict per row as mdb-export streams it """
     cmd = 'mdb-export %s %s' % (dbfile, table)
     try:
-        output = subprocess.check_output(cmd.split(' ')).splitlines()
+        proc = subprocess.Popen(cmd.split(' '), stdout=subprocess.PIPE)
     except Exception as e:
         logger.error(e)
-    output = [o.decode('utf-8') for o in output]
-    reader = csv.reader(output, delimiter=',', quotechar='"')
-    records = []
-    for i, row in enumerate(reader):
-        if i == 0:
-            header = row
-        else:
-            d = {header[i]: l for i, l in enumerate(row)}
-            records.append(d)
-    return records
+        return
+    with proc:
+        lines = io.TextIOWrapper(proc.stdout, encoding='utf-8', newline='')
+        reader = csv.reader(lines, delimiter=',', quotechar='"')
+        header = next(reader, None)
+        if header is not None:
+            for row in reader:
+                yield {header[i]: l for i, l in enumerate(row)}
+    if proc.returncode:
+        logger.error('mdb-export exited with %s for table %s' % (proc.returncode, table))
 
 
 def contact_is_valid(contact, field):
@@ -113,20 +114,20 @@ class Command(BaseCommand):
         filename = get_dbfile()
 
         # numeric details records
-        details_rc = extract_table(filename, 'EW_Report_NumericDetails')
+        details_rc = list(extract_table(filename, 'EW_Report_NumericDetails'))
         # check for 1 record for each field report
         fids = [r['ReportID'] for r in details_rc]
         if len(set(fids)) != len(fids):
             raise Exception('More than one NumericDetails record for a field report')
         # numeric details records
-        details_gov = extract_table(filename, 'EW_Report_NumericDetails_GOV')
+        details_gov = list(extract_table(filename, 'EW_Report_NumericDetails_GOV'))
         # check for 1 record for each field report
         fids = [r['ReportID'] for r in details_gov]
         if len(set(fids)) != len(fids):
             raise Exception('More than one NumericDetails record for a field report')
 
         # information
-        info_table = extract_table(filename, 'EW_Report_InformationManagement')
+        info_table = list(extract_table(filename, 'EW_Report_InformationManagement'))
         fids = [r['ReportID'] for r in info_table]
         if len(set(fids)) != len(fids):
             raise Exception('More than one InformationManagement record for a field report')
@@ -134,33 +135,34 @@ class Command(BaseCommand):
         ### many-to-many
 
         # actions taken
-        actions_national = extract_table(filename, 'EW_Report_ActionTakenByRedCross')
-        actions_foreign = extract_table(filename, 'EW_Report_ActionTakenByPnsRC')
-        actions_federation = extract_table(filename, 'EW_Report_ActionTakenByFederationRC')
+        actions_national = list(extract_table(filename, 'EW_Report_ActionTakenByRedCross'))
+        actions_foreign = list(extract_table(filename, 'EW_Report_ActionTakenByPnsRC'))
+        actions_federation = list(extract_table(filename, 'EW_Report_ActionTakenByFederationRC'))
 
         # source types
         source_types = extract_table(filename, 'EW_lofSources')
         for s in source_types:
             SourceType.objects.get_or_create(pk=s['SourceID'], defaults={'name': s['SourceName']})
 
-        source_table = extract_table(filename, 'EW_Reports_Sources')
+        source_table = list(extract_table(filename, 'EW_Reports_Sources'))
 
         # disaster response
-        dr_table = extract_table(filename, 'EW_DisasterResponseTools')
+        dr_table = list(extract_table(filename, 'EW_DisasterResponseTools'))
         # check for 1 record for each field report
         fids = [r['ReportID'] for r in dr_table]
         if len(set(fids)) != len(fids):
             raise Exception('More than one DisasterResponseTools record for a field report')
 
         # contacts
-        contacts = extract_table(filename, 'EW_Report_Contacts')
+        contacts = list(extract_table(filename, 'EW_Report_Contacts'))
 
-        # field report
+        # field report (streamed, so reports are created while mdb-export is still running)
         reports = extract_table(filename, 'EW_Reports')
-        rids = [r.rid for r in FieldReport.objects.all()]
+        rids = set(FieldReport.objects.values_list('rid', flat=True))
         num_reports_created = 0
-        logger.info('%s reports in database' % len(reports))
+        num_reports = 0
         for i, report in enumerate(reports):
+            num_reports += 1
 
             # Skip reports that we've already ingested.
             # We don't have to update them because field reports can't be updated in DMIS.
@@ -316,6 +318,7 @@ class Command(BaseCommand):
                             field_report=field_report,
                         )
         total_reports = FieldReport.objects.all()
+        logger.info('%s reports in MDB database' % num_reports)
         logger.info('%s reports created' % num_reports_created)
         logger.info('%s reports in database' % total_reports.count())
 
@@ -3,7 +3,7 @@ import datetime as dt
 from encoder import XML2Dict
 from dateutil.parser import parse
 from django.core.management.base import BaseCommand
-from api.models import Country, Region, Event, CronJob, CronJobStatus
+from api.models import Country, Region, Event, CronJob, CronJobStatus, CronJobLogBuffer
 from api.event_sources import SOURCES
 from api.logger import logger
 
@@ -11,6 +11,7 @@ from api.logger import logger
 class Command(BaseCommand):
     help = 'Add new event (=emergency) entries from WHO API'
 
+    @CronJobLogBuffer()
     def handle(self, *args, **options):
 
         guids = [e.auto_generated_source for e in Event.objects.filter(auto_generated_source__startswith='www.who.int')]
@@ -1,52 +1,80 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
+from api.access import clear_access_profile_cache
+from api.logger import logger
 from api.models import Country, Region
 
+
+def sync_group_permissions(specs):
+    """
+    Create the missing permissions, groups and group-permission links, in a few queries whatever the size of specs.
+    specs: (content_type, codename, permission name, group name)
+    Existing rows are kept as they are (permission names are not updated).
+    """
+    # Permissions
+    content_types = {content_type.pk: content_type for content_type, *_ in specs}
+    permission_ids = {
+        (content_type_id, codename): pk
+        for pk, content_type_id, codename in Permission.objects.filter(
+            content_type__in=content_types.keys(),
+            codename__in={codename for _, codename, *_ in specs},
+        ).values_list('pk', 'content_type_id', 'codename')
+    }
+    new_permissions = {}
+    for content_type, codename, name, _ in specs:
+        key = (content_type.pk, codename)
+        if key not in permission_ids and key not in new_permissions:
+            new_permissions[key] = Permission(content_type=content_type, codename=codename, name=name)
+    for permission in Permission.objects.bulk_create(new_permissions.values()):
+        permission_ids[(permission.content_type_id, permission.codename)] = permission.pk
+
+    # Groups
+    group_names = {group_name for *_, group_name in specs}
+    group_ids = dict(Group.objects.filter(name__in=group_names).values_list('name', 'pk'))
+    new_groups = [Group(name=name) for name in group_names if name not in group_ids]
+    for group in Group.objects.bulk_create(new_groups):
+        group_ids[group.name] = group.pk
+
+    # Group permissions. Bulk inserts don't send m2m_changed, so the access profiles of the groups' users are reset here.
+    # This reaches the web workers through the shared cache (settings.CACHES, api.W001 warns about a process local one),
+    # otherwise their cached profiles would only expire after ACCESS_PROFILE_CACHE_TIMEOUT.
+    GroupPermission = Group.permissions.through
+    links = {
+        (group_ids[group_name], permission_ids[(content_type.pk, codename)])
+        for content_type, codename, _, group_name in specs
+    }
+    links -= set(
+        GroupPermission.objects.filter(
+            group_id__in={group_id for group_id, _ in links},
+            permission_id__in={permission_id for _, permission_id in links},
+        ).values_list('group_id', 'permission_id')
+    )
+    GroupPermission.objects.bulk_create([
+        GroupPermission(group_id=group_id, permission_id=permission_id) for group_id, permission_id in links
+    ])
+    if links:
+        clear_access_profile_cache(
+            Group.user_set.through.objects.filter(group_id__in={group_id for group_id, _ in links})
+            .values_list('user_id', flat=True).distinct()
+        )
+    return len(new_permissions), len(new_groups), len(links)
+
+
 class Command(BaseCommand):
     help = 'Create standard geographic permissions classes and groups'
 
     def handle(self, *args, **options):
         country_content_type = ContentType.objects.get_for_model(Country)
-        countries = Country.objects.all()
-        for country in countries:
-            codename = 'country_admin_%s' % country.id
-            name = 'Admin for %s' % country.name
-            permission, created = Permission.objects.get_or_create(
-                codename=codename,
-                name=name,
-                content_type=country_content_type
-            )
-            # If it's a new permission, create a group for it
-            group, created = Group.objects.get_or_create(
-                name='%s Admins' % country.name
-            )
-            group.permissions.add(permission)
-
         region_content_type = ContentType.objects.get_for_model(Region)
-        regions = Region.objects.all()
-        for region in regions:
-            codename = 'region_admin_%s' % region.id
-            name = 'Admin for %s' % region.name
-            permission, created = Permission.objects.get_or_create(
-                codename=codename,
-                name=name,
-                content_type=region_content_type
-            )
-            # If it's a new permission, create a group for it
-            group, created = Group.objects.get_or_create(
-                name='%s Regional Admins' % region.name
-            )
-            group.permissions.add(permission)
-
-        # Create an IFRC permission and attach it to a group
-        ifrc_permission, perm_created = Permission.objects.get_or_create(
-            codename='ifrc_admin',
-            name='IFRC Admin',
-            content_type=ContentType.objects.get_for_model(Country),
-        )
-
-        ifrc_group, group_created = Group.objects.get_or_create(
-            name='IFRC Admins'
-        )
-        ifrc_group.permissions.add(ifrc_permission)
+        specs = [
+            (country_content_type, 'country_admin_%s' % pk, 'Admin for %s' % name, '%s Admins' % name)
+            for pk, name in Country.objects.values_list('pk', 'name')
+        ] + [
+            (region_content_type, 'region_admin_%s' % pk, 'Admin for %s' % name, '%s Regional Admins' % name)
+            for pk, name in Region.objects.values_list('pk', 'name')
+        ] + [
+            # IFRC permission attached to its group
+            (country_content_type, 'ifrc_admin', 'IFRC Admin', 'IFRC Admins'),
+        ]
+        logger.info('Created %s permissions, %s groups and %s group permissions' % sync_group_permissions(specs))
@@ -1,37 +1,32 @@
-import requests
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User, Group
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from api.access import clear_access_profile_cache
+from api.authentication import clear_user_token_cache
 from api.logger import logger
 #from registrations.views import is_valid_domain
 
+UserGroup = User.groups.through
+
+
+def in_group(name):
+    """ Exists() subquery: the user is member of a group with name containing `name` """
+    return Exists(UserGroup.objects.filter(user_id=OuterRef('pk'), group__name__icontains=name))
+
+
 class Command(BaseCommand):
     help = 'Update staff status in auth_user table according to "Read only" group'
 
     def get_readonly_users(self):
-        readonly = []
-        for usr in User.objects.filter(is_staff=True).filter(is_superuser=False):
-            if usr.groups.filter(name__icontains='read only'):
-                readonly.append(usr)
-                logger.info(u"Read only: %s", usr.get_full_name())
-        
-        return readonly
+        return User.objects.filter(is_staff=True, is_superuser=False)\
+            .annotate(is_readonly=in_group('read only')).filter(is_readonly=True)
 
     def get_ifrc_domain_users(self):
-        ifrc_domain_users = []
-        count = 0
-        #import pdb; pdb.set_trace()
-        for usr in User.objects.filter(is_superuser=False):
-            if not usr.email:
-                continue
-            if (usr.email.lower().split('@')[1] == 'ifrc.org' and
-                    not usr.groups.filter(name__icontains='read only') and
-                    not usr.groups.filter(name__icontains='IFRC Admins')):
-                ifrc_domain_users.append(usr)
-                count += 1
-                logger.info(u"IFRC Admins group < IFRC domain user: %s",
-                    usr.get_full_name() + ' | ' + usr.email + ' (' + str(count) + ')')
-                # Prints a lots of users
-        return ifrc_domain_users
+        # As email.lower().split('@')[1] == 'ifrc.org': the part after the first @ is ifrc.org, in any case
+        return User.objects.filter(is_superuser=False, email__iregex=r'^[^@]*@ifrc\.org(@|$)')\
+            .annotate(is_readonly=in_group('read only'), is_ifrc_admin=in_group('IFRC Admins'))\
+            .filter(is_readonly=False, is_ifrc_admin=False)
 
 #   def get_editor_users(self):
 #       editors = []
@@ -41,44 +36,30 @@ class Command(BaseCommand):
 #                editors.append(u)
 #                print ("Editor again: " + u.get_full_name())
 #                # Prints a lots of users
-#       
+#
 #       return editors
 
+    @transaction.atomic
     def handle(self, *args, **options):
         logger.info('Moving Read only users out of staff status...')
 
-        users = self.get_readonly_users()
-        if len(users) > 0:
-            logger.info('Revoking staff status from %s user%s'
-                % (len(users), 's' if len(users) > 1 else ''))
-            num_updated = 0
-            for usr in users:
-                usr.is_staff = False
-                try:
-                    usr.save()
-                except Exception as e:
-                    logger.error(str(e)[:100])
-                    logger.error('Could not update user %s' % usr.email)
-                    continue
-                num_updated += 1
-                logger.info(' %s user%s updated'
-                    % (num_updated, 's' if num_updated > 1 else ''))
-            logger.info('... user%s moving completed' % ('s' if len(users) > 1 else ''))
+        # update() and the bulk insert bypass the model signals, so the auth caches are cleared here, once committed
+        # (before, a web worker could cache the old rows again). This reaches the web workers through the shared cache
+        # (settings.CACHES), with a process local cache they would only see the change after the cache timeouts.
+        user_ids = list(self.get_readonly_users().values_list('pk', flat=True))
+        if user_ids:
+            num_updated = User.objects.filter(pk__in=user_ids).update(is_staff=False)
+            transaction.on_commit(lambda: clear_user_token_cache(user_ids))
+            logger.info('Revoked staff status from %s user%s' % (num_updated, 's' if num_updated > 1 else ''))
         else:
             logger.info('... not found any users to be moved')
 
-        ifrc_users = self.get_ifrc_domain_users()
+        ifrc_user_ids = list(self.get_ifrc_domain_users().values_list('pk', flat=True))
         ifrc_grp = Group.objects.get(name='IFRC Admins')
-        if len(ifrc_users) > 0:
-            logger.info('Adding IFRC Admins Group membership to %s user%s'
-                % (len(ifrc_users), 's' if len(ifrc_users) > 1 else ''))
-            num_i_updated = 0
-            for usr in ifrc_users:
-                ifrc_grp.user_set.add(usr)
-                num_i_updated += 1
-                logger.info(' %s user%s added'
-                    % (num_i_updated, 's' if num_i_updated > 1 else ''))
-            logger.info('... user%s adding to IFRC Admins Group completed'
-                % ('s' if len(ifrc_users) > 1 else ''))
+        if ifrc_user_ids:
+            UserGroup.objects.bulk_create([UserGroup(user_id=user_id, group=ifrc_grp) for user_id in ifrc_user_ids])
+            transaction.on_commit(lambda: clear_access_profile_cache(ifrc_user_ids))
+            logger.info('Added IFRC Admins Group membership to %s user%s'
+                % (len(ifrc_user_ids), 's' if len(ifrc_user_ids) > 1 else ''))
         else:
             logger.info('... not found any users to be put into IFRC Admins')
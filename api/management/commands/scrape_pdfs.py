@@ -20,7 +20,10 @@ from pdfminer.layout import LAParams
 from pdfminer.pdfpage import PDFPage
 from tidylib import tidy_document
 
-from api.models import EmergencyOperationsDataset, EmergencyOperationsPeopleReached, EmergencyOperationsEA, EmergencyOperationsFR, CronJob, CronJobStatus
+from api.models import (
+    EmergencyOperationsDataset, EmergencyOperationsPeopleReached, EmergencyOperationsEA, EmergencyOperationsFR,
+    CronJob, CronJobStatus, CronJobLogBuffer,
+)
 from api.logger import logger
 from django.core.management.base import BaseCommand
 from api.scrapers.extractor import MetaFieldExtractor, SectorFieldExtractor
@@ -604,6 +607,7 @@ class Command(BaseCommand):
                 logger.error('Couldn\'t add EA: {fn} ({fu})'.format(fn=ea_rec.raw_file_name, fu=ea_rec.raw_file_url))
 
 
+    @CronJobLogBuffer()
     def handle(self, *args, **options):
         logger.info('Starting PDF scraping.')
         processed_data = []
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.13 on 2020-07-09 11:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0075_profile_last_frontend_login'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cronjob',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='created at'),
+        ),
+    ]
@@ -1,16 +1,24 @@
 from django.utils.translation import ugettext_lazy as _
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User, Group, Permission
 from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 # from django.db.models import Prefetch
 from django.dispatch import receiver
 from django.utils import timezone
 from enumfields import IntEnum, EnumIntegerField
+from rest_framework.authtoken.models import Token
+from .access import clear_access_profile_cache
+from .authentication import clear_token_cache, clear_user_token_cache
 from .storage import AzureStorage
 from tinymce import HTMLField
 from django.core.validators import FileExtensionValidator, validate_slug
 from django.contrib.postgres.fields import ArrayField
 from datetime import datetime, timedelta
+from contextlib import ContextDecorator
+import threading
 import pytz
 from .utils import (
     validate_slug_number,
@@ -92,6 +100,9 @@ class Region(models.Model):
         return str(self.name)
 
 
+COUNTRY_ISO_MAP_CACHE_KEY = 'api-country-iso-map'
+
+
 def logo_document_path(instance, filename):
     return 'logos/%s/%s' % (instance.iso, filename)
 
@@ -172,6 +183,40 @@ class Country(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_iso_map(cls):
+        """
+        {<lowercase ISO/ISO3>: [country ids]}, cached (shared by the workers, see settings.CACHES) till a country changes
+        """
+        iso_map = cache.get(COUNTRY_ISO_MAP_CACHE_KEY)
+        if iso_map is None:
+            iso_map = {}
+            for cid, iso, iso3 in cls.objects.values_list('id', 'iso', 'iso3'):
+                for code in set([iso, iso3]):
+                    if code:
+                        iso_map.setdefault(code.lower(), []).append(cid)
+            cache.set(COUNTRY_ISO_MAP_CACHE_KEY, iso_map, None)
+        return iso_map
+
+    @classmethod
+    def get_ids_for_iso(cls, codes):
+        """
+        Resolve ISO/ISO3 codes (case insensitive) to country ids
+        """
+        iso_map = cls.get_iso_map()
+        return list(set([
+            cid
+            for code in codes
+            for cid in iso_map.get(code.lower(), [])
+        ]))
+
+
+@receiver([post_save, post_delete], sender=Country)
+def clear_country_iso_map_cache(sender, **kwargs):
+    cache.delete(COUNTRY_ISO_MAP_CACHE_KEY)
+    # Again once committed, in case another worker cached the old codes meanwhile
+    transaction.on_commit(lambda: cache.delete(COUNTRY_ISO_MAP_CACHE_KEY))
+
 
 class District(models.Model):
     """ Admin level 1 field """
@@ -1550,7 +1595,8 @@ class CronJob(models.Model):
     """ CronJob log row about jobs results """
     name = models.CharField(verbose_name=_('name'), max_length=100, default='')
     status = EnumIntegerField(CronJobStatus, verbose_name=_('status'), default=-1)
-    created_at = models.DateTimeField(verbose_name=_('created at'), auto_now_add=True)
+    # Not auto_now_add, buffered rows (CronJobLogBuffer) keep the time they were logged at
+    created_at = models.DateTimeField(verbose_name=_('created at'), default=timezone.now, editable=False)
     message = models.TextField(verbose_name=_('message'), null=True, blank=True)
     num_result = models.IntegerField(verbose_name=_('number of results'), default=0)
     storing_days = models.IntegerField(verbose_name=_('storing days'), default=3)
@@ -1608,14 +1654,66 @@ class CronJob(models.Model):
             new.append(CronJob(**fields))
 
         if not len(errors):
-            CronJob.objects.filter(
-                name=body['name'], created_at__lt=datetime.now(
-                    pytz.timezone('UTC')) - timedelta(days=store_me)
-            ).delete()  # Delete old ones, "log-rotate"
-            CronJob.objects.bulk_create(new)
+            log_buffer = CronJobLogBuffer.get_current()
+            if log_buffer is not None:
+                # Written when the running command flushes its buffer
+                log_buffer.add(new, store_me)
+            else:
+                CronJob.write_logs(new, {body['name']: store_me})
 
         return errors, new
 
+    @staticmethod
+    def write_logs(new, storing_days):
+        """ Delete the old rows of each job name ("log-rotate") and insert the new ones, once per call """
+        now = datetime.now(pytz.timezone('UTC'))
+        rotate_filter = models.Q()
+        for name, store_me in storing_days.items():
+            rotate_filter |= models.Q(name=name, created_at__lt=now - timedelta(days=store_me))
+        if storing_days:
+            CronJob.objects.filter(rotate_filter).delete()
+        CronJob.objects.bulk_create(new)
+
+
+class CronJobLogBuffer(ContextDecorator):
+    """
+    Collects the CronJob log rows of a command run and writes them in one insert at exit (or flush).
+    Usage: `with CronJobLogBuffer(): ...` or `@CronJobLogBuffer()` on a command's handle.
+    """
+    _local = threading.local()
+
+    def __init__(self):
+        self.new = []
+        self.storing_days = {}
+
+    @classmethod
+    def get_current(cls):
+        stack = getattr(cls._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def __enter__(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        self._local.stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self._local.stack.remove(self)
+        self.flush()
+        return False
+
+    def add(self, new, store_me):
+        self.new.extend(new)
+        for cron_job in new:
+            # Rotate once per job name, keeping the shortest storing days asked during the run
+            self.storing_days[cron_job.name] = min(store_me, self.storing_days.get(cron_job.name, store_me))
+
+    def flush(self):
+        if self.new:
+            CronJob.write_logs(self.new, self.storing_days)
+        self.new = []
+        self.storing_days = {}
+
 # To find related scripts from go-api root dir:
 # grep -rl CronJob --exclude-dir=__pycache__ --exclude-dir=main --exclude-dir=migrations --exclude=CHANGELOG.md *
 
@@ -1676,6 +1774,67 @@ def user_logged_out_callback(sender, request, user, **kwargs):
     # ip = request.META.get('REMOTE_ADDR')
     if user:
         AuthLog.objects.create(action='user_logged_out', username=user.username)
+        clear_user_token_cache([user.pk])
+
+
+# Cached token authentication (api.authentication) is reset on any token or user change (password, active, staff...)
+@receiver([post_save, post_delete], sender=Token)
+def clear_token_auth_cache(sender, instance, **kwargs):
+    clear_token_cache([instance.key])
+
+
+@receiver([post_save, post_delete], sender=User)
+def clear_user_token_auth_cache(sender, instance, **kwargs):
+    clear_user_token_cache([instance.pk])
+
+
+# Cached access profiles (api.access) are reset for every user whose groups or permissions change
+def clear_user_access_profile(user):
+    user.__dict__.pop('_access_profile', None)
+    clear_access_profile_cache([user.pk])
+
+
+@receiver([post_save, post_delete], sender=User)
+def clear_user_access_profile_cache(sender, instance, **kwargs):
+    clear_user_access_profile(instance)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def clear_user_m2m_access_profile_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        clear_user_access_profile(instance)
+    elif pk_set is not None:
+        clear_access_profile_cache(pk_set)
+    elif action == 'pre_clear':
+        # Group/Permission side cleared, the users are only known before the clear
+        clear_access_profile_cache(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def clear_group_m2m_access_profile_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        users = User.objects.filter(groups=instance)
+    elif pk_set is not None:
+        users = User.objects.filter(groups__in=pk_set)
+    else:
+        users = User.objects.filter(groups__permissions=instance)
+    clear_access_profile_cache(users.values_list('pk', flat=True).distinct())
+
+
+@receiver(pre_delete, sender=Group)
+@receiver(pre_delete, sender=Permission)
+def clear_deleted_access_profile_cache(sender, instance, **kwargs):
+    # Deletion cascades to the m2m tables without m2m_changed signals
+    if sender is Group:
+        users = User.objects.filter(groups=instance)
+    else:
+        users = User.objects.filter(models.Q(user_permissions=instance) | models.Q(groups__permissions=instance))
+    clear_access_profile_cache(users.values_list('pk', flat=True).distinct())
 
 
 @receiver(user_login_failed)
@@ -1,14 +1,19 @@
 import json
-from api.indexes import ES_PAGE_NAME
-from api.esconnection import ES_CLIENT
+import threading
+from collections import defaultdict
+from api.indexes import ES_PAGE_NAME, ES_SUGGEST_NAME
+from api.esconnection import ES_CLIENT, ES_SEARCH_TIMEOUT
+from api.fallback_search import PAGE_INDEX
+from api.search import is_suggested
 from api.logger import logger
-from django.db import transaction
-from django.db.models.signals import pre_delete
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.db.models.signals import pre_delete, post_save, post_delete
 from django.dispatch import receiver
 from elasticsearch.helpers import bulk
 from reversion.models import Revision, Version
 from reversion.signals import post_revision_commit
-from api.models import ReversionDifferenceLog, User, Country, Event
+from api.models import ReversionDifferenceLog, User, Region, Country, Event, Appeal, FieldReport
 from deployments.models import DeployedPerson
 from per.models import Form
 from middlewares.middlewares import get_username
@@ -52,37 +57,58 @@ MODEL_TYPES = {
 }
 
 
+def get_previous_versions(versions):
+    """ Latest older version of each object in versions, fetched with a single query """
+    if not versions:
+        return {}
+    version_filter = Q()
+    for version in versions:
+        version_filter |= Q(
+            object_id=version.object_id,
+            content_type_id=version.content_type_id,
+            id__lt=version.id,
+        )
+    previous_versions = Version.objects.filter(version_filter)\
+        .order_by('content_type_id', 'object_id', '-id')\
+        .distinct('content_type_id', 'object_id')
+    return {
+        (previous_version.content_type_id, previous_version.object_id): previous_version
+        for previous_version in previous_versions
+    }
+
+
 def create_global_reversion_log(versions, revision):
+    previous_versions = get_previous_versions(versions)
+    username = revision.user.username if revision.user else ''
+    action_happened = 'Added' if 'Added' in revision.comment else 'Changed'
+
+    logs = []
     for version in versions:
         ver_data = json.loads(version.serialized_data)
         # try to map model name coming from Reversion to more readable model names (dict above)
         model_name = MODEL_TYPES.get(ver_data[0]['model'], ver_data[0]['model'])
-        action_happened = 'Added' if 'Added' in revision.comment else 'Changed'
+        object_name = str(version) if len(str(version)) <= 200 else str(version)[:200] + '...'
 
-        previous_version = Version.objects.filter(
-            object_id=version.object_id,
-            content_type_id=version.content_type_id,
-            id__lt=version.id,
-        ).first()
+        previous_version = previous_versions.get((version.content_type_id, version.object_id))
 
         # if the record already existed in the DB but didn't have an initial/previous reversion record
         if not previous_version and action_happened == 'Added':
-            ReversionDifferenceLog.objects.create(
+            logs.append(ReversionDifferenceLog(
                 action=action_happened,
-                username=revision.user.username if revision.user else '',
+                username=username,
                 object_id=version.object_id,
-                object_name=str(version) if len(str(version)) <= 200 else str(version)[:200] + '...',
+                object_name=object_name,
                 object_type=model_name
-            )
+            ))
         elif not previous_version:
-            ReversionDifferenceLog.objects.create(
+            logs.append(ReversionDifferenceLog(
                 action=action_happened,
-                username=revision.user.username if revision.user else '',
+                username=username,
                 object_id=version.object_id,
-                object_name=str(version) if len(str(version)) <= 200 else str(version)[:200] + '...',
+                object_name=object_name,
                 object_type=model_name,
                 changed_to=revision.comment.replace('Changed ', '').replace('.', '').split(' and ')
-            )
+            ))
         elif previous_version._local_field_dict != version._local_field_dict:
             changes_from = []
             changes_to = []
@@ -91,15 +117,17 @@ def create_global_reversion_log(versions, revision):
                     changes_from.append('{}: {}'.format(key, previous_version._local_field_dict[key]))
                     changes_to.append('{}: {}'.format(key, value))
 
-            ReversionDifferenceLog.objects.create(
+            logs.append(ReversionDifferenceLog(
                 action=action_happened,
-                username=revision.user.username if revision.user else '',
+                username=username,
                 object_id=version.object_id,
-                object_name=str(version) if len(str(version)) <= 200 else str(version)[:200] + '...',
+                object_name=object_name,
                 object_type=model_name,
                 changed_from=changes_from,
                 changed_to=changes_to
-            )
+            ))
+
+    ReversionDifferenceLog.objects.bulk_create(logs)
 
 
 @receiver(post_revision_commit)
@@ -107,35 +135,110 @@ def post_revision_commit_receiver(sender, revision, versions, **kwargs):
     transaction.on_commit(lambda: create_global_reversion_log(versions, revision))
 
 
-@receiver(pre_delete)
-def log_deletion(sender, instance, using, **kwargs):
-    model_name = None
-    instance_type = instance.__class__.__name__
+# Deletions of these models are logged, CronJob rows are rotated by CronJob.sync_cron and not audited
+DELETION_LOGGED_MODELS = [model for model in MODEL_TYPES.keys() if model != 'api.cronjob']
+
+
+class ElasticSearchDeletion():
+    """
+    ES documents of the rows deleted in a transaction, removed with one bulk request on commit.
+    Each deletion registers the pending deletion of its connection (one per thread) with on_commit: the first call
+    after the commit sends all the documents, the next calls have nothing left to send.
+    Rows still in the DB (deletion rolled back with a savepoint, or with the whole transaction) are skipped.
+    """
+    pending = threading.local()
+
+    def __init__(self, using):
+        self.using = using
+        # es_id: (model, pk)
+        self.rows = {}
+
+    @classmethod
+    def get_pending(cls, using=None):
+        using = using or DEFAULT_DB_ALIAS
+        if not hasattr(cls.pending, 'deletions'):
+            cls.pending.deletions = {}
+        if using not in cls.pending.deletions:
+            cls.pending.deletions[using] = cls(using)
+        return cls.pending.deletions[using]
+
+    @classmethod
+    def add(cls, instance, using=None):
+        es_deletion = cls.get_pending(using)
+        es_deletion.rows[instance.es_id()] = (type(instance), instance.pk)
+        transaction.on_commit(es_deletion, using=using)
+
+    def get_deleted_es_ids(self):
+        pks = defaultdict(set)
+        for model, pk in self.rows.values():
+            pks[model].add(pk)
+        existing = {
+            (model, pk)
+            for model, model_pks in pks.items()
+            for pk in model._base_manager.using(self.using).filter(pk__in=model_pks).values_list('pk', flat=True)
+        }
+        return [es_id for es_id, row in self.rows.items() if row not in existing]
 
+    def __call__(self):
+        if not self.rows:
+            return
+        if ES_CLIENT is None:
+            self.rows = {}
+            return
+        es_ids = self.get_deleted_es_ids()
+        self.rows = {}
+        if not es_ids:
+            return
+        try:
+            bulk(client=ES_CLIENT, request_timeout=ES_SEARCH_TIMEOUT, actions=[{
+                '_op_type': 'delete',
+                '_index': index,
+                '_type': 'page',
+                '_id': es_id,
+            } for es_id in es_ids for index in (
+                (ES_PAGE_NAME, ES_SUGGEST_NAME) if is_suggested(es_id) else (ES_PAGE_NAME,)
+            )])
+        except Exception:
+            logger.error('Could not reach Elasticsearch server.')
+
+
+def log_deletion(sender, instance, using, **kwargs):
     # Gets the username from the request with a middleware helper
     usr = get_username()
 
-    for key, value in MODEL_TYPES.items():
-        if value == instance_type:
-            model_name = key
-
     # Creates a ReversionDifferenceLog record which is used for the "global" log
     ReversionDifferenceLog.objects.create(
         action='Deleted',
         username=usr,
         object_id=instance.pk,
         object_name=str(instance) if len(str(instance)) <= 200 else str(instance)[:200] + '...',
-        object_type=MODEL_TYPES.get(model_name, instance_type) if model_name else instance_type
+        object_type=MODEL_TYPES.get(instance._meta.label_lower, instance.__class__.__name__)
     )
 
     # ElasticSearch to also delete the index if a record was deleted
     if hasattr(instance, 'es_id'):
-        try:
-            bulk(client=ES_CLIENT , actions=[{
-                '_op_type': 'delete',
-                '_index': ES_PAGE_NAME,
-                '_type': 'page',
-                '_id': instance.es_id()
-            }])
-        except:
-            logger.error('Could not reach Elasticsearch server.')
+        ElasticSearchDeletion.add(instance, using=using)
+
+
+for model in DELETION_LOGGED_MODELS:
+    pre_delete.connect(log_deletion, sender=model, dispatch_uid='log_deletion_{}'.format(model))
+
+
+# Without Elasticsearch, the in-process fallback search index follows the changes made by this process
+if ES_CLIENT is None:
+    @receiver(post_save, sender=Region)
+    @receiver(post_save, sender=Country)
+    @receiver(post_save, sender=Event)
+    @receiver(post_save, sender=Appeal)
+    @receiver(post_save, sender=FieldReport)
+    def update_fallback_search_index(sender, instance, **kwargs):
+        transaction.on_commit(lambda: PAGE_INDEX.update(instance))
+
+    @receiver(post_delete, sender=Region)
+    @receiver(post_delete, sender=Country)
+    @receiver(post_delete, sender=Event)
+    @receiver(post_delete, sender=Appeal)
+    @receiver(post_delete, sender=FieldReport)
+    def remove_from_fallback_search_index(sender, instance, **kwargs):
+        es_id = instance.es_id()
+        transaction.on_commit(lambda: PAGE_INDEX.remove(es_id))
@@ -1,57 +1,181 @@
 import graphene
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.fields import DjangoConnectionField
 from graphene_django.types import DjangoObjectType
-from .models import Country, DisasterType, Country, ActionsTaken, Event, Appeal, FieldReport
+from graphene_django.settings import graphene_settings
+from graphql.language.ast import FragmentSpread, InlineFragment, IntValue, Variable
+from .dataloaders import batched_resolver
+from .models import Country, DisasterType, ActionsTaken, Event, Appeal, FieldReport
+
 
 # GraphQL Schemas
+# Relations are resolved through per request DataLoaders (see api.dataloaders),
+# top level fields are paginated connections (first/last, capped by RELAY_CONNECTION_MAX_LIMIT, see LimitedConnectionField)
+# Introspection fields, answered from the schema (GraphiQL, clients), are not limited by depth or cost
+INTROSPECTION_FIELDS = ('__schema', '__type')
+
+
 class CountryObjectType(DjangoObjectType):
     class Meta:
         model = Country
+        use_connection = True
 
 
 class DisasterObjectType(DjangoObjectType):
     class Meta:
         model = DisasterType
+        use_connection = True
 
 
 class EventType(DjangoObjectType):
+    dtype = graphene.Field(DisasterObjectType, resolver=batched_resolver('dtype'))
+    parent_event = graphene.Field(lambda: EventType, resolver=batched_resolver('parent_event'))
+    countries = graphene.List(CountryObjectType, resolver=batched_resolver('countries'))
+    appeals = graphene.List(lambda: AppealType, resolver=batched_resolver('appeals'))
+    field_reports = graphene.List(lambda: FieldReportType, resolver=batched_resolver('field_reports'))
+
     class Meta:
         model = Event
+        use_connection = True
 
 
 class ActionsTakenType(DjangoObjectType):
+    field_report = graphene.Field(lambda: FieldReportType, resolver=batched_resolver('field_report'))
+
     class Meta:
         model = ActionsTaken
 
 
 class AppealType(DjangoObjectType):
+    dtype = graphene.Field(DisasterObjectType, resolver=batched_resolver('dtype'))
+    event = graphene.Field(EventType, resolver=batched_resolver('event'))
+    country = graphene.Field(CountryObjectType, resolver=batched_resolver('country'))
+
     class Meta:
         model = Appeal
+        use_connection = True
 
 
 class FieldReportType(DjangoObjectType):
+    dtype = graphene.Field(DisasterObjectType, resolver=batched_resolver('dtype'))
+    event = graphene.Field(EventType, resolver=batched_resolver('event'))
+    countries = graphene.List(CountryObjectType, resolver=batched_resolver('countries'))
+    actions_taken = graphene.List(ActionsTakenType, resolver=batched_resolver('actions_taken'))
+
     class Meta:
         model = FieldReport
+        use_connection = True
+
+
+def get_selected_field_names(selection_set, fragments):
+    names = set()
+    for selection in selection_set.selections if selection_set else []:
+        if isinstance(selection, FragmentSpread):
+            names |= get_selected_field_names(fragments[selection.name.value].selection_set, fragments)
+        elif isinstance(selection, InlineFragment):
+            names |= get_selected_field_names(selection.selection_set, fragments)
+        else:
+            names.add(selection.name.value)
+    return names
+
+
+def get_node_selection_sets(info):
+    """ Selection sets of `edges { node { ... } }` in the requested connection """
+    node_selection_sets = []
+    for field_ast in info.field_asts:
+        for edges in field_ast.selection_set.selections if field_ast.selection_set else []:
+            if getattr(edges, 'name', None) is None or edges.name.value != 'edges' or not edges.selection_set:
+                continue
+            for node in edges.selection_set.selections:
+                if getattr(node, 'name', None) is not None and node.name.value == 'node':
+                    node_selection_sets.append(node.selection_set)
+    return node_selection_sets
+
+
+def optimize_queryset(queryset, info):
+    """ Only load the columns of the requested node fields (and the FK columns used by the DataLoaders) """
+    requested = set()
+    for selection_set in get_node_selection_sets(info):
+        requested |= {
+            to_snake_case(name) for name in get_selected_field_names(selection_set, info.fragments)
+        }
+    only_fields = {queryset.model._meta.pk.name}
+    for field in queryset.model._meta.concrete_fields:
+        if field.name in requested:
+            only_fields.add(field.attname if field.is_relation else field.name)
+    return queryset.only(*only_fields)
+
+
+def get_page_size(field_ast, variables):
+    for argument in field_ast.arguments:
+        if argument.name.value not in ('first', 'last'):
+            continue
+        if isinstance(argument.value, IntValue):
+            return int(argument.value.value)
+        if isinstance(argument.value, Variable) and (variables or {}).get(argument.value.name.value):
+            return int(variables[argument.value.name.value])
+    return graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+
+def get_query_depth_and_cost(selection_set, fragments, variables=None, multiplier=1):
+    """
+    Depth is the deepest field nesting, cost the number of resolved fields:
+    fields below a connection (a field with `edges`) count once per requested row (first/last, or the max limit).
+    """
+    depth, cost = 0, 0
+    for selection in selection_set.selections if selection_set else []:
+        if isinstance(selection, (FragmentSpread, InlineFragment)):
+            sub_selection_set = (
+                fragments[selection.name.value].selection_set if isinstance(selection, FragmentSpread)
+                else selection.selection_set
+            )
+            sub_depth, sub_cost = get_query_depth_and_cost(sub_selection_set, fragments, variables, multiplier)
+            depth, cost = max(depth, sub_depth), cost + sub_cost
+            continue
+        if selection.name.value in INTROSPECTION_FIELDS:
+            continue
+        field_multiplier = multiplier
+        if selection.selection_set and 'edges' in get_selected_field_names(selection.selection_set, fragments):
+            field_multiplier *= get_page_size(selection, variables)
+        sub_depth, sub_cost = get_query_depth_and_cost(selection.selection_set, fragments, variables, field_multiplier)
+        depth, cost = max(depth, sub_depth + 1), cost + multiplier + sub_cost
+    return depth, cost
+
+
+class LimitedConnectionField(DjangoConnectionField):
+    """ DjangoConnectionField returning the first RELAY_CONNECTION_MAX_LIMIT rows when queried without first/last """
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, max_limit,
+                            enforce_first_or_last, root, info, **args):
+        if max_limit and not args.get('first') and not args.get('last'):
+            args['first'] = max_limit
+        return super().connection_resolver(
+            resolver, connection, default_manager, max_limit, enforce_first_or_last, root, info, **args
+        )
 
 
 class Query(graphene.ObjectType):
-    all_countries = graphene.List(CountryObjectType)
-    all_disasters_types = graphene.List(DisasterObjectType)
-    all_events = graphene.List(EventType)
-    all_events = graphene.List(EventType)
-    all_appeals = graphene.List(AppealType)
-    all_fieldreports = graphene.List(FieldReportType)
+    all_countries = LimitedConnectionField(CountryObjectType)
+    all_disasters_types = LimitedConnectionField(DisasterObjectType)
+    all_events = LimitedConnectionField(EventType)
+    all_appeals = LimitedConnectionField(AppealType)
+    all_fieldreports = LimitedConnectionField(FieldReportType)
+
+    def resolve_all_countries(self, info, **kwargs):
+        return optimize_queryset(Country.objects.all(), info)
 
-    def resolve_all_disasters(self, info, **kwargs):
-        return DisasterType.objects.all()
+    def resolve_all_disasters_types(self, info, **kwargs):
+        return optimize_queryset(DisasterType.objects.all(), info)
 
     def resolve_all_events(self, info, **kwargs):
-        return Event.objects.select_related('dtype').all()
+        return optimize_queryset(Event.objects.all(), info)
 
     def resolve_all_appeals(self, info, **kwargs):
-        return Appeal.objects.select_related('event').select_related('country').all()
+        return optimize_queryset(Appeal.objects.all(), info)
 
     def resolve_all_fieldreports(self, info, **kwargs):
-        return FieldReport.objects.select_related('dtype').select_related('event').all()
+        return optimize_queryset(FieldReport.objects.all(), info)
 
 
 schema = graphene.Schema(query=Query)
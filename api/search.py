@@ -0,0 +1,202 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+
+from .esconnection import ES_CLIENT, ES_SEARCH_TIMEOUT
+from .fallback_search import PAGE_INDEX
+from .indexes import ES_PAGE_NAME, ES_SUGGEST_NAME
+
+
+# Without ES_HOST, the searches are answered by the in-process fallback index (api.fallback_search), uncached.
+# Results are cached shortly, the search box sends the same keywords again and again while typing
+ES_SEARCH_CACHE_KEY = 'es-search-{}'
+ES_SEARCH_CACHE_TIMEOUT = 60
+ES_SEARCH_DEFAULT_SIZE = 10
+ES_SEARCH_MAX_SIZE = 50
+# Page types shown as separate result groups by the frontend (see the indexing() of the models)
+ES_PAGE_TYPES = ('region', 'country', 'event', 'appeal', 'report')
+# Page types with typeahead suggestions (in the ES_SUGGEST_NAME index)
+ES_SUGGEST_TYPES = ('country', 'event', 'appeal')
+# A name is also suggested from its following words ("Floods" for "Kenya: Floods"), up to this many
+ES_SUGGEST_MAX_INPUTS = 5
+# id is only unique per type, (type, id) makes the sort total, as required by search_after
+ES_SEARCH_SORT = [
+    {'date': {'order': 'desc', 'missing': '_first'}},
+    '_score',
+    {'type': 'asc'},
+    {'id': 'asc'},
+]
+
+
+def normalize_keyword(phrase):
+    return ' '.join(phrase.lower().split())
+
+
+def get_search_cache_key(*args):
+    return ES_SEARCH_CACHE_KEY.format(hashlib.md5(json.dumps(args).encode('utf-8')).hexdigest())
+
+
+def clean_search_after(search_after):
+    """
+    `search_after` sent back by a client, as the sort values of ES_SEARCH_SORT: [date, _score, type, id]
+    (date in epoch milliseconds). Raises ValueError if it is not such a list.
+    """
+    if not isinstance(search_after, list) or len(search_after) != len(ES_SEARCH_SORT):
+        raise ValueError('`search_after` must be the `search_after` list of the previous page')
+    date, score, page_type, page_id = search_after
+    if any(isinstance(value, bool) or not isinstance(value, (int, float)) for value in (date, score)):
+        raise ValueError('`search_after` date and score must be numbers')
+    if not isinstance(page_type, str) or isinstance(page_id, bool) or not isinstance(page_id, (str, int)):
+        raise ValueError('`search_after` type and id must be strings')
+    return [int(date), float(score), page_type, str(page_id)]
+
+
+def get_page_query(phrase, page_type=None):
+    query = {
+        'multi_match': {
+            'query': phrase,
+            'fields': ['keyword^3', 'body']
+        }
+    }
+    if page_type is not None:
+        query = {
+            'bool': {
+                'filter': {
+                    'term': {'type': page_type}
+                },
+                'must': query
+            }
+        }
+    return query
+
+
+def get_search_body(phrase, page_type=None, size=ES_SEARCH_DEFAULT_SIZE, search_after=None):
+    body = {
+        'query': get_page_query(phrase, page_type),
+        'sort': ES_SEARCH_SORT,
+        'size': size,
+    }
+    if search_after:
+        # Deep paging: continue after the sort values of the last hit of the previous page
+        body['search_after'] = search_after
+    else:
+        body['from'] = 0
+    return body
+
+
+def with_search_after(hits):
+    # Sort values of the last hit, to be sent back as `search_after` for the next page
+    hits['search_after'] = hits['hits'][-1]['sort'] if hits['hits'] else None
+    return hits
+
+
+def search_pages(phrase, page_type=None, size=ES_SEARCH_DEFAULT_SIZE, search_after=None):
+    """ Hits of the page index for the phrase, optionally filtered by page type """
+    phrase = normalize_keyword(phrase)
+    if ES_CLIENT is None:
+        return PAGE_INDEX.search(phrase, page_type, size, search_after)
+    cache_key = get_search_cache_key('search', phrase, page_type, size, search_after)
+    hits = cache.get(cache_key)
+    if hits is None:
+        results = ES_CLIENT.search(
+            index=ES_PAGE_NAME,
+            doc_type='page',
+            body=get_search_body(phrase, page_type, size, search_after),
+            request_timeout=ES_SEARCH_TIMEOUT,
+        )
+        hits = with_search_after(results['hits'])
+        cache.set(cache_key, hits, ES_SEARCH_CACHE_TIMEOUT)
+    return hits
+
+
+def msearch_pages(phrase, page_types=ES_PAGE_TYPES, size=ES_SEARCH_DEFAULT_SIZE):
+    """ Hits per page type, all the types in one _msearch round trip """
+    phrase = normalize_keyword(phrase)
+    page_types = list(page_types)
+    if ES_CLIENT is None:
+        return {page_type: PAGE_INDEX.search(phrase, page_type, size) for page_type in page_types}
+    cache_key = get_search_cache_key('msearch', phrase, page_types, size)
+    groups = cache.get(cache_key)
+    if groups is None:
+        body = []
+        for page_type in page_types:
+            body.extend([{}, get_search_body(phrase, page_type, size)])
+        results = ES_CLIENT.msearch(index=ES_PAGE_NAME, doc_type='page', body=body, request_timeout=ES_SEARCH_TIMEOUT)
+        groups, failed = {}, False
+        for page_type, response in zip(page_types, results['responses']):
+            if 'error' in response:
+                # The other groups are still answered, but such a result is not cached
+                groups[page_type], failed = {'error': response['error']}, True
+            else:
+                groups[page_type] = with_search_after(response['hits'])
+        if not failed:
+            cache.set(cache_key, groups, ES_SEARCH_CACHE_TIMEOUT)
+    return groups
+
+
+def get_suggest_inputs(data):
+    words = (data['name'] or '').split()
+    inputs = [' '.join(words[i:]) for i in range(min(len(words), ES_SUGGEST_MAX_INPUTS))]
+    if data['keyword']:
+        inputs.append(data['keyword'])
+    return inputs
+
+
+def convert_for_suggest_bulk(record):
+    """ Bulk action (re)indexing the typeahead suggestion of a Country, Event or Appeal """
+    data = record.indexing()
+    return {
+        '_op_type': 'index',
+        '_index': ES_SUGGEST_NAME,
+        '_type': 'page',
+        '_id': record.es_id(),
+        'id': data['id'],
+        'event_id': data['event_id'],
+        'type': data['type'],
+        'name': data['name'],
+        'keyword': data['keyword'],
+        'suggest': {'input': get_suggest_inputs(data)},
+    }
+
+
+def is_suggested(es_id):
+    return es_id.split('-')[0] in ES_SUGGEST_TYPES
+
+
+def suggest_pages(phrase, page_types=None, size=ES_SEARCH_DEFAULT_SIZE):
+    """ Top typeahead suggestions for the prefix, optionally restricted to some page types """
+    phrase = normalize_keyword(phrase)
+    page_types = list(page_types) if page_types else None
+    if ES_CLIENT is None:
+        return PAGE_INDEX.suggest(phrase, page_types, size)
+    cache_key = get_search_cache_key('suggest', phrase, page_types, size)
+    suggestions = cache.get(cache_key)
+    if suggestions is None:
+        completion = {'field': 'suggest', 'size': size}
+        if page_types:
+            completion['contexts'] = {'type': page_types}
+        results = ES_CLIENT.search(
+            index=ES_SUGGEST_NAME,
+            doc_type='page',
+            body={
+                '_source': ['id', 'event_id', 'type', 'name', 'keyword'],
+                'suggest': {'page': {'prefix': phrase, 'completion': completion}},
+            },
+            request_timeout=ES_SEARCH_TIMEOUT,
+        )
+        suggestions = [
+            dict(option['_source'], text=option['text'])
+            for option in results['suggest']['page'][0]['options']
+        ]
+        cache.set(cache_key, suggestions, ES_SEARCH_CACHE_TIMEOUT)
+    return suggestions
+
+
+def get_health():
+    if ES_CLIENT is None:
+        return PAGE_INDEX.health()
+    health = ES_CLIENT.cluster.health(request_timeout=ES_SEARCH_TIMEOUT)
+    # Calls of this process (success, retry, failure, circuit_open) and the circuit state
+    health['client'] = ES_CLIENT.transport.get_stats()
+    return health
@@ -1,6 +1,7 @@
 import json
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .access import get_access_profile
 
 from lang.translation import TranslatedModelSerializerMixin
 from .models import (
@@ -290,16 +291,10 @@ class UserMeSerializer(UserSerializer):
         fields = UserSerializer.Meta.fields + ('is_admin_for_countries', 'is_admin_for_regions')
 
     def get_is_admin_for_countries(self, user):
-        return set([
-            int(permission[18:]) for permission in user.get_all_permissions()
-            if ('api.country_admin_' in permission and permission[18:].isdigit())
-        ])
+        return set(get_access_profile(user).country_ids)
 
     def get_is_admin_for_regions(self, user):
-        return set([
-            int(permission[17:]) for permission in user.get_all_permissions()
-            if ('api.region_admin_' in permission and permission[17:].isdigit())
-        ])
+        return set(get_access_profile(user).region_ids)
 
 
 class ActionSerializer(serializers.ModelSerializer):
@@ -1,14 +1,159 @@
+import hashlib
+import io
 import mimetypes
-import datetime
+import os
+import tempfile
 
 from azure.common import AzureMissingResourceHttpError
 from azure.storage.blob import BlockBlobService
 from azure.storage.blob.models import ContentSettings
 
+from django.core.cache import cache
+from django.core.files.base import File
 from django.core.files.storage import Storage
 from django.conf import settings
 from django.utils.deconstruct import deconstructible
 
+# Size of the ranged reads of AzureStorageFile
+AZURE_STORAGE_CHUNK_SIZE = 4 * 1024 * 1024
+# Properties (size, etag, modified time) of the existing blobs are memoized in the shared cache, and reset on save and delete.
+# Missing blobs are not: exists() has to see the blobs uploaded meanwhile by the other processes
+AZURE_STORAGE_PROPERTIES_CACHE_KEY = 'azure-blob-properties-{}'
+AZURE_STORAGE_PROPERTIES_CACHE_TIMEOUT = 60 * 5
+
+
+class AzureDiskCache():
+    """
+    Least recently used blobs kept on the local disk, by blob name and etag (a changed blob is a new entry).
+    The least recently read files are evicted once the cache is over max_size bytes.
+    """
+
+    def __init__(self, directory, max_size, max_file_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+
+    def get_path(self, container, name, etag):
+        key = '%s/%s/%s' % (container, name, etag)
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def get(self, container, name, etag):
+        path = self.get_path(container, name, etag)
+        try:
+            # The modified time is the recency of the LRU
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def add(self, container, name, etag, download):
+        """ Download the blob with download(path) into the cache, atomically """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.get_path(container, name, etag)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            download(temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        self.evict()
+        return path
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class AzureBlobReader(io.RawIOBase):
+    """
+    Seekable read-only stream of a blob, reading only the requested ranges (HTTP range requests).
+    Pinned to the etag of the opened blob, so a blob replaced while being read fails instead of mixing versions.
+    """
+
+    def __init__(self, service, container, name, size, etag):
+        self.service = service
+        self.container = container
+        self.name = name
+        self.size = size
+        self.etag = etag
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('Invalid whence (%s)' % whence)
+        if position < 0:
+            raise ValueError('Negative seek position %s' % position)
+        self.position = position
+        return self.position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        blob = self.service.get_blob_to_bytes(
+            container_name=self.container,
+            blob_name=self.name,
+            start_range=self.position,
+            end_range=self.position + length - 1,
+            max_connections=1,
+            if_match=self.etag,
+        )
+        length = len(blob.content)
+        buffer[:length] = blob.content
+        self.position += length
+        return length
+
+    def readall(self):
+        # By chunks, the default reads 8 KB ranges
+        chunks = []
+        while True:
+            chunk = self.read(AZURE_STORAGE_CHUNK_SIZE)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+
+class AzureStorageFile(File):
+    """ File of AzureStorage, streamed by chunks of AZURE_STORAGE_CHUNK_SIZE """
+
+    def __init__(self, reader, name):
+        super().__init__(io.BufferedReader(reader, buffer_size=AZURE_STORAGE_CHUNK_SIZE), name)
+        self.mode = 'rb'
+        self._size = reader.size
+
+    def chunks(self, chunk_size=None):
+        return super().chunks(chunk_size or AZURE_STORAGE_CHUNK_SIZE)
+
+
 @deconstructible
 class AzureStorage(Storage):
     """
@@ -20,9 +165,16 @@ class AzureStorage(Storage):
     account_key = settings.AZURE_STORAGE.get('ACCOUNT_KEY')
     cdn_host = settings.AZURE_STORAGE.get('CDN_HOST')
     use_ssl = settings.AZURE_STORAGE.get('USE_SSL')
+    # Local storage emulator (Azurite) with its development account
+    is_emulated = settings.AZURE_STORAGE.get('IS_EMULATED', False)
+    disk_cache = AzureDiskCache(
+        settings.AZURE_STORAGE.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'azure-storage-cache'),
+        settings.AZURE_STORAGE.get('CACHE_MAX_SIZE', 512 * 1024 * 1024),
+        settings.AZURE_STORAGE.get('CACHE_MAX_FILE_SIZE', 32 * 1024 * 1024),
+    )
 
     def __init__(self, account_name=None, account_key=None, container=None,
-         use_ssl=None, cdn_host=None):
+         use_ssl=None, cdn_host=None, is_emulated=None):
 
         if account_name is not None:
             self.account_name = account_name
@@ -39,13 +191,17 @@ class AzureStorage(Storage):
         if cdn_host is not None:
             self.cdn_host = cdn_host
 
+        if is_emulated is not None:
+            self.is_emulated = is_emulated
+
     def __getstate__(self):
         return dict(
             account_name=self.account_name,
             account_key=self.account_key,
             container=self.container,
             cdn_host=self.cdn_host,
-            use_ssl=self.use_ssl
+            use_ssl=self.use_ssl,
+            is_emulated=self.is_emulated
         )
 
     def _get_service(self):
@@ -53,30 +209,76 @@ class AzureStorage(Storage):
             self._blob_service = BlockBlobService(
                 account_name=self.account_name,
                 account_key=self.account_key,
-                protocol='https' if self.use_ssl else 'http'
+                protocol='https' if self.use_ssl else 'http',
+                is_emulated=self.is_emulated
             )
 
         return self._blob_service
 
+    def _get_properties_cache_key(self, name):
+        key = '%s/%s' % (self.container, name)
+        return AZURE_STORAGE_PROPERTIES_CACHE_KEY.format(hashlib.sha256(key.encode('utf-8')).hexdigest())
+
     def _get_properties(self, name):
-        return self._get_service().get_blob_properties(
-            container_name=self.container,
-            blob_name=name
-        )
+        """
+        Size, etag and last modified time of the blob (memoized),
+        raises AzureMissingResourceHttpError if missing
+        """
+        cache_key = self._get_properties_cache_key(name)
+        properties = cache.get(cache_key)
+        if properties is None:
+            try:
+                blob_properties = self._get_service().get_blob_properties(
+                    container_name=self.container,
+                    blob_name=name
+                ).properties
+            except AzureMissingResourceHttpError:
+                cache.delete(cache_key)
+                raise
+            properties = {
+                'size': blob_properties.content_length,
+                'etag': blob_properties.etag,
+                'last_modified': blob_properties.last_modified,
+            }
+            cache.set(cache_key, properties, AZURE_STORAGE_PROPERTIES_CACHE_TIMEOUT)
+        return properties
+
+    def _clear_properties(self, name):
+        cache.delete(self._get_properties_cache_key(name))
 
     def _open(self, name, mode='rb'):
         """
-        Return the AzureStorageFile.
+        Return the AzureStorageFile, the blob content is only read (by ranges) when the file is read.
+        Blobs up to disk_cache.max_file_size are read from (and first downloaded to) the local disk cache.
         """
 
-        from django.core.files.base import ContentFile
-
-        contents = self._get_service().get_blob_to_bytes(
-            container_name=self.container,
-            blob_name=name
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError('AzureStorage files can only be opened for reading')
+
+        properties = self._get_properties(name)
+        if properties['size'] <= self.disk_cache.max_file_size:
+            path = self.disk_cache.get(self.container, name, properties['etag'])
+            if path is None:
+                path = self.disk_cache.add(
+                    self.container, name, properties['etag'],
+                    lambda path: self._get_service().get_blob_to_path(
+                        container_name=self.container,
+                        blob_name=name,
+                        file_path=path,
+                        if_match=properties['etag'],
+                    )
+                )
+            try:
+                # Once open, the file stays readable if evicted
+                return File(open(path, 'rb'), name)
+            except FileNotFoundError:
+                # Evicted by another process in between, read by ranges instead
+                pass
+
+        reader = AzureBlobReader(
+            self._get_service(), self.container, name, properties['size'], properties['etag']
         )
-
-        return ContentFile(contents)
+        return AzureStorageFile(reader, name)
 
     def _save(self, name, content):
         """
@@ -111,6 +313,7 @@ class AzureStorage(Storage):
         )
 
         content.close()
+        self._clear_properties(name)
 
         return name
 
@@ -141,6 +344,7 @@ class AzureStorage(Storage):
         """
         Returns True if a file referenced by the given name already exists in
         the storage system, or False if the name is available for a new file.
+        Served from the memoized properties, only the missing blobs are asked to the service.
         """
         try:
             self._get_properties(name)
@@ -159,6 +363,7 @@ class AzureStorage(Storage):
             self._get_service().delete_blob(self.container, name)
         except AzureMissingResourceHttpError:
             pass
+        self._clear_properties(name)
 
     def get_cache_control(self, container, name, content_type):
         """
@@ -175,9 +380,7 @@ class AzureStorage(Storage):
         """
 
         try:
-            properties = self._get_properties(name)
-
-            return int(properties['content-length'])
+            return self._get_properties(name)['size']
         except AzureMissingResourceHttpError:
             pass
 
@@ -207,11 +410,6 @@ class AzureStorage(Storage):
         """
 
         try:
-            properties = self._get_properties(name)
-
-            return datetime.datetime.strptime(
-                properties['last-modified'],
-                '%a, %d %b %Y %H:%M:%S %Z'
-            )
+            return self._get_properties(name)['last_modified']
         except AzureMissingResourceHttpError:
             pass
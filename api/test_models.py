@@ -1,7 +1,17 @@
+from unittest import mock
+from datetime import timedelta
+from django.utils import timezone
+from django.db import transaction
 from django.test import TestCase
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group, Permission
+from django.core.management import call_command
 from rest_framework.test import APIRequestFactory
 from rest_framework.test import APITestCase
+import reversion
+from reversion.models import Revision
+
+from api.indexes import ES_PAGE_NAME, ES_SUGGEST_NAME
+from api.receivers import create_global_reversion_log, ElasticSearchDeletion
 
 import api.models as models
 import api.drf_views as views
@@ -50,6 +60,58 @@ class CountryTest(TestCase):
         self.assertEqual(countries.count(), 258)
 
 
+class MakePermissionsTest(TestCase):
+
+    fixtures = ['Regions', 'Countries']
+
+    def test_make_permissions(self):
+        country = models.Country.objects.first()
+        group = Group.objects.create(name='%s Admins' % country.name)
+        call_command('make_permissions')
+        self.assertEqual(
+            Permission.objects.filter(codename__startswith='country_admin_').count(), models.Country.objects.count()
+        )
+        self.assertEqual(Permission.objects.filter(codename__startswith='region_admin_').count(), 5)
+        self.assertTrue(group.permissions.filter(codename='country_admin_%s' % country.pk).exists())
+        self.assertTrue(Group.objects.get(name='IFRC Admins').permissions.filter(codename='ifrc_admin').exists())
+
+        # Nothing is missing anymore: the same few queries whatever the number of countries
+        permission_count = Permission.objects.count()
+        with self.assertNumQueries(5):
+            call_command('make_permissions')
+        self.assertEqual(Permission.objects.count(), permission_count)
+
+        call_command('make_per_missions')
+        self.assertTrue(Group.objects.get(name='PER Core Admins').permissions.filter(codename='per_core_admin').exists())
+
+
+class RevokeStaffStatusTest(TestCase):
+    def test_revoke_staff_status(self):
+        readonly = Group.objects.create(name='Read Only')
+        ifrc_admins = Group.objects.create(name='IFRC Admins')
+        User.objects.create(username='staff', email='staff@ifrc.org', is_staff=True)
+        staff_readonly = User.objects.create(username='readonly', email='readonly@ifrc.org', is_staff=True)
+        staff_readonly.groups.add(readonly)
+        admin = User.objects.create(username='admin', email='admin@IFRC.org')
+        admin.groups.add(ifrc_admins)
+        User.objects.create(username='other', email='other@example.org')
+        User.objects.create(username='upper', email='Upper@IFRC.ORG')
+        User.objects.create(username='subdomain', email='subdomain@staff.ifrc.org')
+        User.objects.create(username='noemail')
+        User.objects.create(username='super', email='super@ifrc.org', is_staff=True, is_superuser=True)
+
+        # Selected, updated and inserted in a fixed number of queries (the caches are cleared on commit)
+        with self.assertNumQueries(7):
+            call_command('revoke_staff_status')
+        self.assertEqual(
+            set(User.objects.filter(is_staff=True).values_list('username', flat=True)), {'staff', 'super'}
+        )
+        self.assertEqual(set(ifrc_admins.user_set.values_list('username', flat=True)), {'staff', 'admin', 'upper'})
+
+        call_command('revoke_staff_status')
+        self.assertEqual(ifrc_admins.user_set.count(), 3)
+
+
 class ProfileTest(TestCase):
     def setUp(self):
         user = User.objects.create(username='username', first_name='pat', last_name='smith', password='password')
@@ -106,3 +168,90 @@ class ProfileTestDepartment(TestCase):
     def test_profile_create(self):
         obj = models.Profile.objects.get(user__username='test1')
         self.assertEqual(obj.department, 'testdepartment')
+
+
+class ReversionDifferenceLogTest(TestCase):
+    def create_revision(self, comment, *objs):
+        with reversion.create_revision():
+            reversion.set_comment(comment)
+            for obj in objs:
+                obj.save()
+        revision = Revision.objects.latest('pk')
+        return revision, list(revision.version_set.all())
+
+    def test_batched_log(self):
+        country1 = models.Country.objects.create(name='Country 1')
+        country2 = models.Country.objects.create(name='Country 2')
+        revision, versions = self.create_revision('Added.', country1, country2)
+        # previous versions lookup + bulk insert
+        with self.assertNumQueries(2):
+            create_global_reversion_log(versions, revision)
+        self.assertEqual(models.ReversionDifferenceLog.objects.filter(action='Added').count(), 2)
+
+        country1.name = 'Country 1 changed'
+        revision, versions = self.create_revision('Changed name.', country1, country2)
+        with self.assertNumQueries(2):
+            create_global_reversion_log(versions, revision)
+        # country2 has no difference from its previous version
+        log = models.ReversionDifferenceLog.objects.get(action='Changed')
+        self.assertEqual(log.object_id, str(country1.pk))
+        self.assertEqual(log.changed_from, ['name: Country 1'])
+        self.assertEqual(log.changed_to, ['name: Country 1 changed'])
+
+    def test_deletion_log(self):
+        events = [models.Event.objects.create(name='Event %s' % i) for i in range(3)]
+        es_ids = [event.es_id() for event in events]
+        models.CronJob.objects.create(name='rotated')
+        kept = models.Event.objects.create(name='Kept')
+        # Left by the other tests (never committed)
+        ElasticSearchDeletion.get_pending().rows = {}
+        with transaction.atomic():
+            for event in events:
+                event.delete()
+            models.CronJob.objects.all().delete()
+            try:
+                with transaction.atomic():
+                    kept.delete()
+                    raise ValueError('rolled back')
+            except ValueError:
+                pass
+        es_deletion = ElasticSearchDeletion.get_pending()
+
+        self.assertEqual(
+            list(models.ReversionDifferenceLog.objects.filter(action='Deleted').values_list('object_type', flat=True)),
+            ['Emergency'] * 3,
+        )
+        # One bulk request for the whole transaction, the next on_commit calls have nothing left to send
+        with mock.patch('api.receivers.ES_CLIENT'), mock.patch('api.receivers.bulk') as bulk:
+            es_deletion()
+            es_deletion()
+        self.assertEqual(bulk.call_count, 1)
+        # Events are removed from the page and the suggestion indices
+        self.assertEqual(
+            [(action['_index'], action['_id']) for action in bulk.call_args[1]['actions']],
+            [(index, es_id) for es_id in es_ids for index in (ES_PAGE_NAME, ES_SUGGEST_NAME)],
+        )
+
+
+class CronJobLogBufferTest(TestCase):
+    def test_buffered_log(self):
+        old = models.CronJob.objects.create(name='job1', status=0)
+        models.CronJob.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=5))
+
+        with models.CronJobLogBuffer():
+            with self.assertNumQueries(0):
+                for i in range(10):
+                    models.CronJob.sync_cron({'name': 'job%s' % (i % 2), 'message': 'Done', 'status': 0})
+            # One rotation delete and one insert for the whole run
+            with self.assertNumQueries(2):
+                models.CronJobLogBuffer.get_current().flush()
+            models.CronJob.sync_cron({'name': 'job1', 'message': 'Error', 'status': 2})
+
+        self.assertFalse(models.CronJob.objects.filter(pk=old.pk).exists())
+        self.assertEqual(models.CronJob.objects.filter(name='job0').count(), 5)
+        self.assertEqual(models.CronJob.objects.filter(name='job1').count(), 6)
+        self.assertIsNone(models.CronJobLogBuffer.get_current())
+
+        # Without a buffer rows are written right away
+        errors, created = models.CronJob.sync_cron({'name': 'job2', 'message': 'Done', 'status': 0})
+        self.assertIsNotNone(created[0].pk)
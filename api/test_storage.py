@@ -0,0 +1,144 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock
+
+from azure.common import AzureMissingResourceHttpError
+from azure.storage.blob.models import Blob, BlobProperties
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+import api.storage as storage
+
+
+class FakeBlobService():
+    """ In memory stand-in for the blob service (like Azurite), serving ranged gets """
+
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.calls = []
+
+    def get_etag(self, content):
+        return '"etag-%s"' % hash(content)
+
+    def get_blob_properties(self, container_name, blob_name, **kwargs):
+        self.calls.append(('properties', blob_name))
+        if blob_name not in self.blobs:
+            raise AzureMissingResourceHttpError('Not found', 404)
+        properties = BlobProperties()
+        properties.content_length = len(self.blobs[blob_name])
+        properties.etag = self.get_etag(self.blobs[blob_name])
+        properties.last_modified = datetime(2020, 7, 1)
+        return Blob(blob_name, props=properties)
+
+    def get_blob_to_bytes(self, container_name, blob_name, start_range=None, end_range=None, if_match=None, **kwargs):
+        content = self.blobs[blob_name]
+        assert if_match == self.get_etag(content)
+        self.calls.append(('range', blob_name, start_range, end_range))
+        return Blob(blob_name, content=content[start_range:end_range + 1])
+
+    def get_blob_to_path(self, container_name, blob_name, file_path, if_match=None, **kwargs):
+        content = self.blobs[blob_name]
+        assert if_match == self.get_etag(content)
+        self.calls.append(('download', blob_name))
+        with open(file_path, 'wb') as f:
+            f.write(content)
+
+    def delete_blob(self, container_name, blob_name):
+        self.blobs.pop(blob_name)
+
+    def create_blob_from_stream(self, container_name, blob_name, stream, **kwargs):
+        self.blobs[blob_name] = stream.read()
+
+
+class AzureStorageTest(TestCase):
+    def setUp(self):
+        # The memoized properties outlive the test transactions
+        cache.clear()
+        self.content = bytes(range(256)) * 40  # 10 KB
+        self.service = FakeBlobService({'documents/report.pdf': self.content})
+        self.storage = storage.AzureStorage(account_name='devstoreaccount1', account_key='key', container='api')
+        self.storage._blob_service = self.service
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.storage.disk_cache = storage.AzureDiskCache(self.cache_dir.name, max_size=25000, max_file_size=20000)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    @mock.patch('api.storage.AZURE_STORAGE_CHUNK_SIZE', 4096)
+    def test_streamed_open(self):
+        # Larger than the files kept in the disk cache
+        self.storage.disk_cache.max_file_size = 0
+        f = self.storage.open('documents/report.pdf')
+        self.assertEqual(f.size, len(self.content))
+        # Nothing is downloaded before reading
+        self.assertEqual(self.service.calls, [('properties', 'documents/report.pdf')])
+        self.assertEqual(f.read(10), self.content[:10])
+        self.assertEqual(self.service.calls[-1], ('range', 'documents/report.pdf', 0, 4095))
+
+        f.seek(8000)
+        self.assertEqual(f.read(100), self.content[8000:8100])
+        # Up to the end of the blob
+        self.assertEqual(self.service.calls[-1], ('range', 'documents/report.pdf', 8000, len(self.content) - 1))
+
+        chunks = list(f.chunks())
+        self.assertEqual(b''.join(chunks), self.content)
+        self.assertEqual([len(chunk) for chunk in chunks], [4096, 4096, 2048])
+
+        f.seek(0)
+        self.assertEqual(f.read(), self.content)
+        f.close()
+
+        with self.assertRaises(AzureMissingResourceHttpError):
+            self.storage.open('documents/missing.pdf')
+        with self.assertRaises(ValueError):
+            self.storage.open('documents/report.pdf', 'wb')
+
+    def test_disk_cache(self):
+        for _ in range(2):
+            with self.storage.open('documents/report.pdf') as f:
+                self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.storage.size('documents/report.pdf'), len(self.content))
+        self.assertEqual(self.storage.modified_time('documents/report.pdf'), datetime(2020, 7, 1))
+        # Downloaded once, the properties are memoized
+        self.assertEqual(self.service.calls, [('properties', 'documents/report.pdf'), ('download', 'documents/report.pdf')])
+
+        # A new version is a new cache entry, the least recently used file is evicted past max_size
+        self.storage.delete('documents/report.pdf')
+        self.storage.save('documents/report.pdf', ContentFile(b'new version'))
+        with self.storage.open('documents/report.pdf') as f:
+            self.assertEqual(f.read(), b'new version')
+        self.service.blobs['documents/other.pdf'] = bytes(15000)
+        os.utime(self.storage.disk_cache.get_path('api', 'documents/report.pdf', self.service.get_etag(self.content)), (0, 0))
+        with self.storage.open('documents/other.pdf') as f:
+            self.assertEqual(len(f.read()), 15000)
+        self.assertEqual(len(os.listdir(self.cache_dir.name)), 2)
+        self.assertIsNone(self.storage.disk_cache.get('api', 'documents/report.pdf', self.service.get_etag(self.content)))
+
+    def test_exists(self):
+        # Missing blobs are not memoized, a blob uploaded by another process is seen at once
+        self.assertFalse(self.storage.exists('documents/new.pdf'))
+        self.service.blobs['documents/new.pdf'] = b'uploaded elsewhere'
+        self.assertTrue(self.storage.exists('documents/new.pdf'))
+        self.assertEqual(self.storage.get_available_name('documents/report.pdf')[:17], 'documents/report_')
+
+        # exists() is served from the memoized properties, reset by save and delete
+        with self.storage.open('documents/report.pdf') as f:
+            self.assertEqual(f.read(), self.content)
+        calls = len(self.service.calls)
+        self.assertTrue(self.storage.exists('documents/report.pdf'))
+        self.assertEqual(len(self.service.calls), calls)
+        self.storage.delete('documents/report.pdf')
+        self.assertFalse(self.storage.exists('documents/report.pdf'))
+        with self.assertRaises(AzureMissingResourceHttpError):
+            self.storage.open('documents/report.pdf')
+        self.storage.save('documents/report.pdf', ContentFile(b'new version'))
+        self.assertTrue(self.storage.exists('documents/report.pdf'))
+
+    def test_evicted_meanwhile(self):
+        # The cached file is evicted by another process between the lookup and the open
+        with mock.patch.object(self.storage.disk_cache, 'get', return_value=os.path.join(self.cache_dir.name, 'evicted')):
+            with self.storage.open('documents/report.pdf') as f:
+                self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.service.calls[-1], ('range', 'documents/report.pdf', 0, len(self.content) - 1))
@@ -1,11 +1,26 @@
 import json
+from unittest import mock
 from datetime import datetime
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from django.contrib.contenttypes.models import ContentType
-from django.contrib.auth.models import User, Permission
+from django.contrib.auth.models import User, Group, Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
+from rest_framework.authtoken.models import Token
 import api.models as models
 import api.drf_views as views
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionTimeout, NotFoundError, TransportError
+from graphql.utils.introspection_query import introspection_query
+from api.access import check_shared_cache
+from api.authentication import CachedTokenAuthentication
+from api.esconnection import CircuitOpenError, ResilientTransport
+from api.fallback_search import FALLBACK_INDEX_TIMEOUT, PAGE_INDEX
+from api.indexes import SuggestMapping
+from api.search import convert_for_suggest_bulk
 
 
 class AuthTokenTest(APITestCase):
@@ -25,6 +40,49 @@ class AuthTokenTest(APITestCase):
         self.assertIsNotNone(response.get('token'))
         self.assertIsNotNone(response.get('expires'))
 
+    def test_cached_token_auth(self):
+        user = User.objects.get(username='jo')
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(token.key))
+        self.assertEqual(self.client.get('/api/v2/user/me/').json()['username'], 'jo')
+        # Token and user come from the cache, the queries left are the serializer's (profile, subscriptions...)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v2/user/me/')
+        self.assertEqual(response.json()['username'], 'jo')
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'authtoken_token' in query['sql'] or 'FROM "auth_user"' in query['sql']
+        ])
+        # A cache hit does not touch the database at all
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedTokenAuthentication().authenticate_credentials(token.key), (user, token))
+
+        # Deactivating the user clears the cached token
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get('/api/v2/user/me/').status_code, 401)
+        user.is_active = True
+        user.save()
+        self.assertEqual(self.client.get('/api/v2/user/me/').status_code, 200)
+
+        # Tokens expire 7 days after they were (re)created
+        Token.objects.filter(pk=token.pk).update(created=timezone.now() - timedelta(days=8))
+        self.assertEqual(self.client.get('/api/v2/user/me/').status_code, 200)  # still cached
+        token.created = timezone.now() - timedelta(days=8)
+        token.save()
+        response = self.client.get('/api/v2/user/me/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['detail'], 'Token has expired.')
+
+        # A new login resets the token
+        response = self.client.post('/get_auth_token', {'username': 'jo', 'password': '12345678'}, format='json')
+        self.assertEqual(response.json()['token'], token.key)
+        self.assertEqual(self.client.get('/api/v2/user/me/').status_code, 200)
+
+        # Deleted token
+        token.delete()
+        self.assertEqual(self.client.get('/api/v2/user/me/').status_code, 401)
+
 
 class SituationReportTypeTest(APITestCase):
 
@@ -181,6 +239,45 @@ class VisibilityTest(APITestCase):
 
         self.client.force_authenticate(user=None)
 
+    def test_access_profile_cache(self):
+        country = models.Country.objects.create(name='1')
+        models.CountrySnippet.objects.create(country=country, visibility=models.VisibilityChoices.MEMBERSHIP)
+        models.CountrySnippet.objects.create(country=country, visibility=models.VisibilityChoices.IFRC)
+        user = User.objects.create(username='foo')
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(token.key))
+        self.assertEqual(self.client.get('/api/v2/country_snippet/').json()['count'], 1)
+        # The access profile is cached, no permission queries
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/v2/country_snippet/').json()['count'], 1)
+        self.assertFalse([q for q in queries.captured_queries if 'auth_permission' in q['sql']])
+
+        # Granted through a group, each m2m change resets the profile
+        ifrc_permission = Permission.objects.create(
+            codename='ifrc_admin',
+            name='IFRC Admin',
+            content_type=ContentType.objects.get_for_model(models.Country),
+        )
+        group = Group.objects.create(name='IFRC')
+        group.user_set.add(user)
+        self.assertEqual(self.client.get('/api/v2/country_snippet/').json()['count'], 1)
+        group.permissions.add(ifrc_permission)
+        self.assertEqual(self.client.get('/api/v2/country_snippet/').json()['count'], 2)
+        user.groups.clear()
+        self.assertEqual(self.client.get('/api/v2/country_snippet/').json()['count'], 1)
+        user.user_permissions.add(ifrc_permission)
+        self.assertEqual(self.client.get('/api/v2/country_snippet/').json()['count'], 2)
+        ifrc_permission.delete()
+        self.assertEqual(self.client.get('/api/v2/country_snippet/').json()['count'], 1)
+        self.client.credentials()
+
+    def test_shared_cache_check(self):
+        # Tests and local development run without MEMCACHED_LOCATION
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['api.W001'])
+        memcached = {'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache'}}
+        with override_settings(CACHES=memcached):
+            self.assertEqual(check_shared_cache(None), [])
+
 
 # class FieldReportsVisibilityTestCase(APITestCase):
 #     fixtures = ['DisasterTypes',]
@@ -280,3 +377,293 @@ class ActionTestCase(APITestCase):
         res2 = response['results'][1]
         self.assertEqual(res2['organizations'], [])
         self.assertEqual(res2['field_report_types'], [EARLY_WARNING])
+
+
+class GraphQLTest(APITestCase):
+    def setUp(self):
+        dtype = models.DisasterType.objects.create(name='dtype1', summary='foo')
+        region = models.Region.objects.create(name=1)
+        countries = [models.Country.objects.create(name='GraphQL country %s' % i, region=region) for i in range(2)]
+        for i in range(5):
+            event = models.Event.objects.create(name='GraphQL event %s' % i, dtype=dtype)
+            event.countries.set(countries)
+            models.Appeal.objects.create(aid='graphql-%s' % i, name='Appeal', event=event, dtype=dtype, country=countries[0])
+            field_report = models.FieldReport.objects.create(summary='Report %s' % i, event=event, dtype=dtype)
+            field_report.countries.set(countries)
+
+    def query(self, query, variables=None):
+        return self.client.post(
+            '/api/v1/graphql/', json.dumps({'query': query, 'variables': variables}), content_type='application/json',
+        )
+
+    def test_batched_connection(self):
+        query = '''
+            query ($first: Int) {
+                allEvents(first: $first) {
+                    edges { node { id name dtype { name } countries { name } appeals { aid country { name } }
+                                   fieldReports { summary countries { name } } } }
+                }
+            }
+        '''
+        # count, events, then one query per relation: dtype, countries, appeals, appeal countries,
+        # field reports and field report countries
+        with self.assertNumQueries(8):
+            response = self.query(query, {'first': 3})
+        self.assertEqual(response.status_code, 200)
+        edges = response.json()['data']['allEvents']['edges']
+        self.assertEqual(len(edges), 3)
+        for edge in edges:
+            self.assertEqual(edge['node']['dtype']['name'], 'dtype1')
+            self.assertEqual(len(edge['node']['countries']), 2)
+            self.assertEqual(edge['node']['appeals'][0]['country']['name'], 'GraphQL country 0')
+            self.assertEqual(len(edge['node']['fieldReports'][0]['countries']), 2)
+
+    def test_only_selected_columns(self):
+        query = '{ allAppeals(first: 2) { edges { node { aid event { name } } } } }'
+        with self.assertNumQueries(3) as queries:
+            response = self.query(query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']['allAppeals']['edges']), 2)
+        appeal_sql = queries.captured_queries[1]['sql']
+        self.assertIn('"api_appeal"."event_id"', appeal_sql)
+        self.assertNotIn('"api_appeal"."amount_requested"', appeal_sql)
+
+    def test_limits(self):
+        response = self.query('{ allEvents(first: 1000) { edges { node { id } } } }')
+        self.assertIn('exceeds the `first` limit', response.json()['errors'][0]['message'])
+
+        deep = (
+            '{ allAppeals(first: 1) { edges { node { event { appeals { event { appeals { event '
+            '{ parentEvent { parentEvent { name } } } } } } } } } } }'
+        )
+        response = self.query(deep)
+        self.assertIn('Query depth', response.json()['errors'][0]['message'])
+
+        fields = ' '.join(['name', 'summary', 'glide', 'createdAt'] * 30)
+        response = self.query('{ allEvents(first: 100) { edges { node { %s } } } }' % fields)
+        self.assertIn('Query cost', response.json()['errors'][0]['message'])
+
+    def test_default_page_size(self):
+        dtype = models.DisasterType.objects.get(name='dtype1')
+        models.Event.objects.bulk_create([
+            models.Event(name='Event %s' % i, dtype=dtype, disaster_start_date=timezone.now()) for i in range(100)
+        ])
+        # Without first/last, the connection is still capped to RELAY_CONNECTION_MAX_LIMIT (100)
+        response = self.query('{ allEvents { edges { node { id } } } }')
+        self.assertEqual(len(response.json()['data']['allEvents']['edges']), 100)
+
+    def test_introspection(self):
+        # Deeper than GRAPHQL_MAX_QUERY_DEPTH, but only the schema is read
+        response = self.query(introspection_query)
+        self.assertNotIn('errors', response.json())
+        self.assertEqual(response.json()['data']['__schema']['queryType']['name'], 'Query')
+
+
+class EsPageSearchTest(APITestCase):
+    def get_hits(self, *ids):
+        return {'total': len(ids), 'max_score': None, 'hits': [
+            {'_id': 'event-%s' % i, '_source': {'id': i}, 'sort': [1593561600000, 1.0, 'event', str(i)]} for i in ids
+        ]}
+
+    @mock.patch('api.search.ES_CLIENT')
+    def test_search_cache_and_paging(self, es_client):
+        es_client.search.return_value = {'hits': self.get_hits(1, 2)}
+        response = self.client.get('/api/v1/es_search/', {'keyword': 'Flood ', 'type': 'event', 'size': 2}).json()
+        self.assertEqual(response['search_after'], [1593561600000, 1.0, 'event', '2'])
+        body = es_client.search.call_args[1]['body']
+        self.assertEqual(body['size'], 2)
+        self.assertEqual(body['query']['bool']['filter'], {'term': {'type': 'event'}})
+        # Same normalized keyword and type, served from cache
+        self.client.get('/api/v1/es_search/', {'keyword': ' flood', 'type': 'event', 'size': 2})
+        self.assertEqual(es_client.search.call_count, 1)
+
+        es_client.search.return_value = {'hits': self.get_hits()}
+        response = self.client.get('/api/v1/es_search/', {
+            'keyword': 'flood', 'type': 'event', 'size': 2, 'search_after': json.dumps(response['search_after']),
+        }).json()
+        self.assertIsNone(response['search_after'])
+        body = es_client.search.call_args[1]['body']
+        self.assertEqual(body['search_after'], [1593561600000, 1.0, 'event', '2'])
+        self.assertNotIn('from', body)
+
+        for search_after in ('[1]', 'x', '[null, 1.0, "event", "2"]', '["1", 1.0, "event", "2"]', '[1, 1.0, 2, "2"]'):
+            response = self.client.get('/api/v1/es_search/', {'keyword': 'x', 'search_after': search_after})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/es_search/', {'keyword': 'x', 'size': 500}).status_code, 400)
+
+    @mock.patch('api.search.ES_CLIENT')
+    def test_msearch(self, es_client):
+        es_client.msearch.return_value = {'responses': [{'hits': self.get_hits(1)}, {'hits': self.get_hits()}]}
+        response = self.client.get('/api/v1/es_msearch/', {'keyword': 'flood', 'types': 'event,appeal'}).json()
+        self.assertEqual(es_client.msearch.call_count, 1)
+        self.assertEqual(len(es_client.msearch.call_args[1]['body']), 4)
+        self.assertEqual(response['event']['total'], 1)
+        self.assertEqual(response['appeal']['total'], 0)
+        self.assertEqual(self.client.get('/api/v1/es_msearch/', {'keyword': 'x', 'types': 'user'}).status_code, 400)
+
+    @mock.patch('api.search.ES_CLIENT')
+    def test_suggest(self, es_client):
+        es_client.search.return_value = {'suggest': {'page': [{'text': 'ken', 'options': [{
+            'text': 'Kenya: Floods', '_id': 'event-1',
+            '_source': {'id': 1, 'event_id': 1, 'type': 'event', 'name': 'Kenya: Floods', 'keyword': None},
+        }]}]}}
+        response = self.client.get('/api/v1/es_suggest/', {'keyword': 'Ken', 'type': 'event,appeal', 'size': 5}).json()
+        self.assertEqual(response['suggestions'][0]['name'], 'Kenya: Floods')
+        completion = es_client.search.call_args[1]['body']['suggest']['page']['completion']
+        self.assertEqual(completion['contexts'], {'type': ['event', 'appeal']})
+        self.assertEqual(completion['size'], 5)
+        self.assertEqual(self.client.get('/api/v1/es_suggest/', {'keyword': 'x', 'type': 'report'}).status_code, 400)
+
+        event = models.Event.objects.create(name='Kenya: Floods', disaster_start_date=timezone.now())
+        action = convert_for_suggest_bulk(event)
+        self.assertEqual(action['_id'], 'event-%s' % event.pk)
+        self.assertEqual(action['suggest'], {'input': ['Kenya: Floods', 'Floods']})
+
+    @mock.patch('api.search.ES_CLIENT')
+    def test_unavailable(self, es_client):
+        es_client.search.side_effect = CircuitOpenError('N/A', 'Elasticsearch circuit is open', None)
+        self.assertEqual(self.client.get('/api/v1/es_search/', {'keyword': 'unavailable'}).status_code, 503)
+
+
+class ResilientTransportTest(TestCase):
+    @mock.patch('elasticsearch.Transport.perform_request')
+    def test_retry_and_circuit(self, perform_request):
+        transport = Elasticsearch(
+            ['localhost:9200'], transport_class=ResilientTransport, max_call_retries=2, retry_backoff=0, circuit_threshold=2,
+        ).transport
+        perform_request.side_effect = [TransportError(503, 'unavailable'), TransportError(429, 'too many'), {'ok': 1}]
+        self.assertEqual(transport.perform_request('GET', '/'), {'ok': 1})
+        self.assertEqual(perform_request.call_count, 3)
+
+        # Not retried, the cluster answered
+        perform_request.side_effect = NotFoundError(404, 'not found')
+        with self.assertRaises(NotFoundError):
+            transport.perform_request('GET', '/missing')
+        self.assertEqual(perform_request.call_count, 4)
+
+        # Timeouts are not retried. Two failed calls open the circuit, the next ones fail without calling Elasticsearch
+        perform_request.side_effect = ConnectionTimeout('TIMEOUT', 'timed out', None)
+        for _ in range(2):
+            with self.assertRaises(ConnectionTimeout):
+                transport.perform_request('GET', '/')
+        self.assertEqual(perform_request.call_count, 6)
+        with self.assertRaises(CircuitOpenError):
+            transport.perform_request('GET', '/')
+        self.assertEqual(perform_request.call_count, 6)
+        self.assertEqual(transport.get_stats(), {
+            'success': 2, 'retry': 2, 'failure': 2, 'circuit_open': 1, 'circuit': 'open',
+        })
+
+        # Tried again after circuit_reset
+        transport.opened_at -= transport.circuit_reset
+        perform_request.side_effect = None
+        perform_request.return_value = {'ok': 1}
+        self.assertEqual(transport.perform_request('GET', '/'), {'ok': 1})
+        self.assertEqual(transport.get_stats()['circuit'], 'closed')
+
+    @mock.patch('elasticsearch.Transport.perform_request')
+    def test_retry_params(self, perform_request):
+        transport = Elasticsearch(['localhost:9200'], transport_class=ResilientTransport, retry_backoff=0).transport
+        request_timeouts = []
+
+        def pop_params(method, url, headers=None, params=None, body=None):
+            # As Transport.perform_request does
+            request_timeouts.append(params.pop('request_timeout', None))
+            params.pop('ignore', None)
+            if len(request_timeouts) < 3:
+                raise TransportError(503, 'unavailable')
+            return {'ok': 1}
+
+        perform_request.side_effect = pop_params
+        params = {'request_timeout': 3, 'ignore': 404}
+        self.assertEqual(transport.perform_request('GET', '/', params=params), {'ok': 1})
+        # Every attempt has the search timeout, not the default one
+        self.assertEqual(request_timeouts, [3, 3, 3])
+        self.assertEqual(params, {'request_timeout': 3, 'ignore': 404})
+
+
+class FallbackSearchTest(APITestCase):
+    """ Without ES_HOST (as in these tests) the searches are answered by the in-process index """
+    def setUp(self):
+        PAGE_INDEX.built_at = None
+        self.country = models.Country.objects.create(name='Kenya', society_name='Kenya Red Cross Society')
+        self.event = models.Event.objects.create(name='Kenya: Floods', disaster_start_date=timezone.now())
+        self.event.countries.add(self.country)
+        self.appeal = models.Appeal.objects.create(
+            aid='1', name='Floods appeal', code='MDRKE042', event=self.event, country=self.country,
+            start_date=timezone.now() - timedelta(days=1),
+        )
+
+    def test_search(self):
+        response = self.client.get('/api/v1/es_search/', {'keyword': 'flood'}).json()
+        # Sorted by date desc, missing dates first
+        self.assertEqual([hit['_id'] for hit in response['hits']], [
+            'event-%s' % self.event.pk, 'appeal-%s' % self.appeal.pk,
+        ])
+        response = self.client.get('/api/v1/es_search/', {'keyword': 'kenya red', 'type': 'country'}).json()
+        self.assertEqual([hit['_id'] for hit in response['hits']], ['country-%s' % self.country.pk])
+        # Keyword (appeal code) match
+        response = self.client.get('/api/v1/es_search/', {'keyword': 'mdrke042'}).json()
+        self.assertEqual(response['hits'][0]['_id'], 'appeal-%s' % self.appeal.pk)
+
+        # Paging
+        response = self.client.get('/api/v1/es_search/', {'keyword': 'kenya', 'size': 1}).json()
+        self.assertEqual(response['total'], 3)
+        es_ids = [response['hits'][0]['_id']]
+        while response['search_after']:
+            response = self.client.get('/api/v1/es_search/', {
+                'keyword': 'kenya', 'size': 1, 'search_after': json.dumps(response['search_after']),
+            }).json()
+            es_ids += [hit['_id'] for hit in response['hits']]
+        self.assertEqual(len(set(es_ids)), 3)
+        # Compared with the sort values of the hits, not to be a TypeError
+        response = self.client.get('/api/v1/es_search/', {'keyword': 'kenya', 'search_after': '["x", null, "event", "1"]'})
+        self.assertEqual(response.status_code, 400)
+        # Changes made by the other processes are only seen once the index is rebuilt
+        fallback = self.client.get('/api/v1/es_search/', {'keyword': 'kenya'}).json()['fallback']
+        self.assertEqual(fallback['max_staleness'], FALLBACK_INDEX_TIMEOUT)
+        self.assertIsNotNone(fallback['built_at'])
+
+        response = self.client.get('/api/v1/es_msearch/', {'keyword': 'floods', 'types': 'event,report'}).json()
+        self.assertEqual(response['event']['total'], 1)
+        self.assertEqual(response['report']['total'], 0)
+        self.assertEqual(self.client.get('/api/v1/es_health/').json()['number_of_documents'], 3)
+
+    def test_suggest_code_prefix(self):
+        models.Appeal.objects.create(aid='2', name='Drought appeal', code='MDRKE043', event=self.event, country=self.country)
+        # Digits are kept (as by the `suggest` analyzer of the suggest index)
+        self.assertEqual(SuggestMapping['properties']['suggest']['analyzer'], 'suggest')
+        response = self.client.get('/api/v1/es_suggest/', {'keyword': 'MDRKE042'}).json()
+        self.assertEqual([(s['id'], s['text']) for s in response['suggestions']], [(self.appeal.pk, 'MDRKE042')])
+        response = self.client.get('/api/v1/es_suggest/', {'keyword': 'mdrke04'}).json()
+        self.assertEqual(len(response['suggestions']), 2)
+
+    def test_suggest_and_update(self):
+        response = self.client.get('/api/v1/es_suggest/', {'keyword': 'flo'}).json()
+        self.assertEqual({s['id'] for s in response['suggestions']}, {self.event.pk, self.appeal.pk})
+        response = self.client.get('/api/v1/es_suggest/', {'keyword': 'flo', 'type': 'appeal'}).json()
+        self.assertEqual([s['text'] for s in response['suggestions']], ['Floods appeal'])
+
+        # Incremental updates (run on commit by the api.receivers)
+        self.event.name = 'Kenya: Drought'
+        self.event.save()
+        PAGE_INDEX.update(self.event)
+        PAGE_INDEX.remove(self.appeal.es_id())
+        self.assertEqual(self.client.get('/api/v1/es_search/', {'keyword': 'floods'}).json()['total'], 0)
+        self.assertEqual(self.client.get('/api/v1/es_search/', {'keyword': 'drought'}).json()['total'], 1)
+        self.assertEqual(self.client.get('/api/v1/es_suggest/', {'keyword': 'flo'}).json()['suggestions'], [])
+
+    def test_build(self):
+        dtype = models.DisasterType.objects.create(name='Flood', summary='')
+        field_report = models.FieldReport.objects.create(summary='Floods report', event=self.event, dtype=dtype)
+        field_report.countries.add(self.country)
+        # One query per model, and one per prefetched countries
+        with self.assertNumQueries(7):
+            PAGE_INDEX.build()
+        self.assertIn('Kenya', PAGE_INDEX.docs[field_report.es_id()]['body'])
+
+        # While another thread rebuilds, the stale index is served
+        PAGE_INDEX.built_at -= FALLBACK_INDEX_TIMEOUT + 1
+        with PAGE_INDEX.build_lock, mock.patch.object(PAGE_INDEX, 'build') as build:
+            self.assertEqual(self.client.get('/api/v1/es_search/', {'keyword': 'floods'}).json()['total'], 3)
+        build.assert_not_called()
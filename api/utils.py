@@ -1,6 +1,7 @@
 import base64
 from django.utils.translation import ugettext
 from django.core.exceptions import ValidationError
+from .access import get_access_profile
 # from .models import VisibilityChoices
 
 
@@ -40,9 +41,7 @@ def validate_slug_number(value):
 
 def is_user_ifrc(user):
     """ Checks if the user has IFRC Admin or superuser permissions """
-    if user.has_perm('api.ifrc_admin') or user.is_superuser:
-        return True
-    return False
+    return get_access_profile(user).is_ifrc
 
 # FIXME: not usable because of circular dependency
 # def filter_visibility_by_auth(user, visibility_model_class):
@@ -2,9 +2,9 @@ import json
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import authentication, permissions
+from rest_framework import permissions
 
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -18,11 +18,23 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.utils.crypto import get_random_string
 from django.template.loader import render_to_string
 
+from django.conf import settings
+from elasticsearch.exceptions import TransportError
+from graphene_django.views import GraphQLView
+from graphql.error import GraphQLError
+from graphql.language.ast import FragmentDefinition
+from graphql.utils.get_operation_ast import get_operation_ast
+
 from rest_framework.authtoken.models import Token
+from .authentication import CachedTokenAuthentication, TOKEN_EXPIRY, get_token_user
+from .logger import logger
 from .utils import pretty_request
-from .esconnection import ES_CLIENT
 from .models import Appeal, Event, FieldReport, CronJob
-from .indexes import ES_PAGE_NAME
+from .schema import get_query_depth_and_cost
+from .search import (
+    ES_PAGE_TYPES, ES_SEARCH_DEFAULT_SIZE, ES_SEARCH_MAX_SIZE, ES_SUGGEST_TYPES,
+    clean_search_after, get_health, search_pages, msearch_pages, suggest_pages,
+)
 from deployments.models import Heop
 from notifications.models import Subscription
 from notifications.notification import send_notification
@@ -41,6 +53,13 @@ def bad_http_request(header, message):
     return HttpResponse('<h2>%s</h2><p>%s</p>' % (header, message), status=400)
 
 
+def service_unavailable(message):
+    return JsonResponse({
+        'statusCode': 503,
+        'error_message': message
+    }, status=503)
+
+
 def unauthorized(message='You must be logged in'):
     return JsonResponse({
         'statusCode': 401,
@@ -49,7 +68,7 @@ def unauthorized(message='You must be logged in'):
 
 
 class UpdateSubscriptionPreferences(APIView):
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permissions_classes = (permissions.IsAuthenticated,)
 
     def post(self, request):
@@ -63,7 +82,7 @@ class UpdateSubscriptionPreferences(APIView):
 
 
 class AddSubscription(APIView):
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permissions_classes = (permissions.IsAuthenticated,)
 
     def post(self, request):
@@ -78,7 +97,7 @@ class AddSubscription(APIView):
 
 
 class DelSubscription(APIView):
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permissions_classes = (permissions.IsAuthenticated,)
 
     def post(self, request):
@@ -101,54 +120,92 @@ class PublicJsonRequestView(View):
         return self.handle_get(request, *args, **kwargs)
 
 
-class EsPageHealth(PublicJsonRequestView):
+class EsRequestView(PublicJsonRequestView):
+    """ Elasticsearch being slow or down (see api.esconnection.ResilientTransport) is answered with a 503 """
+    def get(self, request, *args, **kwargs):
+        try:
+            return super().get(request, *args, **kwargs)
+        except TransportError as e:
+            logger.error('Elasticsearch request failed: %s' % str(e)[:512])
+            return service_unavailable('Search is temporarily unavailable')
+
+
+class EsPageHealth(EsRequestView):
     def handle_get(self, request, *args, **kwargs):
-        health = ES_CLIENT.cluster.health()
-        return JsonResponse(health)
+        return JsonResponse(get_health())
+
+
+def get_search_size(request):
+    size = request.GET.get('size', None)
+    if size is None:
+        return ES_SEARCH_DEFAULT_SIZE
+    if not size.isdigit() or not 0 < int(size) <= ES_SEARCH_MAX_SIZE:
+        raise ValueError('`size` must be a number between 1 and %s' % ES_SEARCH_MAX_SIZE)
+    return int(size)
 
 
-class EsPageSearch(PublicJsonRequestView):
+class EsPageSearch(EsRequestView):
+    """
+    `search_after`: JSON list of the sort values of the last hit of the previous page
+    (`search_after` of the previous response)
+    """
     def handle_get(self, request, *args, **kwargs):
         page_type = request.GET.get('type', None)
         phrase = request.GET.get('keyword', None)
         if phrase is None:
             return bad_request('Must include a `keyword`')
-        index = ES_PAGE_NAME
-        query = {
-            'multi_match': {
-                'query': phrase,
-                'fields': ['keyword^3', 'body']
-            }
-        }
+        try:
+            size = get_search_size(request)
+        except ValueError as e:
+            return bad_request(str(e))
+        search_after = request.GET.get('search_after', None)
+        if search_after is not None:
+            try:
+                search_after = json.loads(search_after)
+            except ValueError:
+                search_after = None
+            try:
+                search_after = clean_search_after(search_after)
+            except ValueError as e:
+                return bad_request(str(e))
 
-        sort = [
-            {'date': {'order': 'desc', 'missing': '_first'}},
-            '_score',
-        ]
-
-        if page_type is not None:
-            query = {
-                'bool': {
-                    'filter': {
-                        'term': {'type': page_type}
-                    },
-                    'must': {
-                        'multi_match': query['multi_match']
-                    }
-                }
-            }
+        return JsonResponse(search_pages(phrase, page_type, size, search_after))
 
-        results = ES_CLIENT.search(
-            index=index,
-            doc_type='page',
-            body=json.dumps({
-                'query': query,
-                'sort': sort,
-                'from': 0,
-                'size': 10
-            })
-        )
-        return JsonResponse(results['hits'])
+
+class EsPageMultiSearch(EsRequestView):
+    """ Hits grouped by page type (`types`, comma separated, defaults to all), in one round trip """
+    def handle_get(self, request, *args, **kwargs):
+        phrase = request.GET.get('keyword', None)
+        if phrase is None:
+            return bad_request('Must include a `keyword`')
+        try:
+            size = get_search_size(request)
+        except ValueError as e:
+            return bad_request(str(e))
+        page_types = request.GET.get('types', None)
+        page_types = page_types.split(',') if page_types else ES_PAGE_TYPES
+        if not set(page_types) <= set(ES_PAGE_TYPES):
+            return bad_request('`types` must be among %s' % ', '.join(ES_PAGE_TYPES))
+
+        return JsonResponse(msearch_pages(phrase, page_types, size))
+
+
+class EsPageSuggest(EsRequestView):
+    """ Typeahead: countries, events and appeals whose name (or code) starts with the keyword """
+    def handle_get(self, request, *args, **kwargs):
+        phrase = request.GET.get('keyword', None)
+        if phrase is None:
+            return bad_request('Must include a `keyword`')
+        try:
+            size = get_search_size(request)
+        except ValueError as e:
+            return bad_request(str(e))
+        page_types = request.GET.get('type', None)
+        page_types = page_types.split(',') if page_types else None
+        if page_types and not set(page_types) <= set(ES_SUGGEST_TYPES):
+            return bad_request('`type` must be among %s' % ', '.join(ES_SUGGEST_TYPES))
+
+        return JsonResponse({'suggestions': suggest_pages(phrase, page_types, size)})
 
 
 class AreaAggregate(PublicJsonRequestView):
@@ -290,16 +347,9 @@ class PublicJsonPostView(View):
         if not username or not key:
             return None
 
-        # Query the user
-        try:
-            user = User.objects.get(username=username)
-        except ObjectDoesNotExist:
-            return None
-
-        # Query the key
-        try:
-            Token.objects.get(user=user, key=key)
-        except ObjectDoesNotExist:
+        # Query the key (cached), which has to belong to the user
+        user = get_token_user(key)
+        if user is None or user.username != username:
             return None
 
         return user
@@ -345,7 +395,7 @@ class GetAuthToken(PublicJsonPostView):
                 'username': username,
                 'first': user.first_name,
                 'last': user.last_name,
-                'expires': api_key.created + timedelta(7),
+                'expires': api_key.created + TOKEN_EXPIRY,
                 'id': user.id,
             })
         else:
@@ -436,7 +486,7 @@ class ShowUsername(PublicJsonPostView):
 
 
 class AddCronJobLog(APIView):
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permissions_classes = (permissions.IsAuthenticated,)
 
     def post(self, request):
@@ -457,3 +507,27 @@ class DummyHttpStatusError(View):
 class DummyExceptionError(View):
     def get(self, request, *args, **kwargs):
         raise Exception('Dev raised exception!')
+
+
+class LimitedGraphQLView(GraphQLView):
+    """ GraphQLView rejecting queries above GRAPHQL_MAX_QUERY_DEPTH / GRAPHQL_MAX_QUERY_COST before executing them """
+
+    def execute(self, document_ast, **kwargs):
+        operation_ast = get_operation_ast(document_ast, kwargs.get('operation_name'))
+        if operation_ast is not None:
+            fragments = {
+                definition.name.value: definition
+                for definition in document_ast.definitions if isinstance(definition, FragmentDefinition)
+            }
+            depth, cost = get_query_depth_and_cost(
+                operation_ast.selection_set, fragments, kwargs.get('variable_values'),
+            )
+            if depth > settings.GRAPHQL_MAX_QUERY_DEPTH:
+                raise GraphQLError(
+                    'Query depth {} exceeds the maximum depth of {}.'.format(depth, settings.GRAPHQL_MAX_QUERY_DEPTH)
+                )
+            if cost > settings.GRAPHQL_MAX_QUERY_COST:
+                raise GraphQLError(
+                    'Query cost {} exceeds the maximum cost of {}.'.format(cost, settings.GRAPHQL_MAX_QUERY_COST)
+                )
+        return super().execute(document_ast, **kwargs)
@@ -3,7 +3,7 @@ import logging
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from api.models import Country, CronJob, CronJobStatus
+from api.models import Country, CronJob, CronJobStatus, CronJobLogBuffer
 from databank.models import CountryOverview
 
 from .sources import (
@@ -92,6 +92,7 @@ class Command(BaseCommand):
                 'num_result': index, "status": CronJobStatus.SUCCESSFUL,
             })
 
+    @CronJobLogBuffer()
     def handle(self, *args, **kwargs):
         start = datetime.datetime.now()
         self.load()
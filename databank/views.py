@@ -1,4 +1,5 @@
-from rest_framework.authentication import TokenAuthentication, BasicAuthentication
+from rest_framework.authentication import BasicAuthentication
+from api.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets, mixins
 
@@ -10,7 +11,7 @@ class CountryOverviewViewSet(
         mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     queryset = CountryOverview.objects.all()
     # TODO: Use global authentication class
-    authentication_classes = (BasicAuthentication, TokenAuthentication)
+    authentication_classes = (BasicAuthentication, CachedTokenAuthentication)
     permission_classes = (IsAuthenticated,)
     serializer_class = CountryOverviewSerializer
     lookup_field = 'country__iso__iexact'
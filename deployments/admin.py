@@ -2,6 +2,7 @@ import csv
 from django.contrib import admin
 from django.urls import reverse
 from django.utils.safestring import mark_safe
+from django.utils.html import format_html_join
 from django.urls import path
 from django.contrib.admin import helpers
 from django.shortcuts import redirect, render
@@ -176,13 +177,17 @@ class ProjectImportProjectInline(admin.TabularInline):
 
 class ProjectImportAdmin(admin.ModelAdmin):
     search_fields = ('file',)
-    readonly_fields = ('id', 'created_by', 'created_at', 'message_display', 'file', 'status',)
-    list_display = ('created_by', 'created_at', 'status', 'file')
+    readonly_fields = (
+        'id', 'created_by', 'created_at', 'message_display', 'file', 'status', 'processed_rows', 'row_errors_display',
+    )
+    list_display = ('created_by', 'created_at', 'status', 'processed_rows', 'file')
     list_filter = ('created_at', 'status')
     actions = None
     fieldsets = (
         (None, {
-            'fields': ('created_by', 'created_at', 'file', 'status', 'message_display')
+            'fields': (
+                'created_by', 'created_at', 'file', 'status', 'processed_rows', 'message_display', 'row_errors_display',
+            )
         }),
     )
     inlines = (ProjectImportProjectInline,)
@@ -203,6 +208,11 @@ class ProjectImportAdmin(admin.ModelAdmin):
                 <ul class="messagelist" style="margin-left: 0px;"><li class="{style_class}">{obj.message}</li></ul>
             ''')
 
+    def row_errors_display(self, obj):
+        if obj.row_errors:
+            return format_html_join(mark_safe('<br />'), '{}', ((error,) for error in obj.row_errors))
+    row_errors_display.short_description = _('row errors')
+
 
 class ERUReadinessAdmin(CompareVersionAdmin):
     search_fields = ('national_society',)
@@ -1,7 +1,7 @@
 import json, datetime, pytz
+import hashlib
 from collections import defaultdict
 from rest_framework.authentication import (
-    TokenAuthentication,
     BasicAuthentication,
     SessionAuthentication,
 )
@@ -9,16 +9,16 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters import rest_framework as filters
+from django.core.cache import cache
 from django.shortcuts import render
 from django.contrib.postgres.aggregates.general import ArrayAgg
-from django.db.models import Q, Sum, Count, F, Subquery, OuterRef, IntegerField
-from django.db.models.functions import Coalesce
+from django.db.models import Sum, Count
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets
 from reversion.views import RevisionMixin
 
-from .filters import ProjectFilter
+from .filters import ProjectFilter, filter_project_by_regions
 from .models import (
     ERUOwner,
     ERU,
@@ -30,13 +30,17 @@ from .models import (
     RegionalProject,
     Project,
 )
+from api.authentication import CachedTokenAuthentication
 from api.models import Country, Region
 from api.view_filters import ListFilter
 from .serializers import (
     ERUOwnerSerializer,
     ERUSerializer,
+    MiniERUSerializer,
     PersonnelDeploymentSerializer,
+    MiniPersonnelDeploymentSerializer,
     PersonnelSerializer,
+    MiniPersonnelSerializer,
     PartnerDeploymentSerializer,
     RegionalProjectSerializer,
     ProjectSerializer,
@@ -49,10 +53,22 @@ from api.views import (
 )
 
 
+def is_mini_request(request):
+    return request.GET.get('mini', 'false').lower() == 'true'
+
+
+def get_event_prefetch_fields(prefix):
+    # Nested relations rendered by ListEventSerializer
+    return [
+        '{}__{}'.format(prefix, field)
+        for field in ('appeals', 'countries', 'field_reports__contacts', 'field_reports__countries')
+    ]
+
+
 class ERUOwnerViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
-    queryset = ERUOwner.objects.all()
+    queryset = ERUOwner.objects.select_related('national_society_country').prefetch_related('eru_set__deployed_to')
     serializer_class = ERUOwnerSerializer
     ordering_fields = ('created_at', 'updated_at',)
 
@@ -67,13 +83,28 @@ class ERUFilter(filters.FilterSet):
         fields = ('available',)
 
 class ERUViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     #permission_classes = (IsAuthenticated,) # Some figures are shown on the home page also, and not only authenticated users should see them.
     queryset = ERU.objects.all()
     serializer_class = ERUSerializer
     filter_class = ERUFilter
     ordering_fields = ('type', 'units', 'equipment_units', 'deployed_to', 'event', 'eru_owner', 'available',)
 
+    def get_queryset(self):
+        qs = super().get_queryset().select_related(
+            'deployed_to', 'event', 'eru_owner__national_society_country',
+        )
+        if is_mini_request(self.request):
+            return qs
+        return qs.select_related('event__dtype').prefetch_related(
+            'eru_owner__eru_set__deployed_to', *get_event_prefetch_fields('event')
+        )
+
+    def get_serializer_class(self):
+        if is_mini_request(self.request):
+            return MiniERUSerializer
+        return ERUSerializer
+
 class PersonnelDeploymentFilter(filters.FilterSet):
     country_deployed_to = filters.NumberFilter(field_name='country_deployed_to', lookup_expr='exact')
     region_deployed_to = filters.NumberFilter(field_name='region_deployed_to', lookup_expr='exact')
@@ -83,13 +114,26 @@ class PersonnelDeploymentFilter(filters.FilterSet):
         fields = ('country_deployed_to', 'region_deployed_to', 'event_deployed_to',)
 
 class PersonnelDeploymentViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = PersonnelDeployment.objects.all()
     serializer_class = PersonnelDeploymentSerializer
     filter_class = PersonnelDeploymentFilter
     ordering_fields = ('country_deployed_to', 'region_deployed_to', 'event_deployed_to',)
 
+    def get_queryset(self):
+        qs = super().get_queryset().select_related('country_deployed_to', 'event_deployed_to')
+        if is_mini_request(self.request):
+            return qs
+        return qs.select_related('event_deployed_to__dtype').prefetch_related(
+            *get_event_prefetch_fields('event_deployed_to')
+        )
+
+    def get_serializer_class(self):
+        if is_mini_request(self.request):
+            return MiniPersonnelDeploymentSerializer
+        return PersonnelDeploymentSerializer
+
 class PersonnelFilter(filters.FilterSet):
     country_from = filters.NumberFilter(field_name='country_from', lookup_expr='exact')
     type = filters.CharFilter(field_name='type', lookup_expr='exact')
@@ -102,13 +146,28 @@ class PersonnelFilter(filters.FilterSet):
         }
 
 class PersonnelViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Personnel.objects.all()
     serializer_class = PersonnelSerializer
     filter_class = PersonnelFilter
     ordering_fields = ('start_date', 'end_date', 'name', 'role', 'type', 'country_from', 'deployment',)
 
+    def get_queryset(self):
+        qs = super().get_queryset().select_related(
+            'country_from', 'deployment__country_deployed_to', 'deployment__event_deployed_to',
+        )
+        if is_mini_request(self.request):
+            return qs
+        return qs.select_related('deployment__event_deployed_to__dtype').prefetch_related(
+            *get_event_prefetch_fields('deployment__event_deployed_to')
+        )
+
+    def get_serializer_class(self):
+        if is_mini_request(self.request):
+            return MiniPersonnelSerializer
+        return PersonnelSerializer
+
 class PartnerDeploymentFilterset(filters.FilterSet):
     parent_society = filters.NumberFilter(field_name='parent_society', lookup_expr='exact')
     country_deployed_to = filters.NumberFilter(field_name='country_deployed_to', lookup_expr='exact')
@@ -159,11 +218,28 @@ class ProjectViewset(RevisionMixin, viewsets.ModelViewSet):
 
 
 class RegionProjectViewset(viewsets.ViewSet):
+    CACHE_TIMEOUT = 60 * 30
+
     def get_region(self):
         if not hasattr(self, '_region'):
             self._region = get_object_or_404(Region, pk=self.kwargs['pk'])
         return self._region
 
+    def get_cache_key(self):
+        """
+        Cache key for the current action using region, filter params, user visibility and project cache version
+        """
+        params = hashlib.md5(
+            json.dumps(sorted(self.request.query_params.lists())).encode('utf-8')
+        ).hexdigest()
+        return 'region-project-{}-{}-{}-{}-{}'.format(
+            self.action,
+            self.kwargs.get('pk'),
+            Project.get_visibility_for(self.request.user),
+            Project.get_cache_version(),
+            params,
+        )
+
     def get_projects(self):
         if self.action == 'global_national_society_activities':
             # Region Filter will be applied using ProjectFilter if provided
@@ -171,10 +247,7 @@ class RegionProjectViewset(viewsets.ViewSet):
         else:
             region = self.get_region()
             # Filter by region (From URL Params)
-            qs = Project.objects.filter(
-                Q(project_country__region=region) |
-                Q(project_districts__country__region=region)
-            ).distinct()
+            qs = filter_project_by_regions(Project.objects.all(), [region])
         # Filter by GET params
         qs = ProjectFilter(self.request.query_params, queryset=qs).qs
         # Filter by visibility
@@ -199,147 +272,149 @@ class RegionProjectViewset(viewsets.ViewSet):
                 count=Count('id', distinct=True)).values('status', 'count'),
         })
 
-    @action(detail=True, url_path='movement-activities', methods=('get',))
-    def movement_activities(self, request, pk=None):
-        projects = self.get_projects()
+    def _get_movement_activities(self):
+        region = self.get_region()
+        status_fields = {
+            status: f'{status_label.lower()}_projects_count'
+            for status, status_label in Statuses.choices()
+        }
 
-        def _get_country_ns_sector_count():
-            agg = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(int))))
-            fields = ('project_country', 'reporting_ns', 'primary_sector')
-            qs = projects.order_by().values(*fields).annotate(count=Count('id', distinct=True)).values_list(
-                *fields, 'project_country__name', 'reporting_ns__name', 'count')
-            for country, ns, sector, country_name, ns_name, count in qs:
-                agg[country][ns][sector] = count
-                agg[country]['name'] = country_name
-                agg[country][ns]['name'] = ns_name
-            return [
+        # Single grouped scan of the projects, everything else is assembled below.
+        # The region (404) and its countries (listed with zero counts too, so not found in the scan) are the two
+        # other queries.
+        fields = ('project_country', 'reporting_ns', 'primary_sector', 'status')
+        qs = self.get_projects().order_by().values(*fields).annotate(count=Count('id', distinct=True)).values_list(
+            *fields, 'project_country__name', 'reporting_ns__name', 'count').order_by(*fields)
+
+        total_projects = 0
+        country_counts = defaultdict(lambda: defaultdict(int))
+        country_ns_sector = {}
+        supporting_ns = {}
+        for country, ns, sector, status, country_name, ns_name, count in qs:
+            total_projects += count
+            country_counts[country]['projects_count'] += count
+            country_counts[country][status_fields[status]] += count
+
+            country_data = country_ns_sector.setdefault(country, {'name': country_name, 'ns': {}})
+            ns_data = country_data['ns'].setdefault(ns, {'name': ns_name, 'sectors': defaultdict(int)})
+            ns_data['sectors'][sector] += count
+
+            supporting_ns.setdefault(ns, {'id': ns, 'name': ns_name, 'count': 0})['count'] += count
+
+        return {
+            'total_projects': total_projects,
+            'countries_count': [
+                {
+                    **country,
+                    'projects_count': country_counts[country['id']]['projects_count'],
+                    **{
+                        status_field: country_counts[country['id']][status_field]
+                        for status_field in status_fields.values()
+                    },
+                }
+                for country in Country.objects.filter(region=region).values('id', 'name', 'iso', 'iso3')
+            ],
+            'country_ns_sector_count': [
                 {
                     'id': cid,
-                    'name': country.pop('name'),
+                    'name': country['name'],
                     'reporting_national_societies': [
                         {
                             'id': nsid,
-                            'name': ns.pop('name'),
+                            'name': ns['name'],
                             'sectors': [
                                 {
                                     'id': sector,
                                     'sector': Sectors(sector).label,
                                     'count': count,
-                                } for sector, count in ns.items()
+                                } for sector, count in ns['sectors'].items()
                             ],
                         }
-                        for nsid, ns in country.items()
+                        for nsid, ns in country['ns'].items()
                     ],
                 }
-                for cid, country in agg.items()
-            ]
-
-        region = self.get_region()
-        country_projects = projects.filter(project_country=OuterRef('pk'))
-        countries = Country.objects.filter(region=region)
-        country_annotate = {
-            f'{status_label.lower()}_projects_count': Coalesce(Subquery(
-                country_projects.filter(status=status).values('project_country').annotate(
-                    count=Count('id', distinct=True)).values('count')[:1],
-                output_field=IntegerField(),
-            ), 0) for status, status_label in Statuses.choices()
+                for cid, country in country_ns_sector.items()
+            ],
+            'supporting_ns': list(supporting_ns.values()),
         }
 
-        return Response({
-            'total_projects': projects.count(),
-            'countries_count': countries.annotate(
-                projects_count=Coalesce(Subquery(
-                    projects.filter(project_country=OuterRef('pk')).values('project_country').annotate(
-                        count=Count('id', distinct=True)).values('count')[:1],
-                    output_field=IntegerField(),
-                ), 0),
-                **country_annotate,
-            ).values('id', 'name', 'iso', 'iso3', 'projects_count', *country_annotate.keys()),
-            'country_ns_sector_count': _get_country_ns_sector_count(),
-            'supporting_ns': projects.order_by().values('reporting_ns').annotate(count=Count('id', distinct=True)).values(
-                'count', id=F('reporting_ns'), name=F('reporting_ns__name')),
-        })
-
-    @action(detail=True, url_path='national-society-activities', methods=('get',))
-    def national_society_activities(self, request, pk=None):
-        projects = self.get_projects()
-
-        def _get_distinct(field, *args, **kwargs):
-            return list(
-                projects.order_by().values(field).annotate(
-                    count=Count('id', distinct=True)).values(field, *args, **kwargs).distinct()
-            )
-
-        def _get_count(*fields):
-            return list(
-                projects.order_by().values(*fields).annotate(
-                    count=Count('id', distinct=True)).values_list(*fields, 'count')
-            )
-
-        # Raw nodes
-        supporting_ns_list = _get_distinct(
-            'reporting_ns',
-            iso3=F('reporting_ns__iso3'),
-            iso=F('reporting_ns__iso'),
-            name=F('reporting_ns__society_name')
-        )
-        receiving_ns_list = _get_distinct(
-            'project_country',
-            iso3=F('project_country__iso3'),
-            iso=F('project_country__iso'),
-            name=F('project_country__name')
-        )
-        sector_list = _get_distinct('primary_sector')
-
-        # Raw links
-        supporting_ns_and_sector_group = _get_count('reporting_ns', 'primary_sector')
-        sector_and_receiving_ns_group = _get_count('primary_sector', 'project_country')
-
+    @action(detail=True, url_path='movement-activities', methods=('get',))
+    def movement_activities(self, request, pk=None):
+        cache_key = self.get_cache_key()
+        data = cache.get(cache_key)
+        if data is None:
+            data = self._get_movement_activities()
+            cache.set(cache_key, data, self.CACHE_TIMEOUT)
+        return Response(data)
+
+    def _get_national_society_activities(self):
         # Node Types
         SUPPORTING_NS = 'supporting_ns'
         RECEIVING_NS = 'receiving_ns'
         SECTOR = 'sector'
 
+        # Single grouped scan, nodes and links are assembled below
+        fields = ('reporting_ns', 'primary_sector', 'project_country')
+        qs = self.get_projects().order_by().values(*fields).annotate(count=Count('id', distinct=True)).values_list(
+            *fields,
+            'reporting_ns__iso3', 'reporting_ns__iso', 'reporting_ns__society_name',
+            'project_country__iso3', 'project_country__iso', 'project_country__name',
+            'count',
+        ).order_by(*fields)
+
+        supporting_ns_nodes = {}
+        sector_nodes = {}
+        receiving_ns_nodes = {}
+        supporting_ns_and_sector_group = defaultdict(int)
+        sector_and_receiving_ns_group = defaultdict(int)
+        for ns, sector, country, ns_iso3, ns_iso, ns_name, country_iso3, country_iso, country_name, count in qs:
+            supporting_ns_nodes[ns] = {'name': ns_name, 'iso': ns_iso, 'iso3': ns_iso3}
+            sector_nodes[sector] = {'name': Sectors(sector).label}
+            receiving_ns_nodes[country] = {'name': country_name, 'iso': country_iso, 'iso3': country_iso3}
+            supporting_ns_and_sector_group[(ns, sector)] += count
+            sector_and_receiving_ns_group[(sector, country)] += count
+
         nodes = [
             {
-                'id': node[id_selector],
+                'id': node_id,
                 'type': gtype,
-                **(
-                    {
-                        'name': node['name'],
-                        'iso': node['iso'],
-                        'iso3': node['iso3'],
-                    } if gtype != SECTOR else {
-                        'name': Sectors(node[id_selector]).label,
-                    }
-                )
+                **node,
             }
-            for group, gtype, id_selector in [
-                (supporting_ns_list, SUPPORTING_NS, 'reporting_ns'),
-                (sector_list, SECTOR, 'primary_sector'),
-                (receiving_ns_list, RECEIVING_NS, 'project_country'),
+            for group, gtype in [
+                (supporting_ns_nodes, SUPPORTING_NS),
+                (sector_nodes, SECTOR),
+                (receiving_ns_nodes, RECEIVING_NS),
             ]
-            for node in group
+            for node_id, node in sorted(group.items(), key=lambda item: (item[0] is None, item[0]))
         ]
 
         node_id_map = {
-            f"{node['type']}-{node['id']}": index
+            (node['type'], node['id']): index
             for index, node in enumerate(nodes)
         }
 
         links = [
             {
-                'source': node_id_map[f"{source_type}-{source}"],
-                'target': node_id_map[f"{target_type}-{target}"],
+                'source': node_id_map[(source_type, source)],
+                'target': node_id_map[(target_type, target)],
                 'value': value,
             }
             for group, source_type, target_type in [
                 (supporting_ns_and_sector_group, SUPPORTING_NS, SECTOR),
                 (sector_and_receiving_ns_group, SECTOR, RECEIVING_NS),
             ]
-            for source, target, value in group
+            for (source, target), value in group.items()
         ]
-        return Response({'nodes': nodes, 'links': links})
+        return {'nodes': nodes, 'links': links}
+
+    @action(detail=True, url_path='national-society-activities', methods=('get',))
+    def national_society_activities(self, request, pk=None):
+        cache_key = self.get_cache_key()
+        data = cache.get(cache_key)
+        if data is None:
+            data = self._get_national_society_activities()
+            cache.set(cache_key, data, self.CACHE_TIMEOUT)
+        return Response(data)
 
     @action(detail=False, url_path='national-society-activities', methods=('get',))
     def global_national_society_activities(self, request, pk=None):
@@ -1,4 +1,3 @@
-from functools import reduce
 import django_filters as filters
 from django.db.models import Q, F
 
@@ -13,21 +12,51 @@ from .models import (
 )
 
 
+def filter_project_by_countries(queryset, country_ids):
+    """
+    Projects in the countries (project country or any project district's country)
+    NOTE: Districts are matched using a (semi-join) subquery instead of a join, so no DISTINCT is required
+    """
+    return queryset.filter(
+        Q(project_country__in=country_ids) |
+        Q(pk__in=Project.project_districts.through.objects.filter(
+            district__country__in=country_ids,
+        ).values('project_id'))
+    )
+
+
+def filter_project_by_regions(queryset, regions):
+    """
+    Projects in the regions (project country or any project district's country)
+    """
+    return queryset.filter(
+        Q(project_country__region__in=regions) |
+        Q(pk__in=Project.project_districts.through.objects.filter(
+            district__country__region__in=regions,
+        ).values('project_id'))
+    )
+
+
 class ProjectFilter(filters.FilterSet):
     budget_amount = filters.NumberFilter(field_name='budget_amount', lookup_expr='exact')
     country = filters.CharFilter(label='Country ISO/ISO3', field_name='country', method='filter_countries')
     region = filters.ModelMultipleChoiceFilter(
-        label='Region', queryset=Region.objects.all(), widget=filters.widgets.CSVWidget, method='filter_regions')
-    operation_type = filters.MultipleChoiceFilter(choices=OperationTypes.choices(), widget=filters.widgets.CSVWidget)
-    programme_type = filters.MultipleChoiceFilter(choices=ProgrammeTypes.choices(), widget=filters.widgets.CSVWidget)
-    primary_sector = filters.MultipleChoiceFilter(choices=Sectors.choices(), widget=filters.widgets.CSVWidget)
+        label='Region', queryset=Region.objects.all(), widget=filters.widgets.CSVWidget, method='filter_regions',
+        distinct=False)
+    # NOTE: distinct=False, filters below are on project columns only (No duplicate rows)
+    operation_type = filters.MultipleChoiceFilter(
+        choices=OperationTypes.choices(), widget=filters.widgets.CSVWidget, distinct=False)
+    programme_type = filters.MultipleChoiceFilter(
+        choices=ProgrammeTypes.choices(), widget=filters.widgets.CSVWidget, distinct=False)
+    primary_sector = filters.MultipleChoiceFilter(choices=Sectors.choices(), widget=filters.widgets.CSVWidget, distinct=False)
     secondary_sectors = filters.MultipleChoiceFilter(
         choices=SectorTags.choices(), widget=filters.widgets.CSVWidget, method='filter_secondary_sectors',
     )
-    status = filters.MultipleChoiceFilter(choices=Statuses.choices(), widget=filters.widgets.CSVWidget)
+    status = filters.MultipleChoiceFilter(choices=Statuses.choices(), widget=filters.widgets.CSVWidget, distinct=False)
 
     # Supporting/Receiving NS Filters (Multiselect)
-    reporting_ns = filters.ModelMultipleChoiceFilter(queryset=Country.objects.all(), widget=filters.widgets.CSVWidget)
+    reporting_ns = filters.ModelMultipleChoiceFilter(
+        queryset=Country.objects.all(), widget=filters.widgets.CSVWidget, distinct=False)
     exclude_within = filters.BooleanFilter(
         label='Exclude projects with same country and Reporting NS', field_name='exclude_within', method='filter_exclude_within')
 
@@ -47,30 +76,12 @@ class ProjectFilter(filters.FilterSet):
     def filter_countries(self, queryset, name, countries):
         countries = countries.split(',')
         if len(countries):
-            return queryset.filter(
-                reduce(
-                    lambda acc, item: acc | item,
-                    [
-                        (
-                            # ISO2
-                            Q(project_country__iso__iexact=country) |
-                            Q(project_districts__country__iso__iexact=country) |
-                            # ISO3
-                            Q(project_country__iso3__iexact=country) |
-                            Q(project_districts__country__iso3__iexact=country)
-                        )
-                        for country in countries
-                    ]
-                )
-            ).distinct()
+            return filter_project_by_countries(queryset, Country.get_ids_for_iso(countries))
         return queryset
 
     def filter_regions(self, queryset, name, regions):
         if len(regions):
-            return queryset.filter(
-                Q(project_country__region__in=regions) |
-                Q(project_districts__country__region__in=regions)
-            ).distinct()
+            return filter_project_by_regions(queryset, regions)
         return queryset
 
     class Meta:
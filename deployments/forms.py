@@ -1,15 +1,16 @@
 import io
+import html
+import threading
 import dateutil.parser
 import traceback
 import csv
-from functools import reduce
 from itertools import zip_longest
 
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 from django.utils.safestring import mark_safe
 from django.contrib import messages
-from django.db.models import Q
+from django.db import connection, transaction
 from django.core.exceptions import ValidationError
 from django.db.models.functions import Coalesce
 
@@ -136,7 +137,43 @@ class ProjectImportForm(forms.Form):
         ]
         return rows
 
-    def _handle_bulk_upload(self, user, file, delimiter, quotechar):
+    @classmethod
+    def _get_lookups(cls):
+        """
+        Preload lookup tables once per import (instead of queries per row)
+        """
+        countries = {}
+        reporting_ns = {}
+        for country in Country.objects.order_by('name', 'id'):
+            countries.setdefault(country.name.lower(), country)
+            reporting_ns.setdefault(country.name.lower(), country)
+            if country.society_name:
+                reporting_ns.setdefault(country.society_name.lower(), country)
+
+        disaster_types = {}
+        for disaster_type in DisasterType.objects.order_by('name', 'id'):
+            disaster_types.setdefault(disaster_type.name.lower(), disaster_type)
+
+        # {(country name, district name): [districts]} and {country id: [districts]}
+        districts = {}
+        country_districts = {}
+        for district in District.objects.select_related('country').order_by('id'):
+            for country_name in set([district.country_name, district.country and district.country.name]):
+                if country_name:
+                    districts.setdefault((country_name.lower(), district.name.lower()), []).append(district)
+            if district.country_id:
+                country_districts.setdefault(district.country_id, []).append(district)
+
+        return {
+            'countries': countries,
+            'reporting_ns': reporting_ns,
+            'disaster_types': disaster_types,
+            'districts': districts,
+            'country_districts': country_districts,
+        }
+
+    @classmethod
+    def _handle_bulk_upload(cls, project_import, delimiter, quotechar, chunk_size=1000, progress_step=500):
         def get_error_message(row, custom_errors, validation_erorrs=None):
             messages = ', '.join([
                 f"{field}: {', '.join(error_message)}"
@@ -162,13 +199,11 @@ class ProjectImportForm(forms.Form):
             except ValueError:
                 return None
 
-        file.seek(0)
-        reader = csv.DictReader(
-            io.StringIO(file.read().decode('utf-8-sig', errors='ignore')),
-            skipinitialspace=True,
-            delimiter=delimiter,
-            quotechar=quotechar,
-        )
+        def update_progress(**kwargs):
+            ProjectImport.objects.filter(pk=project_import.pk).update(**kwargs)
+
+        user = project_import.created_by
+        lookups = cls._get_lookups()
         errors = []
         projects = []
 
@@ -179,8 +214,17 @@ class ProjectImportForm(forms.Form):
         sector_tags = {label.lower(): value for value, label in SectorTags.choices()}
         statuses = {label.lower(): value for value, label in Statuses.choices()}
 
-        c = self.Columns
-        # Extract from import csv file
+        c = cls.Columns
+        # Validate rows while streaming the import csv file
+        file = project_import.file
+        file.open('rb')
+        reader = csv.DictReader(
+            io.TextIOWrapper(file, encoding='utf-8-sig', errors='ignore', newline=''),
+            skipinitialspace=True,
+            delimiter=delimiter,
+            quotechar=quotechar,
+        )
+        row_number = 1
         for row_number, row in enumerate(reader, start=2):
             district_names = [
                 d for d in row[c.DISTRICT].strip().split(';')
@@ -190,35 +234,27 @@ class ProjectImportForm(forms.Form):
             country_name = row[c.COUNTRY].strip()
             disaster_type_name = row[c.DISASTER_TYPE].strip()
 
-            reporting_ns = Country.objects.filter(
-                Q(name__iexact=reporting_ns_name) | Q(society_name__iexact=reporting_ns_name)
-            ).first()
-            disaster_type = DisasterType.objects.filter(name__iexact=disaster_type_name).first()
+            reporting_ns = lookups['reporting_ns'].get(reporting_ns_name.lower())
+            disaster_type = lookups['disaster_types'].get(disaster_type_name.lower())
 
             row_errors = {}
+            project_country = None
             project_districts = []
             if len(district_names) == 0:
-                project_country = Country.objects.filter(name__iexact=country_name).first()
+                project_country = lookups['countries'].get(country_name.lower())
                 if project_country is None:
                     row_errors['project_country'] = [f'Given country "{country_name}" is not available.']
                 else:
-                    project_districts = list(project_country.district_set.all())
+                    project_districts = lookups['country_districts'].get(project_country.pk, [])
 
                 if len(project_districts) == 0:
                     row_errors['project_districts'] = [f'There is no district for given country "{country_name}" in database.']
             else:
-                project_districts = list(District.objects.filter(
-                    reduce(
-                        lambda acc, item: acc | item,
-                        [
-                            (
-                                Q(country_name__iexact=country_name) |
-                                Q(country__name__iexact=country_name)
-                            ) & Q(name__iexact=district_name)
-                            for district_name in district_names
-                        ],
-                    )
-                ).all())
+                project_districts = list({
+                    district.pk: district
+                    for district_name in district_names
+                    for district in lookups['districts'].get((country_name.lower(), district_name.lower()), [])
+                }.values())
                 # Check if all district_names is avaliable in db
                 if len(project_districts) == len(district_names):
                     project_country = project_districts[0].country
@@ -263,7 +299,11 @@ class ProjectImportForm(forms.Form):
                 reached_total=parse_integer(row[c.REACHED_TOTAL]),
             )
             try:
-                project.full_clean()
+                # NOTE: Foreign keys are resolved from the preloaded tables (skip query per foreign key)
+                project.full_clean(
+                    exclude=['user', 'reporting_ns', 'project_country', 'dtype'],
+                    validate_unique=False,
+                )
                 if len(row_errors) == 0:
                     projects.append([project, project_districts])
                 else:
@@ -271,17 +311,52 @@ class ProjectImportForm(forms.Form):
             except ValidationError as e:
                 errors.append(get_error_message(row_number, row_errors, e.message_dict))
 
+            if (row_number - 1) % progress_step == 0:
+                update_progress(processed_rows=row_number - 1, row_errors=errors)
+        file.close()
+        update_progress(processed_rows=row_number - 1, row_errors=errors)
+
         if len(errors) != 0:
             errors_str = '\n'.join(errors)
             raise Exception(f"Error detected:\n{errors_str}")
 
-        Project.objects.bulk_create([p[0] for p in projects])
-        # Set M2M Now
-        for project, project_districts in projects:
-            project.project_districts.set(project_districts)
+        # Insert in chunks (All or none)
+        ProjectDistrict = Project.project_districts.through
+        ProjectImportProject = ProjectImport.projects_created.through
+        with transaction.atomic():
+            for index in range(0, len(projects), chunk_size):
+                chunk = projects[index:index + chunk_size]
+                Project.objects.bulk_create([p[0] for p in chunk])
+                # Set M2M Now
+                ProjectDistrict.objects.bulk_create([
+                    ProjectDistrict(project_id=project.pk, district_id=district.pk)
+                    for project, project_districts in chunk
+                    for district in project_districts
+                ])
+                ProjectImportProject.objects.bulk_create([
+                    ProjectImportProject(projectimport_id=project_import.pk, project_id=project.pk)
+                    for project, _ in chunk
+                ])
+        # NOTE: bulk_create doesn't trigger signals
+        Project.clear_cache()
         # Return projects for ProjectImport
         return [p[0] for p in projects]
 
+    @classmethod
+    def run_bulk_upload(cls, project_import, delimiter, quotechar):
+        file = project_import.file
+        try:
+            projects = cls._handle_bulk_upload(project_import, delimiter, quotechar)
+            project_import.message = f'Successfully added <b>{len(projects)}</b> project(s) using <b>{file}</b>.'
+            project_import.status = ProjectImport.SUCCESS
+        except Exception:
+            project_import.message = (
+                f"Importing <b>{file}</b> failed. Check file and try again!!<br />"
+                f"<pre>{html.escape(traceback.format_exc())}</pre>"
+            )
+            project_import.status = ProjectImport.FAILURE
+        project_import.save(update_fields=['message', 'status'])
+
     def handle_bulk_upload(self, request):
         file = self.cleaned_data['file']
         delimiter = self.cleaned_data['field_delimiter']
@@ -289,20 +364,31 @@ class ProjectImportForm(forms.Form):
         project_import = ProjectImport.objects.create(
             created_by=request.user,
             file=file,
+            message=f'Importing <b>{file}</b> in background.',
+        )
+        # Large imports can't be processed within the request (gunicorn timeout)
+        transaction.on_commit(
+            lambda: ProjectImportThread(project_import.pk, delimiter, quotechar).start()
+        )
+        messages.add_message(
+            request, messages.INFO,
+            mark_safe(f'{project_import.message} Check <b>Recent Imports</b> for the progress.'),
         )
 
+
+class ProjectImportThread(threading.Thread):
+    """
+    Run the project import in background and track it using ProjectImport
+    """
+    def __init__(self, project_import_id, delimiter, quotechar):
+        self.project_import_id = project_import_id
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        super().__init__()
+
+    def run(self):
         try:
-            projects = self._handle_bulk_upload(request.user, file, delimiter, quotechar)
-            project_import.projects_created.add(*projects)
-            project_import.message = f'Successfully added <b>{len(projects)}</b> project(s) using <b>{file}</b>.'
-            project_import.status = ProjectImport.SUCCESS
-            # Also show error in Admin Panel
-            messages.add_message(request, messages.INFO, mark_safe(project_import.message))
-        except Exception:
-            project_import.message = (
-                f"Importing <b>{file}</b> failed. Check file and try again!!<br />"
-                f"<pre>{traceback.format_exc()}</pre>"
-            )
-            messages.add_message(request, messages.ERROR, mark_safe(project_import.message))
-            project_import.status = ProjectImport.FAILURE
-        project_import.save()
+            project_import = ProjectImport.objects.get(pk=self.project_import_id)
+            ProjectImportForm.run_bulk_upload(project_import, self.delimiter, self.quotechar)
+        finally:
+            connection.close()
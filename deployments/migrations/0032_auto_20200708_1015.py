@@ -0,0 +1,24 @@
+# Generated by Django 2.2.13 on 2020-07-08 10:15
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deployments', '0031_auto_20200701_0939'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectimport',
+            name='processed_rows',
+            field=models.PositiveIntegerField(default=0, verbose_name='processed rows'),
+        ),
+        migrations.AddField(
+            model_name='projectimport',
+            name='row_errors',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), blank=True, default=list, size=None, verbose_name='row errors'),
+        ),
+    ]
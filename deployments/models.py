@@ -1,8 +1,12 @@
+import uuid
 from datetime import datetime
 from enumfields import EnumIntegerField
 from enumfields import IntEnum
 
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 from django.utils.hashable import make_hashable
@@ -12,6 +16,7 @@ from django.contrib.postgres.fields import ArrayField
 from api.models import District, Country, Region, Event, DisasterType, Appeal, VisibilityCharChoices
 
 DATE_FORMAT = '%Y/%m/%d %H:%M'
+PROJECT_CACHE_VERSION_KEY = 'deployments-project-cache-version'
 
 
 class ERUType(IntEnum):
@@ -388,6 +393,37 @@ class Project(models.Model):
             return qs.exclude(visibility=VisibilityCharChoices.IFRC)
         return qs.filter(visibility=VisibilityCharChoices.PUBLIC)
 
+    @classmethod
+    def get_visibility_for(cls, user):
+        """
+        Highest visibility the user can see (Same rules as get_for), used for cache keys
+        """
+        if user.is_authenticated:
+            if user.email and user.email.endswith('@ifrc.org'):
+                return VisibilityCharChoices.IFRC
+            return VisibilityCharChoices.MEMBERSHIP
+        return VisibilityCharChoices.PUBLIC
+
+    @staticmethod
+    def get_cache_version():
+        """
+        Version for the cached project aggregations, changed on any project change.
+        Kept in the shared cache (settings.CACHES), so a change invalidates the aggregations of all the workers.
+        """
+        return cache.get_or_set(PROJECT_CACHE_VERSION_KEY, lambda: uuid.uuid4().hex, None)
+
+    @staticmethod
+    def clear_cache():
+        cache.set(PROJECT_CACHE_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+@receiver([post_save, post_delete], sender=Project)
+@receiver(m2m_changed, sender=Project.project_districts.through)
+def clear_project_cache(sender, **kwargs):
+    Project.clear_cache()
+    # Again once committed: aggregations cached meanwhile by other workers (from the old rows) are not served
+    transaction.on_commit(Project.clear_cache)
+
 
 class ProjectImport(models.Model):
     """
@@ -410,6 +446,9 @@ class ProjectImport(models.Model):
     message = models.TextField(verbose_name=_('message'))
     status = models.CharField(verbose_name=_('status'), max_length=10, choices=STATUS_CHOICES, default=PENDING)
     file = models.FileField(verbose_name=_('file'), upload_to='project-imports/')
+    # Progress (rows validated) and per row errors for the background import
+    processed_rows = models.PositiveIntegerField(verbose_name=_('processed rows'), default=0)
+    row_errors = ArrayField(models.TextField(), verbose_name=_('row errors'), default=list, blank=True)
 
     class Meta:
         verbose_name = _('Project Import')
@@ -52,6 +52,24 @@ class ERUSerializer(serializers.ModelSerializer):
         fields = ('type', 'units', 'equipment_units', 'deployed_to', 'event', 'eru_owner', 'available', 'id',)
 
 
+class MiniERUOwnerSerializer(serializers.ModelSerializer):
+    national_society_country = MiniCountrySerializer()
+
+    class Meta:
+        model = ERUOwner
+        fields = ('created_at', 'updated_at', 'national_society_country', 'id',)
+
+
+class MiniERUSerializer(serializers.ModelSerializer):
+    deployed_to = MiniCountrySerializer()
+    event = MiniEventSerializer()
+    eru_owner = MiniERUOwnerSerializer()
+
+    class Meta:
+        model = ERU
+        fields = ('type', 'units', 'equipment_units', 'deployed_to', 'event', 'eru_owner', 'available', 'id',)
+
+
 class PersonnelDeploymentSerializer(serializers.ModelSerializer):
     country_deployed_to = MiniCountrySerializer()
     event_deployed_to = ListEventSerializer()
@@ -70,6 +88,24 @@ class PersonnelSerializer(serializers.ModelSerializer):
         fields = ('start_date', 'end_date', 'name', 'role', 'type', 'country_from', 'deployment', 'id',)
 
 
+class MiniPersonnelDeploymentSerializer(serializers.ModelSerializer):
+    country_deployed_to = MiniCountrySerializer()
+    event_deployed_to = MiniEventSerializer()
+
+    class Meta:
+        model = PersonnelDeployment
+        fields = ('country_deployed_to', 'region_deployed_to', 'event_deployed_to', 'comments', 'id',)
+
+
+class MiniPersonnelSerializer(serializers.ModelSerializer):
+    country_from = MiniCountrySerializer()
+    deployment = MiniPersonnelDeploymentSerializer()
+
+    class Meta:
+        model = Personnel
+        fields = ('start_date', 'end_date', 'name', 'role', 'type', 'country_from', 'deployment', 'id',)
+
+
 class PartnerDeploymentActivitySerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -1,9 +1,21 @@
 import json
-from api.models import Country, District, Region
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from api.models import Country, District, Region, DisasterType, Event, FieldReport, Appeal
 from main.test_case import APITestCase
 from api.models import VisibilityCharChoices
+from .filters import ProjectFilter
+from .forms import ProjectImportForm
 from .models import (
+    ERUOwner,
+    ERU,
+    PersonnelDeployment,
+    Personnel,
     Project,
+    ProjectImport,
     ProgrammeTypes,
     Sectors,
     SectorTags,
@@ -367,3 +379,202 @@ class ProjectGetTest(APITestCase):
             'nodes': sorted(resp['nodes'], key=lambda item: dict_to_string(item)),
             'links': sorted(resp['links'], key=lambda item: dict_to_string(item)),
         })
+
+    def test_region_movement_activities_cache(self):
+        region, _ = Region.objects.get_or_create(name=1)
+        country = Country.objects.create(name='country-cache', iso='XX', region=region)
+        self.create_project(project_country=country, visibility=VisibilityCharChoices.PUBLIC)
+        url = f'/api/v2/region-project/{region.pk}/movement-activities/'
+
+        # Region + Single grouped scan of the projects + Region countries
+        with self.assertNumQueries(3):
+            resp = self.client.get(url, format='json').json()
+        # Served from cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, format='json').json(), resp)
+
+        # Cache is invalidated on project change
+        self.create_project(project_country=country, visibility=VisibilityCharChoices.PUBLIC)
+        self.assertEqual(
+            self.client.get(url, format='json').json()['total_projects'],
+            resp['total_projects'] + 1,
+        )
+
+    def test_national_society_activities_cache(self):
+        region, _ = Region.objects.get_or_create(name=1)
+        country = Country.objects.create(name='country-cache', iso='XX', region=region)
+        self.create_project(project_country=country, visibility=VisibilityCharChoices.PUBLIC)
+        url = f'/api/v2/region-project/{region.pk}/national-society-activities/'
+
+        # Region + Single grouped scan of the projects
+        with self.assertNumQueries(2):
+            resp = self.client.get(url, format='json').json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, format='json').json(), resp)
+
+        # Cache is invalidated on project change
+        self.create_project(project_country=country, visibility=VisibilityCharChoices.PUBLIC)
+        self.assertNotEqual(self.client.get(url, format='json').json(), resp)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_deployment_views', projects=20, countries=3, districts=3, repeat=1, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertTrue(all(' 0 queries' in line for line in lines if line.startswith('cached')))
+        # count and rows only for the mini deployment lists
+        self.assertTrue(all(' 2 queries' in line for line in lines if 'mini=true' in line))
+        # Generated data is rolled back
+        self.assertFalse(Project.objects.filter(name__startswith='Benchmark project').exists())
+
+    def test_project_filter_query_plan(self):
+        region, _ = Region.objects.get_or_create(name=1)
+        country3 = Country.objects.create(name='country3', iso='ZZ', iso3='ZZZ', region=region)
+        district3 = District.objects.create(name='district3', country=country3)
+        project3 = self.create_project(project_country=country3)
+        project3.project_districts.set([district3, self.district1])
+
+        for params, expected_names in [
+            ({'country': 'XX'}, ['aaa', 'Project Name']),
+            ({'country': 'yy,zzz'}, ['bbb', 'Project Name']),
+            ({'country': 'AA'}, []),
+            ({'region': str(region.pk)}, ['Project Name']),
+            ({'country': 'XX', 'region': str(region.pk)}, ['Project Name']),
+            ({'country': 'XX', 'primary_sector': str(Sectors.WASH.value)}, ['aaa', 'Project Name']),
+        ]:
+            qs = ProjectFilter(params, queryset=Project.objects.all()).qs
+            self.assertEqual(sorted(qs.values_list('name', flat=True)), sorted(expected_names), params)
+            # Districts are matched with a subquery, so no duplicate rows and no DISTINCT/Unique step
+            if expected_names:
+                self.assertNotIn('DISTINCT', str(qs.query).upper(), params)
+                self.assertNotIn('Unique', qs.explain(), params)
+        self.assertEqual(project3.project_districts.count(), 2)
+
+
+class DeploymentGetTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.region = Region.objects.create(name=1)
+        self.country = Country.objects.create(name='Deployment Country', iso='DC', region=self.region)
+        dtype = DisasterType.objects.create(name='Deployment dtype', summary='summary')
+        owner = ERUOwner.objects.create(national_society_country=self.country)
+        for i in range(3):
+            event = Event.objects.create(name='Deployment event %s' % i, dtype=dtype)
+            event.countries.add(self.country)
+            Appeal.objects.create(aid='deployment-appeal-%s' % i, name='Appeal', event=event, dtype=dtype, region=self.region)
+            field_report = FieldReport.objects.create(summary='Field report %s' % i, event=event, dtype=dtype)
+            field_report.countries.add(self.country)
+            ERU.objects.create(eru_owner=owner, deployed_to=self.country, event=event)
+            deployment = PersonnelDeployment.objects.create(
+                country_deployed_to=self.country, region_deployed_to=self.region, event_deployed_to=event,
+            )
+            Personnel.objects.create(name='Person %s' % i, type=Personnel.RDRT, country_from=self.country, deployment=deployment)
+
+    def test_eru_get(self):
+        # count, erus, owner's eru_set, eru_set countries, then event appeals, countries, field reports,
+        # field report contacts and countries (independent of the number of rows)
+        with self.assertNumQueries(9):
+            response = self.client.get('/api/v2/eru/')
+        self.assertEqual(response.status_code, 200)
+        full = response.json()['results']
+        self.assertEqual(len(full[0]['event']['field_reports']), 1)
+        self.assertEqual(len(full[0]['eru_owner']['eru_set']), 3)
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v2/eru/', {'mini': 'true'})
+        mini = response.json()['results']
+        full_events = {eru['id']: eru['event']['name'] for eru in full}
+        self.assertEqual({eru['id']: eru['event']['name'] for eru in mini}, full_events)
+        self.assertNotIn('eru_set', mini[0]['eru_owner'])
+        self.assertLess(len(json.dumps(mini)), len(json.dumps(full)))
+
+    def test_personnel_get(self):
+        self.authenticate()
+        # token, count, personnel, then event appeals, countries, field reports, contacts and countries
+        with self.assertNumQueries(8):
+            response = self.client.get('/api/v2/personnel/')
+        self.assertEqual(response.status_code, 200)
+        full = response.json()['results']
+        self.assertEqual(len(full[0]['deployment']['event_deployed_to']['appeals']), 1)
+
+        # The token is now cached: count and personnel only
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v2/personnel/', {'mini': 'true'})
+        mini = response.json()['results']
+        self.assertEqual(
+            {personnel['id']: personnel['deployment']['event_deployed_to']['id'] for personnel in mini},
+            {personnel['id']: personnel['deployment']['event_deployed_to']['id'] for personnel in full},
+        )
+        self.assertNotIn('appeals', mini[0]['deployment']['event_deployed_to'])
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v2/personnel_deployment/', {'mini': 'true'})
+        self.assertEqual(len(response.json()['results']), 3)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProjectImportTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.country = Country.objects.create(name='Import Country', society_name='Import Society', iso='IC')
+        self.district1 = District.objects.create(name='Import District 1', country=self.country)
+        self.district2 = District.objects.create(name='Import District 2', country=self.country)
+        DisasterType.objects.create(name='Import Flood', summary='')
+
+    def run_import(self, rows):
+        c = ProjectImportForm.Columns
+        headers = [
+            c.COUNTRY, c.DISTRICT, c.REPORTING_NS, c.DISASTER_TYPE, c.OPERATION_TYPE, c.PROGRAMME_TYPE,
+            c.PRIMARY_SECTOR, c.TAGS, c.STATUS, c.PROJECT_NAME, c.START_DATE, c.END_DATE, c.BUDGET,
+            c.TARGETED_MALES, c.TARGETED_FEMALES, c.TARGETED_OTHER, c.TARGETED_TOTAL,
+            c.REACHED_MALES, c.REACHED_FEMALES, c.REACHED_OTHERS, c.REACHED_TOTAL,
+        ]
+        content = '\n'.join([';'.join(headers)] + [';'.join(row) for row in rows])
+        project_import = ProjectImport.objects.create(
+            created_by=self.root_user,
+            file=SimpleUploadedFile('projects.csv', content.encode('utf-8')),
+        )
+        ProjectImportForm.run_bulk_upload(project_import, ';', '"')
+        project_import.refresh_from_db()
+        return project_import
+
+    def get_row(self, name, districts='Import District 1,Import District 2', reporting_ns='import society'):
+        return [
+            'Import Country', f'"{districts}"'.replace(',', ';'), reporting_ns, 'Import Flood', 'Programme', 'Bilateral',
+            'WASH', 'Health', 'Ongoing', name, '2020-01-01', '2020-12-31', '1,000',
+            '1', '2', '3', '6', '1', '1', '1', '3',
+        ]
+
+    def test_import(self):
+        rows = [self.get_row(f'Imported Project {i}') for i in range(5)] + [
+            self.get_row('Countrywide Project', districts='Countrywide'),
+        ]
+        project_import = self.run_import(rows)
+        self.assertEqual(project_import.status, ProjectImport.SUCCESS, project_import.message)
+        self.assertEqual(project_import.processed_rows, 6)
+        self.assertEqual(project_import.row_errors, [])
+        self.assertEqual(project_import.projects_created.count(), 6)
+        for project in project_import.projects_created.all():
+            self.assertEqual(project.reporting_ns, self.country)
+            self.assertEqual(project.project_country, self.country)
+            self.assertEqual(project.budget_amount, 1000)
+            self.assertEqual(
+                sorted(project.project_districts.values_list('pk', flat=True)),
+                [self.district1.pk, self.district2.pk],
+            )
+
+    def test_import_row_errors(self):
+        rows = [
+            self.get_row('Valid Project'),
+            self.get_row('Invalid Project', districts='Unknown District'),
+            self.get_row('Invalid Project', reporting_ns='Unknown Society'),
+        ]
+        project_import = self.run_import(rows)
+        self.assertEqual(project_import.status, ProjectImport.FAILURE)
+        self.assertEqual(project_import.processed_rows, 3)
+        self.assertEqual(len(project_import.row_errors), 2)
+        self.assertTrue(project_import.row_errors[0].startswith('ROW 3: project_districts'))
+        self.assertTrue(project_import.row_errors[1].startswith('ROW 4: reporting_ns'))
+        # All or none
+        self.assertEqual(project_import.projects_created.count(), 0)
+        self.assertFalse(Project.objects.filter(name='Valid Project').exists())
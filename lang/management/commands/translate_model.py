@@ -6,37 +6,43 @@ from django.db.models import Q
 from django.core.management import BaseCommand
 
 from lang.translation import (
-    AmazonTranslate,
+    CachedTranslator,
     AVAILABLE_LANGUAGES,
     DEFAULT_LANGUAGE,
 )
 
 LANGUAGES_TO_TRANSLATE = [lang for lang in AVAILABLE_LANGUAGES if lang != DEFAULT_LANGUAGE]
 
-translate = AmazonTranslate()
-
-
-def translate_fields_object(obj, field):
-    default_lang_field = build_localized_fieldname(field, DEFAULT_LANGUAGE)
-    # NOTE: Both <field> and <field>_<default_lang> have same ref (Overide by modeltranslation)
-    default_lang_value = getattr(obj, default_lang_field, None)
-    if not default_lang_value:
-        return
 
+def translate_objects(cached_translator, model, objs, fields):
+    """
+    Translate missing language fields for the given objects and save them using bulk_update
+    Texts are deduped per language so each distinct text is translated only once.
+    """
+    update_fields = set()
     for lang in LANGUAGES_TO_TRANSLATE:
-        lang_field = build_localized_fieldname(field, lang)
-        value = getattr(obj, lang_field, None)
-        if value:
-            continue
-
-        new_value = translate.translate_text(
-            default_lang_value,
+        to_translate = []
+        for obj in objs:
+            for field in fields:
+                # NOTE: Both <field> and <field>_<default_lang> have same ref (Overide by modeltranslation)
+                default_lang_value = getattr(obj, build_localized_fieldname(field, DEFAULT_LANGUAGE), None)
+                lang_field = build_localized_fieldname(field, lang)
+                if not default_lang_value or getattr(obj, lang_field, None):
+                    continue
+                to_translate.append((obj, lang_field, default_lang_value))
+
+        translated = cached_translator.translate_texts(
+            [text for _, _, text in to_translate],
             DEFAULT_LANGUAGE,
             lang,
-        )['TranslatedText']
+        )
+        for obj, lang_field, text in to_translate:
+            setattr(obj, lang_field, translated[text])
+            update_fields.add(lang_field)
 
-        setattr(obj, lang_field, new_value)
-        yield lang_field
+    if update_fields:
+        model.objects.bulk_update(objs, list(update_fields))
+    return update_fields
 
 
 class Command(BaseCommand):
@@ -45,7 +51,20 @@ class Command(BaseCommand):
     """
     help = 'Use Amazon Translate to translate all models translated field\'s values'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows to translate and save per batch',
+        )
+        parser.add_argument(
+            '--max-workers', type=int, default=5,
+            help='Number of concurrent requests to Amazon Translate',
+        )
+
     def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cached_translator = CachedTranslator(max_workers=options['max_workers'])
+
         # get all models excluding proxy- and not managed models
         models = [
             m for m in translator.get_registered_models(abstract=False)
@@ -85,18 +104,23 @@ class Command(BaseCommand):
                     for field in translation_fields
                 ]
             )
-            qs = model.objects.filter(q)
+            qs = model.objects.filter(q).order_by('pk')
 
             qs_count = qs.count()
-            index = 1
+            index = 0
             print('\tFields:', translation_fields)
             print('\tTotal rows:', qs_count)
 
-            for obj in qs.all():
-                print(f'\t\t ({index}/{qs_count}) - {obj}')
-                index += 1
-
-                update_fields = []
-                for field in translation_fields:
-                    update_fields.extend(list(translate_fields_object(obj, field)))
-                obj.save(update_fields=update_fields)
+            batch = []
+            for obj in qs.iterator(chunk_size=batch_size):
+                batch.append(obj)
+                if len(batch) < batch_size:
+                    continue
+                translate_objects(cached_translator, model, batch, translation_fields)
+                index += len(batch)
+                print(f'\t\t ({index}/{qs_count})')
+                batch = []
+            if batch:
+                translate_objects(cached_translator, model, batch, translation_fields)
+                index += len(batch)
+                print(f'\t\t ({index}/{qs_count})')
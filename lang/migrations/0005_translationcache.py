@@ -0,0 +1,28 @@
+# Generated by Django 2.2.13 on 2020-07-01 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lang', '0004_auto_20200616_0713'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationCache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=64, verbose_name='text hash')),
+                ('source_language', models.CharField(choices=[('en', 'English'), ('es', 'Spanish'), ('fr', 'French'), ('ar', 'Arabic')], max_length=8, verbose_name='source language')),
+                ('target_language', models.CharField(choices=[('en', 'English'), ('es', 'Spanish'), ('fr', 'French'), ('ar', 'Arabic')], max_length=8, verbose_name='target language')),
+                ('value', models.TextField(verbose_name='value')),
+            ],
+            options={
+                'verbose_name': 'Translation Cache',
+                'verbose_name_plural': 'Translation Caches',
+                'unique_together': {('text_hash', 'source_language', 'target_language')},
+            },
+        ),
+    ]
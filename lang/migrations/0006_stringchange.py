@@ -0,0 +1,29 @@
+# Generated by Django 2.2.13 on 2020-07-06 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lang', '0005_translationcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StringChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(choices=[('en', 'English'), ('es', 'Spanish'), ('fr', 'French'), ('ar', 'Arabic')], max_length=8, verbose_name='language')),
+                ('version', models.PositiveIntegerField(verbose_name='version')),
+                ('key', models.CharField(max_length=255, verbose_name='key')),
+                ('action', models.CharField(choices=[('set', 'Set'), ('delete', 'Delete')], max_length=8, verbose_name='action')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+            ],
+            options={
+                'verbose_name': 'String Change',
+                'verbose_name_plural': 'String Changes',
+                'unique_together': {('language', 'version', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.13 on 2020-07-20 09:12
+
+from django.db import migrations, models
+
+
+def init_language_versions(apps, schema_editor):
+    """
+        Start from the last version logged by the bulk actions
+    """
+    StringChange = apps.get_model('lang', 'StringChange')
+    LanguageVersion = apps.get_model('lang', 'LanguageVersion')
+
+    LanguageVersion.objects.bulk_create([
+        LanguageVersion(language=language, version=version)
+        for language, version in StringChange.objects.values('language').annotate(
+            version=models.Max('version')
+        ).values_list('language', 'version')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lang', '0006_stringchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LanguageVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(choices=[('en', 'English'), ('es', 'Spanish'), ('fr', 'French'), ('ar', 'Arabic')], max_length=8, unique=True, verbose_name='language')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='version')),
+            ],
+            options={
+                'verbose_name': 'Language Version',
+                'verbose_name_plural': 'Language Versions',
+            },
+        ),
+        migrations.RunPython(init_language_versions, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,16 @@
+import threading
+from contextlib import contextmanager
+
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+# In the shared cache (settings.CACHES), a version or string change invalidates it for all the workers
+LANGUAGE_BUNDLE_CACHE_KEY = 'lang-bundle-{language}'
+LANGUAGE_BUNDLE_CACHE_TIMEOUT = 60 * 60 * 24
 
 
 class String(models.Model):
@@ -17,3 +27,109 @@ class String(models.Model):
 
     def __str__(self):
         return '{} ({})'.format(self.value, self.language)
+
+
+class StringChange(models.Model):
+    """
+    Keys changed by a language bulk action, used to serve the language bundle delta (changes since version N)
+    """
+    SET = 'set'
+    DELETE = 'delete'
+
+    ACTION_CHOICES = (
+        (SET, _('Set')),
+        (DELETE, _('Delete')),
+    )
+
+    language = models.CharField(max_length=8, verbose_name=_('language'), choices=settings.LANGUAGES)
+    version = models.PositiveIntegerField(verbose_name=_('version'))
+    key = models.CharField(max_length=255, verbose_name=_('key'))
+    action = models.CharField(max_length=8, verbose_name=_('action'), choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(verbose_name=_('created at'), auto_now_add=True)
+
+    class Meta:
+        unique_together = ('language', 'version', 'key')
+        verbose_name = _('String Change')
+        verbose_name_plural = _('String Changes')
+
+    def __str__(self):
+        return '{} ({} v{})'.format(self.key, self.language, self.version)
+
+
+class LanguageVersion(models.Model):
+    """
+    Current bundle version of a language, incremented by each bulk action changing its strings
+    """
+    language = models.CharField(max_length=8, verbose_name=_('language'), choices=settings.LANGUAGES, unique=True)
+    version = models.PositiveIntegerField(verbose_name=_('version'), default=0)
+
+    class Meta:
+        verbose_name = _('Language Version')
+        verbose_name_plural = _('Language Versions')
+
+    def __str__(self):
+        return '{} v{}'.format(self.language, self.version)
+
+    @classmethod
+    def get_current_version(cls, language):
+        return cls.objects.filter(language=language).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def increment(cls, language):
+        """
+        New version of the language. The row stays locked until the end of the transaction,
+        so concurrent bulk actions get distinct versions (one after the other).
+        """
+        cls.objects.get_or_create(language=language)
+        cls.objects.filter(language=language).update(version=models.F('version') + 1)
+        return cls.get_current_version(language)
+
+
+# Set while a bulk action changes the strings, it logs its own changes (one version per language)
+_bulk_string_changes = threading.local()
+
+
+@contextmanager
+def bulk_string_changes():
+    _bulk_string_changes.active = True
+    try:
+        yield
+    finally:
+        _bulk_string_changes.active = False
+
+
+@receiver([post_save, post_delete], sender=String)
+def log_string_change(sender, instance, **kwargs):
+    """
+    Strings changed outside of the bulk action (eg: admin panel): once committed, a new version of the language
+    logs the change (served to the ?since=N clients) and the bundle cache is cleared
+    """
+    if getattr(_bulk_string_changes, 'active', False):
+        return
+    language, key = instance.language, instance.key
+    action = StringChange.DELETE if kwargs['signal'] is post_delete else StringChange.SET
+
+    def log_change():
+        with transaction.atomic():
+            version = LanguageVersion.increment(language)
+            StringChange.objects.create(language=language, version=version, key=key, action=action)
+        cache.delete(LANGUAGE_BUNDLE_CACHE_KEY.format(language=language))
+    transaction.on_commit(log_change)
+
+
+class TranslationCache(models.Model):
+    """
+    Translation memory for machine translated model fields (used by translate_model)
+    """
+    text_hash = models.CharField(max_length=64, verbose_name=_('text hash'))
+    source_language = models.CharField(max_length=8, verbose_name=_('source language'), choices=settings.LANGUAGES)
+    target_language = models.CharField(max_length=8, verbose_name=_('target language'), choices=settings.LANGUAGES)
+    value = models.TextField(verbose_name=_('value'))
+
+    class Meta:
+        unique_together = ('text_hash', 'source_language', 'target_language')
+        verbose_name = _('Translation Cache')
+        verbose_name_plural = _('Translation Caches')
+
+    def __str__(self):
+        return '{} ({} -> {})'.format(self.text_hash, self.source_language, self.target_language)
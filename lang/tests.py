@@ -1,8 +1,13 @@
+from unittest import mock
+
 from django.conf import settings
+from django.test import TestCase
+from rest_framework import serializers
 from main.test_case import APITestCase
 
 from .serializers import LanguageBulkActionSerializer
-from .models import String
+from .models import String, StringChange, LanguageVersion, TranslationCache
+from .translation import CachedTranslator, TranslatedModelSerializerMixin
 
 
 class LangTest(APITestCase):
@@ -74,3 +79,149 @@ class LangTest(APITestCase):
         second_string.pop('id')
         self.assertEqual(second_string, {**string_2, 'language': language})
         self.assertEqual(first_string_key, string_1['key'])
+
+    def test_language_bundle_version(self, **kwargs):
+        language = settings.LANGUAGES[0][0]
+        self.authenticate(self.root_user)
+        resp = self.client.get(f'/api/v2/language/{language}/')
+        self.assertEqual(resp.status_code, 200)
+        etag = resp['ETag']
+        version = resp.json()['version']
+        self.assertTrue(etag.startswith('"{}-'.format(version)))
+
+        # Same bundle, not modified
+        resp = self.client.get(f'/api/v2/language/{language}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        String.objects.create(language=language, key='bundle-string-1', value='Value 1', hash='hash-1')
+        data = {
+            'actions': [
+                {'action': LanguageBulkActionSerializer.DELETE, 'key': 'bundle-string-1'},
+                {'action': LanguageBulkActionSerializer.SET, 'key': 'bundle-string-2', 'value': 'Value 2', 'hash': 'hash-2'},
+            ],
+        }
+        resp = self.client.post(f'/api/v2/language/{language}/bulk-action/', data, format='json')
+        self.assertEqual(resp.status_code, 200)
+
+        # Bulk action invalidates the bundle
+        resp = self.client.get(f'/api/v2/language/{language}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        j_resp = resp.json()
+        self.assertEqual(j_resp['version'], version + 1)
+        self.assertIn('bundle-string-2', [string['key'] for string in j_resp['strings']])
+        self.assertNotIn('bundle-string-1', [string['key'] for string in j_resp['strings']])
+
+        data = {
+            'actions': [
+                {'action': LanguageBulkActionSerializer.SET, 'key': 'bundle-string-3', 'value': 'Value 3', 'hash': 'hash-3'},
+                {'action': LanguageBulkActionSerializer.DELETE, 'key': 'bundle-string-2'},
+            ],
+        }
+        self.client.post(f'/api/v2/language/{language}/bulk-action/', data, format='json')
+
+        # Delta since the first bulk action
+        resp = self.client.get(f'/api/v2/language/{language}/', {'since': version + 1})
+        j_resp = resp.json()
+        self.assertEqual(j_resp['version'], version + 2)
+        self.assertEqual([string['key'] for string in j_resp['strings']], ['bundle-string-3'])
+        self.assertEqual(j_resp['deleted_keys'], ['bundle-string-2'])
+
+    def test_bulk_delete_all_languages(self, **kwargs):
+        String.objects.create(language='en', key='shared-key', value='Value', hash='hash')
+        String.objects.create(language='fr', key='shared-key', value='Valeur', hash='hash')
+        fr_version = LanguageVersion.get_current_version('fr')
+        self.authenticate(self.root_user)
+        data = {'actions': [{'action': LanguageBulkActionSerializer.DELETE, 'key': 'shared-key'}]}
+        # The deletions are logged by the bulk action only, not again by the String receiver
+        with mock.patch('lang.models.transaction.on_commit', side_effect=lambda func: func()):
+            resp = self.client.post('/api/v2/language/en/bulk-action/', data, format='json')
+        self.assertEqual(resp.json()['deleted_strings_keys'], ['shared-key'])
+        self.assertFalse(String.objects.filter(key='shared-key').exists())
+        # The other language gets a new version logging the deleted key
+        self.assertEqual(LanguageVersion.get_current_version('fr'), fr_version + 1)
+        self.assertEqual(
+            list(StringChange.objects.filter(language='fr', version=fr_version + 1).values_list('key', 'action')),
+            [('shared-key', StringChange.DELETE)],
+        )
+
+    def test_string_change_outside_bulk_action(self, **kwargs):
+        version = LanguageVersion.get_current_version('es')
+        # TestCase never commits, the on_commit logging is run at once
+        with mock.patch('lang.models.transaction.on_commit', side_effect=lambda func: func()):
+            string = String.objects.create(language='es', key='admin-key', value='Valor', hash='hash')
+            string.delete()
+        self.assertEqual(LanguageVersion.get_current_version('es'), version + 2)
+        self.assertEqual(
+            list(StringChange.objects.filter(language='es', version__gt=version).order_by('version').values_list(
+                'key', 'action',
+            )),
+            [('admin-key', StringChange.SET), ('admin-key', StringChange.DELETE)],
+        )
+        self.authenticate(self.root_user)
+        resp = self.client.get('/api/v2/language/es/', {'since': version + 1})
+        self.assertEqual(resp.json()['deleted_keys'], ['admin-key'])
+
+    def test_version_increment(self, **kwargs):
+        version = LanguageVersion.get_current_version('es')
+        self.assertEqual(LanguageVersion.increment('es'), version + 1)
+        self.assertEqual(LanguageVersion.increment('es'), version + 2)
+        self.assertEqual(LanguageVersion.objects.filter(language='es').count(), 1)
+
+
+class StubTranslateClient():
+    def __init__(self):
+        self.calls = []
+
+    def translate_text(self, text, source_language, dest_language):
+        self.calls.append((text, source_language, dest_language))
+        return {'TranslatedText': f'{text} ({dest_language})'}
+
+
+class CachedTranslatorTest(TestCase):
+
+    def test_translate_texts(self):
+        client = StubTranslateClient()
+        translator = CachedTranslator(translator=client, max_workers=2)
+
+        translated = translator.translate_texts(['Flood', 'Flood', 'Drought', ''], 'en', 'es')
+        self.assertEqual(translated, {'Flood': 'Flood (es)', 'Drought': 'Drought (es)'})
+        # Duplicate and empty texts are not sent for translation
+        self.assertEqual(sorted(client.calls), [('Drought', 'en', 'es'), ('Flood', 'en', 'es')])
+        self.assertEqual(TranslationCache.objects.filter(source_language='en', target_language='es').count(), 2)
+
+        # Already translated texts are served from the translation memory
+        translated = translator.translate_texts(['Flood', 'Earthquake'], 'en', 'es')
+        self.assertEqual(translated, {'Flood': 'Flood (es)', 'Earthquake': 'Earthquake (es)'})
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual(client.calls[-1], ('Earthquake', 'en', 'es'))
+
+        # Translation memory is per language pair
+        translator.translate_texts(['Flood'], 'en', 'fr')
+        self.assertEqual(client.calls[-1], ('Flood', 'en', 'fr'))
+
+
+class TranslatedModelSerializerMixinTest(TestCase):
+
+    def test_field_plan_is_cached(self):
+        from deployments.serializers import ProjectSerializer
+
+        TranslatedModelSerializerMixin._translated_field_plans.clear()
+        TranslatedModelSerializerMixin._translated_fields.clear()
+        build_field = serializers.ModelSerializer.build_field
+        with mock.patch('lang.translation.get_translatable_fields_for_model', return_value=[]) as patched, \
+                mock.patch.object(serializers.ModelSerializer, 'build_field', autospec=True, side_effect=build_field) as built:
+            first = ProjectSerializer()
+            fields = first.fields.keys()
+            build_count = built.call_count
+            second = ProjectSerializer()
+            self.assertEqual(second.fields.keys(), fields)
+            self.assertEqual(ProjectSerializer(many=True).child.fields.keys(), fields)
+        self.assertEqual(patched.call_count, 1)
+        # The fields are built once, each serializer binds its own copies
+        self.assertEqual(built.call_count, build_count)
+        self.assertIsNot(first.fields['name'], second.fields['name'])
+        self.assertIs(second.fields['name'].parent, second)
+        # Including the child of the many related fields
+        self.assertIs(second.fields['project_districts'].child_relation.root, second)
+        self.assertIn((ProjectSerializer, ('en',)), TranslatedModelSerializerMixin._translated_field_plans)
@@ -1,4 +1,9 @@
+import copy
 import logging
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
 
 from modeltranslation.admin import TranslationBaseModelAdmin
@@ -16,12 +21,16 @@ from rest_framework import serializers
 from django.utils.translation import get_language
 from django.conf import settings
 
+from .models import TranslationCache
+
 logger = logging.getLogger(__name__)
 
 # Array of language : ['en', 'es', 'fr', ....]
 DJANGO_AVAILABLE_LANGUAGES = set([lang[0] for lang in settings.LANGUAGES])
 AVAILABLE_LANGUAGES = mt_settings.AVAILABLE_LANGUAGES
 DEFAULT_LANGUAGE = mt_settings.DEFAULT_LANGUAGE
+# Fields with bound child fields, copied with their children (TranslatedModelSerializerMixin.get_fields)
+NESTED_FIELD_CLASSES = (serializers.BaseSerializer, serializers.ManyRelatedField)
 
 
 # Overwrite TranslationBaseModelAdmin _exclude_original_fields to only show current language field in Admin panel
@@ -90,17 +99,79 @@ class AmazonTranslate(object):
         )
 
 
+class CachedTranslator(object):
+    """
+    Translation memory in front of AmazonTranslate
+    - Dedupe texts per (source, target) language pair
+    - Lookup/Store translated texts in TranslationCache using (text hash, source, target)
+    - Translate only the missing texts, concurrently using a bounded thread pool
+    """
+    def __init__(self, translator=None, max_workers=5):
+        self.translator = translator or AmazonTranslate()
+        self.max_workers = max_workers
+
+    @staticmethod
+    def get_text_hash(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _translate(self, text, source_language, dest_language):
+        return self.translator.translate_text(text, source_language, dest_language)['TranslatedText']
+
+    def translate_texts(self, texts, source_language, dest_language):
+        """
+        Return {text: translated_text} for the given texts
+        """
+        texts_by_hash = {self.get_text_hash(text): text for text in set(texts) if text}
+        translated = {
+            texts_by_hash[text_hash]: value
+            for text_hash, value in TranslationCache.objects.filter(
+                text_hash__in=texts_by_hash.keys(),
+                source_language=source_language,
+                target_language=dest_language,
+            ).values_list('text_hash', 'value')
+        }
+        missing = [
+            (text_hash, text) for text_hash, text in texts_by_hash.items()
+            if text not in translated
+        ]
+        if not missing:
+            return translated
+
+        # NOTE: Only the API calls are done in the threads, DB operations are kept in the caller's thread
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            new_values = list(executor.map(
+                lambda text: self._translate(text, source_language, dest_language),
+                [text for _, text in missing],
+            ))
+
+        TranslationCache.objects.bulk_create([
+            TranslationCache(
+                text_hash=text_hash,
+                source_language=source_language,
+                target_language=dest_language,
+                value=value,
+            )
+            for (text_hash, _), value in zip(missing, new_values)
+        ], ignore_conflicts=True)
+        translated.update({text: value for (_, text), value in zip(missing, new_values)})
+        return translated
+
+
 class TranslatedModelSerializerMixin(serializers.ModelSerializer):
     """
     Translation mixin for serializer
     - Using header/GET Params detect languge
     - Assign original field name to requested field_<language>
     - Provide fields for multiple langauge if multiple languages is specified. eg: field_en, field_es
+    - Field plan (field names + source remapping) and the built fields are computed once per
+      (serializer, requested languages), each serializer instance gets its own copies to bind
     """
-    def get_field_names(self, declared_fields, info):
-        fields = super().get_field_names(declared_fields, info)
+    # {(serializer class, included languages): (field names, [(field, lang_field), ...])}
+    _translated_field_plans = {}
+    # {(serializer class, included languages): {field name: unbound field}}
+    _translated_fields = {}
 
-        requested_langs = []
+    def _get_included_languages(self):
         if self.context.get('request') is not None:
             lang_param = self.context['request'].query_params.get('lang') or django_get_language()
         else:
@@ -111,31 +182,51 @@ class TranslatedModelSerializerMixin(serializers.ModelSerializer):
             requested_langs = AVAILABLE_LANGUAGES
         else:
             requested_langs = lang_param.split(',') if lang_param else []
+        return tuple([lang for lang in AVAILABLE_LANGUAGES if lang in requested_langs])
 
-        excluded_langs = [lang for lang in AVAILABLE_LANGUAGES if lang not in requested_langs]
-        included_langs = [lang for lang in AVAILABLE_LANGUAGES if lang in requested_langs]
-        exclude_fields = []
-        included_fields_lang = {}
-        for f in get_translatable_fields_for_model(self.Meta.model):
-            exclude_fields.append(f)
-            for lang in excluded_langs:
-                exclude_fields.append(build_localized_fieldname(f, lang))
-            included_fields_lang[f] = []
-            for lang in included_langs:
-                included_fields_lang[f].append(build_localized_fieldname(f, lang))
-
-        self.included_fields_lang = included_fields_lang
-        exclude_fields = set(exclude_fields)
-        return [
-            f for f in fields if f not in exclude_fields
-        ]
+    def get_field_names(self, declared_fields, info):
+        included_langs = self._get_included_languages()
+        plan_key = (type(self), included_langs)
+        plan = self._translated_field_plans.get(plan_key)
+        if plan is None:
+            fields = super().get_field_names(declared_fields, info)
+
+            excluded_langs = [lang for lang in AVAILABLE_LANGUAGES if lang not in included_langs]
+            exclude_fields = []
+            remap_fields = []
+            for f in get_translatable_fields_for_model(self.Meta.model):
+                exclude_fields.append(f)
+                for lang in excluded_langs:
+                    exclude_fields.append(build_localized_fieldname(f, lang))
+                if len(included_langs) == 1:
+                    remap_fields.append((f, build_localized_fieldname(f, included_langs[0])))
+
+            exclude_fields = set(exclude_fields)
+            plan = (
+                [f for f in fields if f not in exclude_fields],
+                remap_fields,
+            )
+            self._translated_field_plans[plan_key] = plan
+
+        field_names, _ = plan
+        return list(field_names)
 
     def get_fields(self, *args, **kwargs):
-        fields = super().get_fields(*args, **kwargs)
-        for field, lang_fields in self.included_fields_lang.items():
-            if len(lang_fields) != 1:
-                break
-            lang_field = lang_fields[0]
+        fields_key = (type(self), self._get_included_languages())
+        built_fields = self._translated_fields.get(fields_key)
+        if built_fields is None:
+            built_fields = super().get_fields(*args, **kwargs)
+            self._translated_fields[fields_key] = built_fields
+
+        # Fields are bound to their serializer (field_name, parent, source...), each instance binds shallow copies.
+        # Nested serializers and many related fields are instantiated again (Field.__deepcopy__),
+        # their child fields are bound to them.
+        fields = OrderedDict(
+            (field_name, copy.deepcopy(field) if isinstance(field, NESTED_FIELD_CLASSES) else copy.copy(field))
+            for field_name, field in built_fields.items()
+        )
+        _, remap_fields = self._translated_field_plans[fields_key]
+        for field, lang_field in remap_fields:
             fields[field] = fields.pop(lang_field)
             fields[field].source = lang_field
         return fields
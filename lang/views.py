@@ -1,8 +1,13 @@
+import hashlib
+import json
+
+from django.core.cache import cache
 from django.db import transaction
 from rest_framework.decorators import action as djaction
 from rest_framework import (
     viewsets,
     response,
+    status,
 )
 
 from django.conf import settings
@@ -14,12 +19,40 @@ from .serializers import (
 )
 from .models import (
     String,
+    StringChange,
+    LanguageVersion,
+    LANGUAGE_BUNDLE_CACHE_KEY,
+    LANGUAGE_BUNDLE_CACHE_TIMEOUT,
+    bulk_string_changes,
 )
 
 
+def get_language_bundle(language, version=None, rebuild=False):
+    """
+    Return {'version', 'etag': <version and content hash>, 'strings': <serialized strings>} for the given language
+    Cached bundle is only used if it matches the current version, so a bulk action (new version)
+    invalidates it for all the workers.
+    """
+    if version is None:
+        version = LanguageVersion.get_current_version(language)
+    cache_key = LANGUAGE_BUNDLE_CACHE_KEY.format(language=language)
+    bundle = None if rebuild else cache.get(cache_key)
+    if bundle is None or bundle['version'] != version:
+        strings = StringSerializer(String.objects.filter(language=language).order_by('key'), many=True).data
+        etag = hashlib.md5(
+            json.dumps(strings, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        bundle = {
+            'version': version,
+            'etag': '"{}-{}"'.format(version, etag),
+            'strings': strings,
+        }
+        cache.set(cache_key, bundle, LANGUAGE_BUNDLE_CACHE_TIMEOUT)
+    return bundle
+
+
 class LanguageViewSet(viewsets.ViewSet):
     # TODO: Add permission level
-    # TODO: Cache retrive response to file
     permission_classes = (ModifyBySuperAdminOnly,)
     lookup_url_kwarg = 'pk'
 
@@ -34,16 +67,51 @@ class LanguageViewSet(viewsets.ViewSet):
         })
 
     def retrieve(self, request, pk=None, version=None):
+        """
+        Language bundle
+        - ?since=<version>: Return only the strings changed (and keys deleted) by bulk actions after the version
+        - Full bundle is served with a content hash ETag (If-None-Match returns 304)
+        """
         languages = settings.LANGUAGES
         code, title = next((lang for lang in languages if lang[0] == pk), (None, None))
+        current_version = LanguageVersion.get_current_version(code)
+
+        since = request.query_params.get('since')
+        if since is not None and since.isdigit() and 0 < int(since) <= current_version:
+            since = int(since)
+            changes = StringChange.objects.filter(language=code, version__gt=since).order_by('version')
+            changed_keys = {}
+            for key, action in changes.values_list('key', 'action'):
+                # Last action wins
+                changed_keys[key] = action
+            return response.Response({
+                'code': code,
+                'title': title,
+                'version': current_version,
+                'since': since,
+                'strings': StringSerializer(
+                    String.objects.filter(
+                        language=code,
+                        key__in=[key for key, action in changed_keys.items() if action == StringChange.SET],
+                    ).order_by('key'),
+                    many=True,
+                ).data,
+                'deleted_keys': [key for key, action in changed_keys.items() if action == StringChange.DELETE],
+            })
+
+        bundle = get_language_bundle(code, version=current_version)
+        headers = {'ETag': bundle['etag']}
+        if request.META.get('HTTP_IF_NONE_MATCH') == bundle['etag']:
+            return response.Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
         obj = {
             'code': code,
             'title': title,
-            'strings': StringSerializer(String.objects.filter(language=code), many=True).data,
+            'version': current_version,
+            'strings': bundle['strings'],
         }
 
-        return response.Response(obj)
+        return response.Response(obj, headers=headers)
 
     @transaction.atomic
     @djaction(
@@ -90,8 +158,33 @@ class LanguageViewSet(viewsets.ViewSet):
                 string.hash = changed_strings[string.key]['hash']
             String.objects.bulk_update(to_update_strings, ['value', 'hash'])
             changed_strings = to_update_strings
+
+        # Deleted keys are removed from all the languages
+        deleted_language_keys = {lang: set(deleted_string_keys)}
         if len(deleted_string_keys):
-            String.objects.filter(key__in=deleted_string_keys).delete()
+            deleted_strings_qs = String.objects.filter(key__in=deleted_string_keys)
+            for language, key in deleted_strings_qs.values_list('language', 'key'):
+                deleted_language_keys.setdefault(language, set()).add(key)
+            with bulk_string_changes():
+                deleted_strings_qs.delete()
+
+        # Log the changes as a new bundle version of each changed language, and rebuild the bundles once committed
+        # (versions are locked in the same order by all the bulk actions)
+        for language, deleted_keys in sorted(deleted_language_keys.items()):
+            new_version = LanguageVersion.increment(language)
+            changes = {}
+            if language == lang:
+                changes.update({string.key: StringChange.SET for string in [*new_strings, *changed_strings]})
+            changes.update({key: StringChange.DELETE for key in deleted_keys})
+            StringChange.objects.bulk_create([
+                StringChange(language=language, version=new_version, key=key, action=action)
+                for key, action in changes.items()
+            ])
+            transaction.on_commit(
+                lambda language=language, new_version=new_version: get_language_bundle(
+                    language, version=new_version, rebuild=True,
+                )
+            )
 
         return response.Response({
             'new_strings': StringSerializer(new_strings, many=True).data,
@@ -48,6 +48,7 @@ echo "export DJANGO_DB_PORT=\"$DJANGO_DB_PORT\"" >> $HOME/.env
 echo "export APPEALS_USER=\"$APPEALS_USER\"" >> $HOME/.env
 echo "export APPEALS_PASS=\"$APPEALS_PASS\"" >> $HOME/.env
 echo "export ES_HOST=\"$ES_HOST\"" >> $HOME/.env
+echo "export MEMCACHED_LOCATION=\"$MEMCACHED_LOCATION\"" >> $HOME/.env
 echo "export EMAIL_HOST=\"$EMAIL_HOST\"" >> $HOME/.env
 echo "export EMAIL_PORT=\"$EMAIL_PORT\"" >> $HOME/.env
 echo "export EMAIL_USER=\"$EMAIL_USER\"" >> $HOME/.env
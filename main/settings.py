@@ -68,7 +68,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
@@ -87,14 +87,21 @@ REST_FRAMEWORK = {
 }
 
 GRAPHENE = {
-    'SCHEMA': 'api.schema.schema'
+    'SCHEMA': 'api.schema.schema',
+    'RELAY_CONNECTION_MAX_LIMIT': 100,
 }
+# Queries deeper or more expensive than these are rejected (see api.schema.get_query_depth_and_cost)
+GRAPHQL_MAX_QUERY_DEPTH = 10
+GRAPHQL_MAX_QUERY_COST = 10000
 
 AZURE_STORAGE = {
     'CONTAINER': 'api',
     'ACCOUNT_NAME': os.environ.get('AZURE_STORAGE_ACCOUNT'),
     'ACCOUNT_KEY': os.environ.get('AZURE_STORAGE_KEY'),
     'USE_SSL': False,
+    'IS_EMULATED': os.environ.get('AZURE_STORAGE_EMULATED') == 'true',
+    # Local disk cache of the read blobs (api.storage.AzureDiskCache), defaults to a temporary directory
+    'CACHE_DIR': os.environ.get('AZURE_STORAGE_CACHE_DIR'),
 }
 
 MIDDLEWARE = [
@@ -154,6 +161,24 @@ DATABASES = {
     }
 }
 
+# Shared by the gunicorn workers and the cron commands: the auth, access and other caches are cleared on change,
+# which has to reach every process (a per-process LocMemCache would keep serving revoked entries, see api.W001).
+# MEMCACHED_LOCATION: comma separated host:port list, without it (local development, tests) the cache is per process
+MEMCACHED_LOCATION = os.environ.get('MEMCACHED_LOCATION')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
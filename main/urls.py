@@ -18,7 +18,6 @@ from django.conf import settings
 from django.urls import path
 from django.contrib import admin
 from django.views.generic import RedirectView
-from graphene_django.views import GraphQLView
 from django.conf.urls.i18n import i18n_patterns
 from api.views import (
     GetAuthToken,
@@ -26,6 +25,8 @@ from api.views import (
     RecoverPassword,
     ShowUsername,
     EsPageSearch,
+    EsPageMultiSearch,
+    EsPageSuggest,
     EsPageHealth,
     AggregateByDtype,
     AggregateByTime,
@@ -35,7 +36,8 @@ from api.views import (
     AreaAggregate,
     AddCronJobLog,
     DummyHttpStatusError,
-    DummyExceptionError
+    DummyExceptionError,
+    LimitedGraphQLView,
 )
 from registrations.views import (
     NewRegistration,
@@ -119,8 +121,10 @@ admin.site.site_title = 'IFRC Go admin'
 
 urlpatterns = [
     url(r'^api/v1/es_search/', EsPageSearch.as_view()),
+    url(r'^api/v1/es_msearch/', EsPageMultiSearch.as_view()),
+    url(r'^api/v1/es_suggest/', EsPageSuggest.as_view()),
     url(r'^api/v1/es_health/', EsPageHealth.as_view()),
-    url(r'^api/v1/graphql/', GraphQLView.as_view(graphiql=True)),
+    url(r'^api/v1/graphql/', LimitedGraphQLView.as_view(graphiql=True)),
     url(r'^api/v1/aggregate/', AggregateByTime.as_view()),
     url(r'^api/v1/aggregate_dtype/', AggregateByDtype.as_view()),
     url(r'^api/v1/aggregate_area/', AreaAggregate.as_view()),
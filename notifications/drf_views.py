@@ -1,5 +1,5 @@
 from django_filters import rest_framework as filters
-from rest_framework.authentication import TokenAuthentication
+from api.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets
 from .models import SurgeAlert, Subscription
@@ -20,7 +20,7 @@ class SurgeAlertFilter(filters.FilterSet):
         }
 
 class SurgeAlertViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     queryset = SurgeAlert.objects.all()
     filter_class = SurgeAlertFilter
     ordering_fields = ('created_at', 'atype', 'category', 'event',)
@@ -31,7 +31,7 @@ class SurgeAlertViewset(viewsets.ReadOnlyModelViewSet):
 
 class SubscriptionViewset(viewsets.ModelViewSet):
     serializer_class = SubscriptionSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     def get_queryset(self):
         return Subscription.objects.filter(user=self.request.user)
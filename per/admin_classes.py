@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.db.models import Q
+from api.access import get_access_profile
 
 # Extend the model admin with methods for determining whether a user has
 # country- and region-specific permissions.
@@ -8,22 +9,12 @@ from django.db.models import Q
 
 class RegionRestrictedAdmin(admin.ModelAdmin):
     def get_request_user_regions(self, request):
-        permissions = request.user.get_all_permissions()
-        regions = []
-        countries = []
-        for permission_name in permissions:
-            if 'api.per_country_admin_' in permission_name:
-                country_id = permission_name[22:]
-                if country_id.isdigit():
-                    countries.append(country_id)
-            elif 'api.per_region_admin_' in permission_name:
-                region_id = permission_name[21:]
-                if region_id.isdigit():
-                    regions.append(region_id)
-        return countries, regions
+        profile = get_access_profile(request.user)
+        return profile.per_country_ids, profile.per_region_ids
 
     def get_filtered_queryset(self, request, queryset, dispatch):
-        if request.user.is_superuser or request.user.has_perm('api.ifrc_admin') or request.user.has_perm('api.per_core_admin'):
+        profile = get_access_profile(request.user)
+        if profile.is_ifrc or profile.is_per_core_admin:
             return queryset
         countries, regions = self.get_request_user_regions(request)
 
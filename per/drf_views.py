@@ -2,7 +2,8 @@ from rest_framework.status import HTTP_201_CREATED, HTTP_200_OK
 from rest_framework.generics import GenericAPIView, CreateAPIView, UpdateAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
+from api.access import get_access_profile
+from api.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets
 from django.contrib import admin
@@ -18,12 +19,14 @@ from .admin_classes import RegionRestrictedAdmin
 from api.models import Country, Region
 from api.serializers import (MiniCountrySerializer, NotCountrySerializer)
 from django.conf import settings
+from django.core.cache import cache
 from datetime import datetime
 import pytz
 
 from django.contrib.auth.models import User, Group
 from .models import (
-    Draft, Form, FormData, NSPhase, WorkPlan, Overview, NiceDocument
+    Draft, Form, FormData, NSPhase, WorkPlan, Overview, NiceDocument,
+    PER_DASHBOARD_CACHE_KEYS, PER_DASHBOARD_CACHE_TIMEOUT,
 )
 
 from .serializers import (
@@ -55,7 +58,7 @@ class DraftFilter(filters.FilterSet):
 
 class DraftViewset(viewsets.ReadOnlyModelViewSet):
     queryset = Draft.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     filter_class = DraftFilter
     # It is not checked whether this user is the same as the saver. Maybe (for helpers) it is not needed really.
@@ -69,7 +72,7 @@ class DraftViewset(viewsets.ReadOnlyModelViewSet):
 
 class FormViewset(viewsets.ReadOnlyModelViewSet):
     queryset = Form.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -99,7 +102,7 @@ class FormDataViewset(viewsets.ReadOnlyModelViewSet):
     """Can use 'new' GET parameter for using data only after the last due_date"""
     # Duplicate of PERDocsViewset
     queryset = FormData.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -121,9 +124,8 @@ class FormDataViewset(viewsets.ReadOnlyModelViewSet):
             if country:
                 cond2 = Q(form__country_id=country[0].id)
         queryset = FormData.objects.filter(cond1 & cond2)
-        if queryset.exists():
-            queryset = self.get_filtered_queryset(self.request, queryset, 2)
-        return queryset
+        # Scoped by the cached access profile, no permission or existence queries
+        return self.get_filtered_queryset(self.request, queryset, 2)
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -135,7 +137,7 @@ class FormDataViewset(viewsets.ReadOnlyModelViewSet):
 class FormCountryViewset(viewsets.ReadOnlyModelViewSet):
     """shows the (PER editable) countries for a user."""
     queryset = Country.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -157,7 +159,7 @@ class PERDocsViewset(viewsets.ReadOnlyModelViewSet):
     """ To collect PER Documents """
     # Duplicate of FormDataViewset
     queryset = NiceDocument.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -230,7 +232,7 @@ class PERDocsViewset(viewsets.ReadOnlyModelViewSet):
 class FormStatViewset(viewsets.ReadOnlyModelViewSet):
     """Shows name, code, country_id, language of filled forms"""
     queryset = Form.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
 
     def get_queryset(self):
         queryset =  Form.objects.all()
@@ -246,7 +248,7 @@ class FormStatViewset(viewsets.ReadOnlyModelViewSet):
 class FormPermissionViewset(viewsets.ReadOnlyModelViewSet):
     """Shows if a user has permission to PER frontend tab or not"""
     queryset = Country.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -254,7 +256,8 @@ class FormPermissionViewset(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         queryset =  Country.objects.all()
-        if self.get_filtered_queryset(self.request, queryset, 3).exists():
+        profile = get_access_profile(self.request.user)
+        if profile.is_ifrc or profile.is_per_core_admin or self.get_filtered_queryset(self.request, queryset, 3).exists():
             return [Country.objects.get(id=1)]
         else:
             return Country.objects.none()
@@ -294,28 +297,25 @@ class EngagedNSPercentageViewset(viewsets.ReadOnlyModelViewSet):
             last_duedate = timezone.localize(datetime(2000, 11, 15, 9, 59, 25, 0))
         if not next_duedate:
             next_duedate = timezone.localize(datetime(2222, 11, 15, 9, 59, 25, 0))
-        queryset1 = Region.objects.all().annotate(Count('country')).values('id', 'country__count')
-        queryset2 = Region.objects.filter(country__form__submitted_at__gt=last_duedate) \
-                    .values('id').annotate(forms_sent=Count('country', distinct=True))
-                  # .values('id').annotate(forms_sent=Count('country__form__code', distinct=True)) # The original plan was: count sent forms also. But ^ not, only countries.
-
-        # We merge the 2 lists (all and forms_sent), like {'id': 2, 'country__count': 37} and {'id': 2, 'forms_sent': 2} to
-        #                                                 {'id': 2, 'country__count': 37, 'forms_sent': 2}, even with zeroes.
-        result=[]
-        for i in queryset1:
-            i['forms_sent'] = 0
-            for j in queryset2:
-                if int(j['id']) == int(i['id']):
-                # if this never occurs, (so no form-sender country in this region), forms_sent remain 0
-                    i['forms_sent'] = j['forms_sent']
-            result.append(i)
-        # [{'id': 0, 'country__count': 49, 'forms_sent': 0}, {'id': 1, 'country__count': 35, 'forms_sent': 1}...
-        return result
+
+        def get_engaged_ns_percentage():
+            # [{'id': 0, 'country__count': 49, 'forms_sent': 0}, {'id': 1, 'country__count': 35, 'forms_sent': 1}...
+            return list(
+                Region.objects.annotate(
+                    country__count=Count('country', distinct=True),
+                    # Only countries are counted, not the sent forms
+                    forms_sent=Count('country', filter=Q(country__form__submitted_at__gt=last_duedate), distinct=True),
+                ).values('id', 'country__count', 'forms_sent')
+            )
+
+        return cache.get_or_set(
+            PER_DASHBOARD_CACHE_KEYS['engaged_ns_percentage'], get_engaged_ns_percentage, PER_DASHBOARD_CACHE_TIMEOUT
+        )
 
 class GlobalPreparednessViewset(viewsets.ReadOnlyModelViewSet):
     """Global Preparedness Highlights"""
     queryset = Form.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     serializer_class = GlobalPreparednessSerializer
 
@@ -327,14 +327,16 @@ class GlobalPreparednessViewset(viewsets.ReadOnlyModelViewSet):
             last_duedate = timezone.localize(datetime(2000, 11, 15, 9, 59, 25, 0))
         if not next_duedate:
             next_duedate = timezone.localize(datetime(2222, 11, 15, 9, 59, 25, 0))
-        queryset = FormData.objects.filter(form__submitted_at__gt=last_duedate, selected_option=7).select_related('form')
-        result=[]
-        for i in queryset:
-            j = {'id': i.form.id}
-            j.update({'code': i.form.code})
-            j.update({'question_id': i.question_id})
-            result.append(j)
-        return result
+
+        def get_global_preparedness():
+            return list(
+                FormData.objects.filter(form__submitted_at__gt=last_duedate, selected_option=7)
+                .values('form_id', 'form__code', 'question_id')
+            )
+
+        return cache.get_or_set(
+            PER_DASHBOARD_CACHE_KEYS['global_preparedness'], get_global_preparedness, PER_DASHBOARD_CACHE_TIMEOUT
+        )
 
 class NSPhaseFilter(filters.FilterSet):
     country = filters.NumberFilter(field_name='country', lookup_expr='exact')
@@ -407,7 +409,7 @@ class OverviewViewset(viewsets.ReadOnlyModelViewSet):
 
 class OverviewStrictViewset(OverviewViewset):
     """ PER Overview Viewset - strict"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     serializer_class = OverviewSerializer
 
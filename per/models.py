@@ -1,7 +1,10 @@
 import uuid
 from api.models import Country
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from enumfields import EnumIntegerField
@@ -171,6 +174,25 @@ class FormData(models.Model):
         return question_details(self.question_id, self.form.code)
 
 
+# Dashboard aggregates only change when forms are sent or edited
+PER_DASHBOARD_CACHE_KEYS = {
+    'engaged_ns_percentage': 'per-dashboard-engaged-ns-percentage',
+    'global_preparedness': 'per-dashboard-global-preparedness',
+}
+PER_DASHBOARD_CACHE_TIMEOUT = 60 * 5
+
+
+def clear_per_dashboard_cache():
+    """ Once committed, not to cache the aggregates of the uncommitted forms again (bulk writes call it directly) """
+    transaction.on_commit(lambda: cache.delete_many(PER_DASHBOARD_CACHE_KEYS.values()))
+
+
+@receiver([post_save, post_delete], sender=Form)
+@receiver([post_save, post_delete], sender=FormData)
+def per_form_changed(sender, **kwargs):
+    clear_per_dashboard_cache()
+
+
 class PriorityValue(IntEnum):
     LOW = 0
     MID = 1
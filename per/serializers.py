@@ -52,8 +52,8 @@ class EngagedNSPercentageSerializer(serializers.ModelSerializer):
         fields = ('id', 'country__count', 'forms_sent',)
 
 class GlobalPreparednessSerializer(serializers.Serializer):
-    id = serializers.IntegerField()
-    code = serializers.CharField(max_length=10)
+    id = serializers.IntegerField(source='form_id')
+    code = serializers.CharField(max_length=10, source='form__code')
     question_id = serializers.CharField(max_length=20)
     class Meta:
         fields = ('id', 'code', 'question_id',)
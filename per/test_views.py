@@ -1,6 +1,13 @@
+from unittest import mock
+from django.core.cache import cache
 from django.test import TestCase
 from rest_framework.test import APITestCase
 from django.core.exceptions import ObjectDoesNotExist
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from api.models import Country, Region
+from .models import Form, FormData
+from .views import bulk_update_form_data
 
 class SmokeTest(APITestCase):
     def test_simple_form(self):
@@ -16,3 +23,74 @@ class SmokeTest(APITestCase):
         headers = {'CONTENT_TYPE': 'application/json'}
         resp = self.client.post('/sendperform', body, format='json', headers=headers)
         self.assertEqual(resp.status_code, 200)
+
+    def test_form_bulk_submit_and_edit(self):
+        user = User.objects.create(username='per_user')
+        token = Token.objects.create(user=user)
+        data = [{'id': '1.%s' % i, 'op': 0, 'nt': 'notes %s' % i} for i in range(100)]
+        body = {'code': 'A1', 'name': 'Nemo', 'language': 1, 'data': data}
+        # form + answers in one insert, inside a transaction (savepoints in tests)
+        with self.assertNumQueries(4):
+            resp = self.client.post('/sendperform', body, format='json')
+        self.assertEqual(resp.status_code, 200)
+        form = Form.objects.get(code='A1')
+        self.assertEqual(FormData.objects.filter(form=form).count(), 100)
+
+        edit_data = [{'id': '1.%s' % i, 'op': 3, 'nt': 'changed %s' % i} for i in range(50)]
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(token))
+        resp = self.client.post('/editperform', {'id': form.pk, 'data': edit_data}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(FormData.objects.filter(form=form, selected_option=3).count(), 50)
+        self.assertEqual(FormData.objects.get(form=form, question_id='1.1').notes, 'changed 1')
+        self.assertEqual(FormData.objects.get(form=form, question_id='1.99').notes, 'notes 99')
+
+        # Unknown question: nothing is changed
+        resp = self.client.post('/editperform', {
+            'id': form.pk, 'name': 'Changed', 'data': [{'id': '1.0', 'op': 0}, {'id': '9.9', 'op': 0}],
+        }, format='json')
+        self.assertEqual(resp.status_code, 400)
+        form.refresh_from_db()
+        self.assertEqual(form.name, 'Nemo')
+        self.assertEqual(FormData.objects.get(form=form, question_id='1.0').selected_option.value, 3)
+
+    def test_form_submit_rollback(self):
+        body = {'code': 'A2', 'name': 'Nemo', 'language': 1, 'data': [{'id': '1.1', 'op': 0, 'nt': 'notes'}, {'id': '1.2'}]}
+        resp = self.client.post('/sendperform', body, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Form.objects.filter(code='A2').exists())
+
+    def test_dashboard_aggregates(self):
+        cache.clear()
+        region = Region.objects.create(name=0)
+        countries = [Country.objects.create(name='PER Country %s' % i, region=region) for i in range(3)]
+        for country in countries[:2]:
+            for code in ('A1', 'A2'):
+                form = Form.objects.create(code=code, name='Nemo', language=1, country=country)
+                FormData.objects.create(form=form, question_id='1.1', selected_option=7, notes='')
+                FormData.objects.create(form=form, question_id='1.2', selected_option=0, notes='')
+
+        resp = self.client.get('/api/v2/per_engaged_ns_percentage/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn({'id': region.pk, 'country__count': 3, 'forms_sent': 2}, resp.json()['results'])
+
+        user = User.objects.create(username='per_dashboard_user')
+        self.client.force_authenticate(user=user)
+        resp = self.client.get('/api/v2/per_global_preparedness/')
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()['results']
+        self.assertEqual(len(results), 4)
+        self.assertEqual(set(item['question_id'] for item in results), {'1.1'})
+        self.assertEqual(set(item['code'] for item in results), {'A1', 'A2'})
+
+        # Served from cache until a form changes (once committed, TestCase never commits: on_commit is run at once)
+        with self.assertNumQueries(0):
+            self.client.get('/api/v2/per_global_preparedness/')
+        with mock.patch('per.models.transaction.on_commit', side_effect=lambda func: func()):
+            form.delete()
+            resp = self.client.get('/api/v2/per_global_preparedness/')
+            self.assertEqual(len(resp.json()['results']), 3)
+
+            # The bulk writes of the form answers too
+            bulk_update_form_data([{'id': '1.2', 'op': 7}], Form.objects.get(country=countries[0], code='A1'))
+            resp = self.client.get('/api/v2/per_global_preparedness/')
+            self.assertEqual(len(resp.json()['results']), 4)
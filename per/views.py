@@ -1,4 +1,5 @@
 import json, datetime, pytz
+from django.db import transaction
 from django.http import JsonResponse, HttpResponse
 from api.views import (
     bad_request,
@@ -7,11 +8,10 @@ from api.views import (
     PublicJsonRequestView,
 )
 from rest_framework import viewsets
-from django.contrib.auth.models import User
 from .models import (
-    Draft, Form, FormData, WorkPlan, Overview
+    Draft, Form, FormData, WorkPlan, Overview, clear_per_dashboard_cache
 )
-from rest_framework.authtoken.models import Token
+from api.authentication import get_token_user
 
 def create_draft(raw):
     Draft.objects.filter(code=raw['code'], country_id=raw['country_id'], user_id=raw['user_id']).delete()  # If exists (a previous draft), delete it.
@@ -40,16 +40,20 @@ def create_form(raw):
                                finalized    = raw['finalized'],
                                # unique_id  = raw['unique_id'], # only KoBo form provided
                                )
-    form.save()
     return form
 
-def create_form_data(raw, form):
-    form_data = FormData.objects.create(form= form,
-                            question_id     = raw['id'],
-                            selected_option = raw['op'],
-                            notes           = raw['nt'],
-                            )
-    form_data.save()
+def bulk_create_form_data(raw, form):
+    # Answers are keyed on (form_id, question_id), the last one sent for a question wins
+    form_data = {}
+    for rubr in raw:
+        form_data[rubr['id']] = FormData(form=form,
+                                         question_id     = rubr['id'],
+                                         selected_option = rubr['op'],
+                                         notes           = rubr['nt'],
+                                         )
+    form_data = FormData.objects.bulk_create(form_data.values())
+    # No post_save for the bulk writes
+    clear_per_dashboard_cache()
     return form_data
 
 class FormSent(PublicJsonPostView):
@@ -101,23 +105,16 @@ class FormSent(PublicJsonPostView):
         if ' ' in body['code']:
             return bad_request('Code can not contain spaces, please choose a different one.')
 
+        # Form and answers are stored together or not at all
+        error_message = 'Could not insert PER form record.'
         try:
-            form = create_form(body)
-        except:
-            return bad_request('Could not insert PER form record.')
-
-        if hasattr(form,'status_code') and form.status_code == 400:
-            return bad_request('Could not insert PER form record due to inner failure.')
-
-        if 'data' in body:
-            for rubr in body['data']:
-                try:
-                    form_data = create_form_data(rubr, form)
-                except:
-                    return bad_request('Could not insert PER formdata record.')
-
-                if hasattr(form_data,'status_code') and form_data.status_code == 400:
-                    return bad_request('Could not insert PER form data record due to inner failure.')
+            with transaction.atomic():
+                form = create_form(body)
+                error_message = 'Could not insert PER formdata record.'
+                if 'data' in body:
+                    bulk_create_form_data(body['data'], form)
+        except Exception:
+            return bad_request(error_message)
 
         return JsonResponse({'status': 'ok'})
 
@@ -149,35 +146,37 @@ def change_form(raw):
 
     return form
 
-def change_form_data(raw, form):
-    if 'form_id' not in raw:
-        return bad_request('Form_id sending is mandatory')
-    if 'id' not in raw:
-        return bad_request('Question_id sending is mandatory')
-    form_data = FormData.objects.filter(form_id=raw['form_id'], question_id=raw['id'])[0]  # If exists data item, get the first. We keep only 1 answer per question_id
-    if not form_data:
-        return bad_request('Could not find PER form data record.')
-
-    #form_data.question_id     = raw['id'] # we do not change it
-    form_data.selected_option = raw['op'] if 'op' in raw else form_data.selected_option
-    form_data.notes           = raw['nt'] if 'nt' in raw else form_data.notes
-
-    form_data.save()
-    return form_data
+def bulk_update_form_data(raw, form):
+    question_ids = set(rubr['id'] for rubr in raw)
+    form_data = {}
+    # We keep only 1 answer per question_id, the first one stored
+    for item in FormData.objects.filter(form=form, question_id__in=question_ids).order_by('-pk'):
+        form_data[item.question_id] = item
+    missing_question_ids = question_ids - set(form_data.keys())
+    if missing_question_ids:
+        raise FormData.DoesNotExist('Could not find PER form data record for %s' % ', '.join(sorted(missing_question_ids)))
+
+    for rubr in raw:
+        item = form_data[rubr['id']]
+        #item.question_id   = rubr['id'] # we do not change it
+        item.selected_option = rubr['op'] if 'op' in rubr else item.selected_option
+        item.notes           = rubr['nt'] if 'nt' in rubr else item.notes
+    FormData.objects.bulk_update(form_data.values(), ['selected_option', 'notes'])
+    # No post_save for the bulk writes
+    clear_per_dashboard_cache()
+    return list(form_data.values())
 
 class FormEdit(PublicJsonPostView):
     def handle_post(self, request, *args, **kwargs):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            u = get_token_user(richtokenstring[6:])
+            if u is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
         else:
             return bad_request('User token is not given.')
-        if not u:
+        if not u.is_active:
             return bad_request('User is not logged in or inactive.')
 
         body = json.loads(request.body.decode('utf-8'))
@@ -196,24 +195,16 @@ class FormEdit(PublicJsonPostView):
         if len(missing_fields):
             return bad_request('Could not complete request. Please submit %s' % ', '.join(missing_fields))
 
+        # Form and answers are changed together or not at all
+        error_message = 'Could not change PER form record.'
         try:
-            form = change_form(body)
-        except:
-            return bad_request('Could not change PER form record.')
-
-        if hasattr(form,'status_code') and form.status_code == 400:
-            return bad_request('Could not change PER form record due to inner failure.')
-
-        if 'data' in body:
-            for rubr in body['data']:
-                rubr['form_id'] = body['id']
-                try:
-                    form_data = change_form_data(rubr, form)
-                except:
-                    return bad_request('Could not change PER formdata record.')
-
-                if hasattr(form_data,'status_code') and form_data.status_code == 400:
-                    return bad_request('Could not change PER form data record due to inner failure.')
+            with transaction.atomic():
+                form = change_form(body)
+                error_message = 'Could not change PER formdata record.'
+                if 'data' in body:
+                    bulk_update_form_data(body['data'], form)
+        except Exception:
+            return bad_request(error_message)
 
         return JsonResponse({'status': 'ok'})
 
@@ -223,14 +214,12 @@ class DraftSent(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            u = get_token_user(richtokenstring[6:])
+            if u is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
         else:
             return bad_request('User token is not given.')
-        if not u:
+        if not u.is_active:
             return bad_request('User is not logged in or inactive.')
 
         body = json.loads(request.body.decode('utf-8'))
@@ -279,14 +268,12 @@ class WorkPlanSent(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            u = get_token_user(richtokenstring[6:])
+            if u is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
         else:
             return bad_request('User token is not given.')
-        if not u:
+        if not u.is_active:
             return bad_request('User is not logged in or inactive.')
 
         body = json.loads(request.body.decode('utf-8'))
@@ -339,14 +326,12 @@ class OverviewSent(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            u = get_token_user(richtokenstring[6:])
+            if u is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
         else:
             return bad_request('User token is not given.')
-        if not u:
+        if not u.is_active:
             return bad_request('User is not logged in or inactive.')
 
         body = json.loads(request.body.decode('utf-8'))
@@ -375,15 +360,13 @@ class DelWorkPlan(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            u = get_token_user(richtokenstring[6:])
+            if u is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
             #origtoken = Token.objects.get_or_create(user=u)
         else:
             return bad_request('User token is not given.')
-        if not u: # or receivedtoken.key != origtoken:
+        if not u.is_active: # or receivedtoken.key != origtoken:
             return bad_request('User is not logged in or inactive.')
 
         # Did not work any of these...
@@ -410,14 +393,12 @@ class DelOverview(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            u = get_token_user(richtokenstring[6:])
+            if u is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
         else:
             return bad_request('User token is not given.')
-        if not u:
+        if not u.is_active:
             return bad_request('User is not logged in or inactive.')
 
         body = json.loads(request.body.decode('utf-8'))
@@ -439,14 +420,12 @@ class DelDraft(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            u = get_token_user(richtokenstring[6:])
+            if u is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
         else:
             return bad_request('User token is not given.')
-        if not u:
+        if not u.is_active:
             return bad_request('User is not logged in or inactive.')
         
         body = json.loads(request.body.decode('utf-8'))